@@ -0,0 +1,593 @@
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import RLock, Thread
+from time import sleep, time
+from urllib.parse import parse_qsl, urlsplit
+from uuid import uuid4
+
+from nailgun import entities
+from nailgun.config import ServerConfig
+from nailgun.entity_fields import (DictField, ListField, OneToManyField,
+                                   OneToOneField)
+
+# Collection -> nailgun entity (and its required init arguments) used to
+# generate the default attributes returned for every record. nailgun's read()
+# expects all the fields of an entity to be present in the json.
+COLLECTIONS = {
+  "organizations": ("Organization", {}),
+  "environments": ("LifecycleEnvironment", {}),
+  "products": ("Product", {}),
+  "repository_sets": ("RepositorySet", {"product": 1}),
+  "repositories": ("Repository", {}),
+  "content_views": ("ContentView", {}),
+  "content_view_versions": ("ContentViewVersion", {}),
+  "content_view_filters": ("RPMContentViewFilter", {}),
+  "rules": ("ContentViewFilterRule", {"content_view_filter": 1}),
+  "activation_keys": ("ActivationKey", {}),
+  "subscriptions": ("Subscription", {}),
+  "sync_plans": ("SyncPlan", {"organization": 1}),
+  "tasks": ("ForemanTask", {}),
+  "settings": ("Setting", {}),
+}
+# Nested routes, ie: /organizations/1/subscriptions
+PARENTS = {
+  "organizations": "organization_id",
+  "products": "product_id",
+  "content_views": "content_view_id",
+  "content_view_filters": "content_view_filter_id",
+}
+ALIASES = {"filters": "content_view_filters"}
+# Query parameters used to scope a listing, everything else is ignored
+FILTER_PARAMS = ["organization_id", "product_id", "content_view_id",
+                 "content_view_filter_id", "content_view_version_id",
+                 "environment_id", "type", "content_type", "name", "label"]
+API_PREFIX = re.compile(r"^/(?:katello/api/v2|foreman_tasks/api|api/v2|api)/")
+# Tokens of a scoped search: lists, quoted values, operators, words
+SEARCH_TOKEN = re.compile(r'\s*(?:(!?\^)\s*\(([^)]*)\)|"([^"]*)"'
+                          r'|(!=|!~|<=|>=|=|~|<|>|\(|\))|([^\s()"=~^<>!]+\??))')
+
+
+def now():
+  return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def entity_template(entity_name, kwargs):
+  """Returns the attributes nailgun expects for an entity, with empty values.
+  Relations are returned as ids: `<field>_id` and `<field>_ids`.
+  """
+  entity = getattr(entities, entity_name)(ServerConfig(url="http://fake"),
+                                          **kwargs)
+  template = {"created_at": None, "updated_at": None}
+  for name, field in entity.get_fields().items():
+    if isinstance(field, OneToOneField):
+      template[f"{name}_id"] = None
+    elif isinstance(field, OneToManyField):
+      template[f"{name}_ids"] = []
+    elif isinstance(field, ListField):
+      template[name] = []
+    elif isinstance(field, DictField):
+      template[name] = {}
+    else:
+      template[name] = None
+  return template
+
+
+class Server(ThreadingHTTPServer):
+  # Clients open their whole connection pool at once, the default backlog of
+  # 5 makes the extra connections wait for a SYN retransmit
+  request_queue_size = 128
+  daemon_threads = True
+
+
+class FakeSatellite(object):
+  """In-memory Katello/Foreman API, good enough to run forge against.
+
+  Every request is delayed by `latency` seconds and counted by endpoint.
+  Publish and promote return foreman tasks that are stopped `task_time`
+  seconds after they're created.
+  """
+  def __init__(self, port=0, latency=0, task_time=1):
+    """Class initialization
+
+    :param port: TCP port to listen on, defaults to a random port
+    :type port: int, optional
+    :param latency: Delay added to every request, in seconds, defaults to 0
+    :type latency: float, optional
+    :param task_time: Duration of the foreman tasks, in seconds, defaults to 1
+    :type task_time: float, optional
+    """
+    self.latency = latency
+    self.task_time = task_time
+    self.templates = {c: entity_template(*e) for c, e in COLLECTIONS.items()}
+    self.records = {c: {} for c in COLLECTIONS}
+    self.stats = Counter()
+    self._ids = Counter()
+    self._lock = RLock()
+    self.library = None
+    self.server = Server(("127.0.0.1", port), self._handler())
+    self.port = self.server.server_address[1]
+    self.url = f"http://127.0.0.1:{self.port}"
+
+  def start(self):
+    Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def reset_stats(self):
+    with self._lock:
+      stats = self.stats
+      self.stats = Counter()
+    return stats
+
+  def _handler(self):
+    satellite = self
+
+    class Handler(BaseHTTPRequestHandler):
+      # Keep-alive, so the client connection pool behaves like on a satellite
+      protocol_version = "HTTP/1.1"
+      # Headers and body are sent separately, don't wait for delayed ACKs
+      disable_nagle_algorithm = True
+
+      def _dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, payload = satellite.handle(self.command, self.path, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+  def handle(self, method, path, body):
+    """Routes a request to the matching collection or action
+
+    :return: HTTP status and json payload
+    :rtype: tuple
+    """
+    url = urlsplit(path)
+    endpoint = re.sub(r"/([0-9]+|[0-9a-f\-]{36})(?=/|$)", "/:id", url.path)
+    with self._lock:
+      self.stats[f"{method} {endpoint}"] += 1
+    if self.latency:
+      sleep(self.latency)
+    params = dict(parse_qsl(url.query))
+    if body:
+      try:
+        params.update(json.loads(body))
+      except ValueError:
+        return 400, {"error": "Invalid json"}
+    route = API_PREFIX.sub("", url.path).strip("/").split("/")
+    scope = {}
+    # Nested collections are scoped by their parent id
+    if (len(route) >= 3 and route[0] in PARENTS
+        and ALIASES.get(route[2], route[2]) in COLLECTIONS
+        and not hasattr(self, f"action_{route[0]}_{route[2]}")):
+      scope[PARENTS[route[0]]] = self.get_id(route[1])
+      route = route[2:]
+    collection = ALIASES.get(route[0], route[0])
+    if collection not in COLLECTIONS:
+      return 404, {"error": f"Unknown collection {route[0]}"}
+    with self._lock:
+      if len(route) == 1:
+        if method == "GET":
+          return 200, self.list(collection, params, scope)
+        if method == "POST":
+          return 200, self.render(collection,
+                                  self.create(collection, params, scope))
+        return 405, {"error": f"{method} not allowed on {url.path}"}
+      record = self.records[collection].get(self.get_id(route[1]))
+      if record is None:
+        return 404, {"error": f"{collection} {route[1]} not found"}
+      if len(route) == 2:
+        if method == "GET":
+          return 200, self.render(collection, record)
+        if method == "PUT":
+          return 200, self.render(collection,
+                                  self.update(collection, record, params))
+        if method == "DELETE":
+          if collection == "content_views" and record["environment_ids"]:
+            return 400, {"error": f"Content view {record['name']} is still "
+                                  "in environments"}
+          del self.records[collection][record["id"]]
+          return 200, {}
+      elif len(route) == 3:
+        action = getattr(self, f"action_{collection}_{route[2]}", None)
+        if action:
+          return action(record, params)
+    return 404, {"error": f"Unknown route {method} {url.path}"}
+
+  def get_id(self, value):
+    return int(value) if value.isdigit() else value
+
+  def next_id(self, collection):
+    self._ids[collection] += 1
+    return self._ids[collection]
+
+  def add(self, collection, **attrs):
+    """Stores a record, used to seed the satellite
+
+    :return: Stored record
+    :rtype: dict
+    """
+    with self._lock:
+      record = {"id": self.next_id(collection), "created_at": now(),
+                "updated_at": now(), **attrs}
+      self.records[collection][record["id"]] = record
+      return record
+
+  def create(self, collection, params, scope):
+    params = self.unwrap(params)
+    params.pop("per_page", None)
+    record = self.add(collection, **{**params, **scope})
+    if collection == "content_views":
+      record.setdefault("version_ids", [])
+      record.setdefault("environment_ids", [])
+    return record
+
+  def update(self, collection, record, params):
+    params = self.unwrap(params)
+    params.pop("per_page", None)
+    params.pop("id", None)
+    record.update(params)
+    record["updated_at"] = now()
+    return record
+
+  def unwrap(self, params):
+    # Some payloads are wrapped by entity name: {"organization": {...}}
+    if len(params) == 1:
+      value = list(params.values())[0]
+      if isinstance(value, dict):
+        return dict(value)
+    return dict(params)
+
+  def list(self, collection, params, scope):
+    scope = {**scope, **{k: params[k] for k in FILTER_PARAMS if k in params}}
+    search = self.parse_search(params.get("search") or "")
+    # The searches see the default attributes, like the rendered records
+    template = self.templates[collection]
+    records = [r for r in self.records[collection].values()
+               if all(str(r.get(k)) == str(v) for k, v in scope.items())
+               and search({**template, **r})]
+    if collection == "repository_sets" and params.get("enabled"):
+      records = [r for r in records if r.get("repositories_ids")]
+    per_page = int(params.get("per_page") or 20)
+    page = int(params.get("page") or 1)
+    results = records[(page - 1) * per_page:page * per_page]
+    return {"total": len(self.records[collection]), "subtotal": len(records),
+            "page": page, "per_page": per_page, "search": params.get("search"),
+            "results": [self.render(collection, r) for r in results]}
+
+  def parse_search(self, search):
+    """Compiles a scoped search (and, or, not, parenthesis and the =, !=, ~,
+    !~, ^, !^, <, >, <=, >=, null? and set? operators) into a predicate"""
+    tokens = []
+    for listed_op, listed, quoted, op, word in SEARCH_TOKEN.findall(search):
+      if listed_op:
+        tokens.append(("op", listed_op))
+        tokens.append(("list", [x.strip().strip('"')
+                                for x in listed.split(",")]))
+      elif op in ("(", ")"):
+        tokens.append((op, op))
+      elif op:
+        tokens.append(("op", op))
+      elif word.lower() in ("and", "or", "not", "null?", "set?"):
+        tokens.append((word.lower(), word))
+      else:
+        tokens.append(("value", quoted or word))
+    position = [0]
+
+    def peek():
+      return tokens[position[0]][0] if position[0] < len(tokens) else None
+
+    def take():
+      position[0] += 1
+      return tokens[position[0] - 1][1]
+
+    def expression():
+      terms = [term()]
+      while peek() == "or":
+        take()
+        terms.append(term())
+      return lambda r: any(t(r) for t in terms)
+
+    def term():
+      factors = [factor()]
+      # Like scoped_search, clauses next to each other are and'ed
+      while peek() not in (None, "or", ")"):
+        if peek() == "and":
+          take()
+        factors.append(factor())
+      return lambda r: all(f(r) for f in factors)
+
+    def factor():
+      kind = peek()
+      if kind == "not":
+        take()
+        negated = factor()
+        return lambda r: not negated(r)
+      if kind == "(":
+        take()
+        inner = expression()
+        take()
+        return inner
+      if kind in ("null?", "set?"):
+        take()
+        key = take()
+        return lambda r: (r.get(key) in (None, "", [])) == (kind == "null?")
+      key = take()
+      operator = take()
+      expected = take()
+      return lambda r: self.match(r, key, operator, expected)
+
+    return expression() if len(tokens) else (lambda r: True)
+
+  def match(self, record, key, operator, expected):
+    if key not in record:
+      return False
+    value = record[key]
+    if isinstance(value, bool) or value is None:
+      value = "true" if value else "false"
+    value = str(value)
+    if operator in ("^", "!^"):
+      return (value in expected) == (operator == "^")
+    if operator in ("<", ">", "<=", ">="):
+      try:
+        value, expected = float(value), float(expected)
+      except ValueError:
+        pass
+      return {"<": value < expected, ">": value > expected,
+              "<=": value <= expected, ">=": value >= expected}[operator]
+    if operator == "=":
+      return value == expected
+    if operator == "!=":
+      return value != expected
+    if operator == "~":
+      return expected.lower() in value.lower()
+    return expected.lower() not in value.lower()
+
+  def render(self, collection, record):
+    """Returns the json of a record, as the satellite would"""
+    attrs = {**self.templates[collection], **record}
+    render = getattr(self, f"render_{collection}", None)
+    if render:
+      render(attrs)
+    return {k: v for k, v in attrs.items() if not k.startswith("_")}
+
+  def render_content_views(self, attrs):
+    versions = [self.records["content_view_versions"][i]
+                for i in attrs["version_ids"]]
+    attrs["versions"] = [{"id": v["id"], "version": v["version"],
+                          "environment_ids": v["environment_ids"]}
+                         for v in versions]
+    attrs["next_version"] = len(versions) + 1
+    attrs["environments"] = [{"id": e, "name": self.records["environments"]
+                              [e]["name"]} for e in attrs["environment_ids"]]
+    attrs["content_view_component_ids"] = []
+    if attrs["composite"]:
+      # Composites expose the repositories of their components
+      attrs["repository_ids"] = sorted({
+        repo for i in attrs["component_ids"]
+        for repo in self.records["content_view_versions"][i]["repository_ids"]})
+
+  def render_content_view_versions(self, attrs):
+    attrs["environments"] = [
+      {"id": e, "name": self.records["environments"][e]["name"],
+       "label": self.records["environments"][e]["label"], "host_count": 0,
+       "activation_key_count": sum(
+         1 for ak in self.records["activation_keys"].values()
+         if ak.get("environment_id") == e
+         and ak.get("content_view_id") == attrs["content_view_id"])}
+      for e in attrs["environment_ids"]]
+    attrs["package_count"] = 0
+
+  def render_activation_keys(self, attrs):
+    attrs["content_overrides"] = attrs.get("_content_overrides", [])
+
+  def render_subscriptions(self, attrs):
+    attrs["activation_keys"] = [
+      {"id": ak["id"], "name": ak["name"]}
+      for ak in self.records["activation_keys"].values()
+      if any(s["id"] == attrs["id"] for s in ak.get("_subscriptions", []))]
+
+  def render_tasks(self, attrs):
+    elapsed = time() - attrs["_started"]
+    if elapsed >= attrs["_duration"]:
+      ended = datetime.utcfromtimestamp(attrs["_started"] + attrs["_duration"])
+      attrs.update({"state": "stopped", "result": "success", "progress": 1.0,
+                    "pending": False,
+                    "ended_at": ended.strftime("%Y-%m-%dT%H:%M:%SZ")})
+    else:
+      attrs.update({"state": "running", "result": "pending", "pending": True,
+                    "progress": round(elapsed / attrs["_duration"], 2)})
+
+  def task(self, label, duration=None, started=None):
+    """Creates a foreman task
+
+    :param label: Task label (ex: Actions::Katello::ContentView::Publish)
+    :type label: str
+    :param duration: Time before the task is stopped, defaults to task_time
+    :type duration: float, optional
+    :param started: Start timestamp, defaults to now
+    :type started: float, optional
+    :return: Task record
+    :rtype: dict
+    """
+    if duration is None:
+      duration = self.task_time
+    if started is None:
+      started = time()
+    record = {"id": str(uuid4()), "label": label, "username": "admin",
+              "humanized": {"action": label, "errors": []},
+              "started_at": datetime.utcfromtimestamp(started)
+                                    .strftime("%Y-%m-%dT%H:%M:%SZ"),
+              "_started": started, "_duration": duration}
+    with self._lock:
+      self.records["tasks"][record["id"]] = record
+    return record
+
+  def action_content_views_publish(self, cv, params):
+    version = self.add("content_view_versions", content_view_id=cv["id"],
+                       version=f"{len(cv['version_ids']) + 1}.0",
+                       major=len(cv["version_ids"]) + 1, minor=0,
+                       environment_ids=[self.library["id"]],
+                       repository_ids=list(cv.get("repository_ids", [])),
+                       description=params.get("description"))
+    cv["version_ids"].append(version["id"])
+    if self.library["id"] not in cv["environment_ids"]:
+      cv["environment_ids"].append(self.library["id"])
+    cv["last_published"] = now()
+    cv["updated_at"] = now()
+    return 202, self.render("tasks",
+                            self.task("Actions::Katello::ContentView::Publish"))
+
+  def action_content_view_versions_promote(self, version, params):
+    cv = self.records["content_views"][version["content_view_id"]]
+    for env_id in params.get("environment_ids", []):
+      for record in (version, cv):
+        if env_id not in record["environment_ids"]:
+          record["environment_ids"].append(env_id)
+    return 202, self.render("tasks",
+                            self.task("Actions::Katello::ContentView::Promote"))
+
+  def action_content_views_remove(self, cv, params):
+    env_ids = [int(e) for e in params.get("environment_ids", [])]
+    version_ids = [int(v) for v in params.get("content_view_version_ids", [])]
+    # Like katello, the activation keys have to be reassigned first and the
+    # versions used by a composite can't be deleted
+    if any(ak.get("content_view_id") == cv["id"]
+           and ak.get("environment_id") in env_ids
+           for ak in self.records["activation_keys"].values()):
+      return 400, {"error": "Activation keys still use the content view"}
+    if any(v in ccv.get("component_ids", [])
+           for ccv in self.records["content_views"].values()
+           for v in version_ids):
+      return 400, {"error": "Versions are used by a composite content view"}
+    for version_id in cv["version_ids"]:
+      version = self.records["content_view_versions"][version_id]
+      version["environment_ids"] = [e for e in version["environment_ids"]
+                                    if e not in env_ids]
+    if any(self.records["content_view_versions"][v]["environment_ids"]
+           for v in version_ids):
+      return 400, {"error": "Versions are still in environments"}
+    for version_id in version_ids:
+      del self.records["content_view_versions"][version_id]
+    cv["version_ids"] = [v for v in cv["version_ids"] if v not in version_ids]
+    cv["environment_ids"] = [e for e in cv["environment_ids"]
+                             if e not in env_ids]
+    return 202, self.render("tasks",
+                            self.task("Actions::Katello::ContentView::Remove"))
+
+  def action_activation_keys_subscriptions(self, ak, params):
+    return 200, {"results": ak.setdefault("_subscriptions", [])}
+
+  def action_activation_keys_add_subscriptions(self, ak, params):
+    # Either a single subscription_id or a list of subscriptions
+    subscriptions = params.get("subscriptions") or [
+      {"id": params["subscription_id"]}]
+    for subscription in subscriptions:
+      sub = self.records["subscriptions"][int(subscription["id"])]
+      ak.setdefault("_subscriptions", []).append({
+        "id": sub["id"], "subscription_id": sub["subscription_id"],
+        "name": sub["name"], "quantity": subscription.get("quantity", 1)})
+    return 200, {"results": ak["_subscriptions"]}
+
+  def action_activation_keys_content_override(self, ak, params):
+    # The enabled overrides are returned as booleans
+    ak["_content_overrides"] = [
+      {**o, "value": {"1": True, "0": False}.get(str(o.get("value")),
+                                                 o.get("value"))}
+      for o in params.get("content_overrides", [])]
+    return 200, self.render("activation_keys", ak)
+
+  def seed(self, cfg, releases):
+    """Populates the satellite with the organization, lifecycle environments,
+    products, repository sets, repositories and subscriptions required by the
+    releases, as if `make init`, `make repo-sets` and `make container-repos`
+    were already executed.
+
+    :param cfg: Configuration object
+    :type cfg: forge.config
+    :param releases: Releases generated by read_releases
+    :type releases: dict
+    """
+    org_name = cfg.satellite["default_org"]
+    org = self.add("organizations", name=org_name, label=org_name,
+                   title=org_name)
+    self.library = self.add("environments", name="Library", label="Library",
+                            organization_id=org["id"], library=True)
+    org["library_id"] = self.library["id"]
+    envs = {"Library": self.library}
+    for section in cfg.config:
+      if section.startswith("environments"):
+        conf = cfg.config[section]
+        envs[conf["name"]] = self.add(
+          "environments", name=conf["name"], label=section.split("-", 1)[1],
+          organization_id=org["id"], prior_id=envs[conf["prior"]]["id"])
+    # The last sync of every repository happened an hour ago
+    last_sync = time() - 3600
+    products = {}
+    for release, r in releases.items():
+      for label in r["labels"].split(","):
+        if label in products:
+          continue
+        product = self.add("products", name=f"Product {label}", label=label,
+                           organization_id=org["id"])
+        sync = self.task("Actions::Katello::Repository::Sync", 60, last_sync)
+        repo = self.add("repositories", name=label, label=label,
+                        content_type="yum", product_id=product["id"],
+                        product_name=product["name"],
+                        organization_id=org["id"], last_sync_id=sync["id"],
+                        full_path=f"{cfg.satellite['host']}/pulp/{label}")
+        self.add("repository_sets", name=label, label=label,
+                 product_id=product["id"], organization_id=org["id"],
+                 repositories_ids=[repo["id"]])
+        products[label] = product
+      sub = self.add("subscriptions", name=f"Red Hat OpenStack {release}",
+                     organization_id=org["id"], quantity=10,
+                     provided_product_ids=[products[x]["id"] for x
+                                           in r["labels"].split(",")])
+      sub["subscription_id"] = sub["id"]
+      if not r["container"]:
+        continue
+      name = f"{release} containers"
+      product = self.add("products", name=name,
+                         label=re.sub(r"[\s]+|\.", "_", name),
+                         organization_id=org["id"])
+      for container in r.get("containers", []):
+        container_name = container.replace("openstack-", "")
+        repo_name = f"{org_name}-{product['label']}-{container_name}".lower()
+        sync = self.task("Actions::Katello::Repository::Sync", 60, last_sync)
+        self.add("repositories", name=container_name, label=container_name,
+                 content_type="docker", product_id=product["id"],
+                 product_name=name, organization_id=org["id"],
+                 docker_upstream_name=container, last_sync_id=sync["id"],
+                 container_repository_name=repo_name,
+                 full_path=f"{cfg.satellite['host']}/{repo_name}")
+
+  def summary(self, stats=None, top=None):
+    """Returns the request count by endpoint, most hit first
+
+    :param stats: Counter to summarize, defaults to the current one
+    :type stats: collections.Counter, optional
+    :param top: Number of endpoints to return, defaults to all of them
+    :type top: int, optional
+    :return: List of (endpoint, count)
+    :rtype: list
+    """
+    if stats is None:
+      stats = self.stats
+    return stats.most_common(top)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3.8
+import configparser
+import contextlib
+import io
+import json
+import os
+import sys
+from logging import DEBUG, ERROR, Handler
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+import click
+import logzero
+from prettytable import PrettyTable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_satellite import FakeSatellite  # noqa: E402
+from forge.actions.base import Base  # noqa: E402
+from forge.config import Config, load_module  # noqa: E402
+"""
+Times forge end to end against a local fake Katello/Foreman API.
+The fake satellite is seeded from sat.cfg, limited to the first N releases,
+M z-streams and K container repositories.
+
+# Running the default benchmark
+benchmarks/run.py
+# 2 releases, 3 z-streams, 20 containers, 100ms per request, 4 publish jobs
+benchmarks/run.py -r 2 -z 3 -k 20 -l 0.1 -j 4
+"""
+
+phases = ["content-views", "activation-keys", "container-prepare", "check-sync"]
+
+
+class ErrorCounter(Handler):
+  """Counts the errors logged by forge, failed jobs don't raise"""
+  def __init__(self):
+    super().__init__(level=ERROR)
+    self.count = 0
+
+  def emit(self, record):
+    self.count += 1
+
+
+def derive_config(config_file, target, port, releases, zstreams, containers,
+                  jobs):
+  """Writes a copy of the configuration pointing to the fake satellite and
+  limited to the first releases, z-streams and containers.
+
+  :return: Path of the new configuration
+  :rtype: str
+  """
+  config = configparser.ConfigParser(interpolation=None)
+  config.read(config_file)
+  server = next(config[s] for s in config.sections()
+                if s.startswith("servers") and config[s].getboolean("default"))
+  default_org = server["default_org"]
+  default_location = server["default_location"]
+  kept = [s.split("-", 1)[1] for s in config.sections()
+          if s.startswith("cvs-")][:releases]
+  for section in config.sections():
+    if section.startswith("servers"):
+      config.remove_section(section)
+      continue
+    if not section.startswith(("cvs-", "zdates-", "containertags-")):
+      continue
+    release = section.split("-")[1]
+    if release not in kept:
+      config.remove_section(section)
+  for release in kept:
+    tags = [s for s in config.sections()
+            if s.startswith(f"containertags-{release}-")][:zstreams]
+    zlist = [s.split("-", 2)[2].lower() for s in tags]
+    for section in config.sections():
+      if (section.startswith(f"containertags-{release}-")
+          and section not in tags):
+        config.remove_section(section)
+    for section in tags:
+      for container in list(config[section])[containers:]:
+        config.remove_option(section, container)
+    zdates = f"zdates-{release}"
+    if config.has_section(zdates):
+      znames = list(config[zdates])
+      if not len(zlist):
+        zlist = znames[:zstreams]
+      for zname in znames:
+        if zname not in zlist:
+          config.remove_option(zdates, zname)
+  config["servers-bench"] = {
+    "host": f"127.0.0.1:{port}", "name": "bench", "username": "admin",
+    "password": "changeme", "default_org": default_org,
+    "default_location": default_location, "default": "true",
+    "publish_jobs": str(jobs), "async_sync": "False"}
+  config["cache"] = {"enabled": "False"}
+  with open(target, "w") as f:
+    config.write(f)
+  return target
+
+
+def run_phase(name, cfg, output_dir):
+  if name == "content-views":
+    load_module("make", "contentviews")(cfg)
+  elif name == "activation-keys":
+    load_module("make", "activationkeys")(cfg)
+  elif name == "container-prepare":
+    load_module("make", "containerprepare")(cfg, output_dir=output_dir)
+  elif name == "check-sync":
+    load_module("check", "sync")(cfg)
+
+
+@click.command(help="Times forge against a fake satellite. Exits with 1 when "
+                    "a phase raised, logged errors or sent no request")
+@click.option("-c", "--config-file", default=os.path.join(ROOT, "sat.cfg"),
+              show_default=True, help="Configuration file used as seed")
+@click.option("-r", "--releases", default=1, show_default=True,
+              help="Number of releases")
+@click.option("-z", "--zstreams", default=2, show_default=True,
+              help="Number of z-streams per release")
+@click.option("-k", "--containers", default=10, show_default=True,
+              help="Number of container repositories per release")
+@click.option("-l", "--latency", default=0.05, show_default=True,
+              help="Latency added to every request, in seconds")
+@click.option("-t", "--task-time", default=1.0, show_default=True,
+              help="Duration of the publish and promote tasks, in seconds")
+@click.option("-j", "--jobs", default=1, show_default=True,
+              help="publish_jobs of the benchmarked satellite")
+@click.option("-e", "--engine", type=click.Choice(["sync", "async"]),
+              default="sync", show_default=True,
+              help="Engine used by the read-heavy commands")
+@click.option("-p", "--phase", "only", multiple=True,
+              type=click.Choice(phases), help="Only run these phases")
+@click.option("--top", default=5, show_default=True,
+              help="Number of endpoints reported per phase")
+@click.option("-o", "--output", help="Also write the results as json")
+@click.option("-v", "--verbose", is_flag=True,
+              help="Show forge logs and output.")
+def main(config_file, releases, zstreams, containers, latency, task_time, jobs,
+         engine, only, top, output, verbose):
+  logzero.loglevel(DEBUG if verbose else ERROR)
+  errors = ErrorCounter()
+  logzero.logger.addHandler(errors)
+  # forge loads its actions relatively to the repository root
+  os.chdir(ROOT)
+  workdir = mkdtemp(prefix="forge-bench")
+  satellite = FakeSatellite(latency=latency, task_time=task_time).start()
+  results = []
+  try:
+    cfg = Config(derive_config(config_file, os.path.join(workdir, "bench.cfg"),
+                               satellite.port, releases, zstreams, containers,
+                               jobs))
+    cfg.read_config()
+    cfg.server_config.url = satellite.url
+    cfg.set_engine(engine)
+    satellite.seed(cfg, Base(cfg).read_releases())
+    for name in phases:
+      if len(only) and name not in only:
+        continue
+      satellite.reset_stats()
+      errors.count = 0
+      error = None
+      output_buffer = io.StringIO()
+      start = perf_counter()
+      try:
+        with contextlib.ExitStack() as stack:
+          if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(output_buffer))
+          run_phase(name, cfg, workdir)
+      except (Exception, SystemExit) as err:
+        error = repr(err)
+      duration = perf_counter() - start
+      stats = satellite.reset_stats()
+      # The jobs log their errors instead of raising, and a phase that never
+      # reached the satellite would be timed as a very fast one
+      if not error and errors.count:
+        error = f"{errors.count} error(s) logged"
+      elif not error and not sum(stats.values()):
+        error = "No request sent to the satellite"
+      results.append({"phase": name, "seconds": round(duration, 3),
+                      "requests": sum(stats.values()),
+                      "logged_errors": errors.count, "error": error,
+                      "failed": error is not None,
+                      "endpoints": dict(stats.most_common())})
+  finally:
+    satellite.stop()
+    rmtree(workdir, ignore_errors=True)
+
+  print(f"{releases} release(s), {zstreams} z-stream(s), {containers} "
+        f"container(s), {latency}s latency, {task_time}s tasks, {jobs} job(s), "
+        f"{engine} engine")
+  x = PrettyTable()
+  x.field_names = ["Phase", "Wall-clock (s)", "Requests", "Requests/s",
+                   "Logged errors", "Error"]
+  x.align["Error"] = "l"
+  for result in results:
+    rate = result["requests"] / result["seconds"] if result["seconds"] else 0
+    x.add_row([result["phase"], f"{result['seconds']:.2f}", result["requests"],
+               f"{rate:.1f}", result["logged_errors"], result["error"] or ""])
+  print(x)
+  for result in results:
+    x = PrettyTable()
+    x.field_names = ["Endpoint", "Requests"]
+    x.align["Endpoint"] = "l"
+    for endpoint, count in list(result["endpoints"].items())[:top]:
+      x.add_row([endpoint, count])
+    print(f"Top endpoints for {result['phase']}")
+    print(x)
+  if output:
+    with open(output, "w") as f:
+      json.dump({"releases": releases, "zstreams": zstreams,
+                 "containers": containers, "latency": latency,
+                 "task_time": task_time, "jobs": jobs, "engine": engine,
+                 "phases": results}, f,
+                indent=2)
+  if any(result["failed"] for result in results):
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
+# vim: et sts=2 sw=2 ts=2
@@ -1,19 +1,18 @@
 import os
-import re
 import selectors
 import subprocess
-import sys
 import time
 from datetime import datetime as dt
-from logging import DEBUG, ERROR, INFO, WARN  # noqa: F401
+from logging import ERROR, INFO
+from threading import local
 
 from logzero import logger as log
 
-ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
-log_regex = (r"\[ (?P<level>INFO|WARN|ERROR|DEBUG) [\d]{4}-[\d]{1,2}-[\d]{1,2}"
-             r"[T\s][\d]{1,2}:[\d]{1,2}:[\d]{2} verbose\] (?P<line>.*)")
+from forge.logstream import ConsoleRateLimit, LogStream
 
-sat_log = re.compile(log_regex)
+
+class TaskFailedError(Exception):
+  """A command started by run() exited with a non-zero returncode"""
 
 
 class Base(object):
@@ -27,6 +26,12 @@ class Base(object):
 
   def __init__(self, cfg):
     self._cfg = cfg
+    # Command started by run(), per thread so independent tasks can run
+    # concurrently
+    self._task = local()
+    # Shared by the tasks, the rate applies to all the lines on the console
+    self._rate_limit = ConsoleRateLimit(
+      cfg.satellite.getint("console_lines_per_second", 20))
     self.set_defaults(["default", "default_org", "default_location"])
 
   def set_defaults(self, def_list):
@@ -62,104 +67,100 @@ class Base(object):
     return duration
 
   def read_releases(self, stack_releases=[], zreleases=[]):
-    """ Generates a releases dict based on config cvs, containertags and zdates
+    """Returns the releases of the configuration: cvs, containertags and
+    zdates sections, see forge.releases.Release
+
+    :param stack_releases: Releases kept, all of them if empty, defaults to []
+    :type stack_releases: list, optional
+    :param zreleases: Zreleases kept, all of them if empty, defaults to []
+    :type zreleases: list, optional
+    :return: Read-only release by name
+    :rtype: dict
     """
-    releases = {}
-    for section in self._cfg.config:
-      if "-" in section:
-        release = section.split("-")[1]
-      else:
-        continue
-      if section.startswith("cvs-"):
-        releases[release] = dict(self._cfg.config.items(section))
-        r = releases[release]
-        r["container"] = self._cfg.config[section].getboolean("container")
-      elif (section.startswith("zdates-") and (not len(stack_releases)
-            or release in stack_releases)):
-        r = releases[release]
-        if "zdates" not in r:
-            r["zdates"] = {"latest": "latest"}
-        for zstream, date in self._cfg.config[section].items():
-          if not len(zreleases) or zstream in zreleases:
-            r["zdates"][zstream] = date
-      elif section.startswith("containertags"):
-        r = releases[release]
-        zstream = section.split("-")[2]
-        if "containers" not in r:
-          r["containers"] = []
-        if "zstream" not in r:
-          r["zstream"] = {}
-        if (zstream not in r["zstream"]
-            and (not len(zreleases) or zstream in zreleases)):
-          r["zstream"][zstream] = {}
-        for container, tag in self._cfg.config[section].items():
-          if container not in r["containers"]:
-            r["containers"].append(container)
-          if not len(zreleases) or zstream in zreleases:
-            if container not in r["zstream"][zstream]:
-              r["zstream"][zstream][container] = tag
-            else:
-              log.warning(f"Duplicate container in section {section} for "
-                          f"container {container}: {tag} and "
-                          f"{r['zstream'][zstream][container]}. We're using "
-                          "the latter.")
-    if len(stack_releases):
-      releases = {k: v for k, v in releases.items() if k in stack_releases}
-    return releases
+    return self._cfg.get_releases().select(stack_releases, zreleases)
 
   def get_item_ids(self, items):
     """ Converts a lit of objects into a list of IDs"""
     return list(map(lambda x: x.id, items))
 
+  def wanted(self, task_name):
+    """Tells if a task should run, according to skip_tasks and only_tasks
+
+    :param task_name: Name of the task
+    :type task_name: str
+    :rtype: bool
+    """
+    return (task_name not in self.skip_tasks
+            and (not len(self.only_tasks) or task_name in self.only_tasks))
+
   def run(self, command, task_name):
-    if (task_name in self.skip_tasks
-        or (len(self.only_tasks)
-        and task_name not in self.only_tasks)):
-        return False
-    self.task_name = task_name
+    if not self.wanted(task_name):
+      return False
+    task = self._task
+    task.name = task_name
     log.info("Starting task %s" % task_name)
-    self.task_start = time.time()
-    self.task = subprocess.Popen(command,
-                                 stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE,
-                                 preexec_fn=os.setsid)
-    self.sel = selectors.DefaultSelector()
-    self.sel.register(self.task.stdout, selectors.EVENT_READ)
-    self.sel.register(self.task.stderr, selectors.EVENT_READ)
-    self.pgid = os.getpgid(self.task.pid)
-    log.debug("Task started with pid %s" % self.pgid)
+    task.start = time.time()
+    task.process = subprocess.Popen(command,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    preexec_fn=os.setsid)
+    task.sel = selectors.DefaultSelector()
+    task.sel.register(task.process.stdout, selectors.EVENT_READ)
+    task.sel.register(task.process.stderr, selectors.EVENT_READ)
+    log.debug("Task %s started with pid %s"
+              % (task_name, os.getpgid(task.process.pid)))
     return True
 
-  def _format_out(self, lines, level=None):
-    lines = ansi_escape.sub('', lines)
-    for line in lines.splitlines():
-      s = re.search(sat_log, line)
-      if s:
-        log_level = s.groupdict()["level"] if not level else level
-        line = s.groupdict()["line"]
-      else:
-        log_level = "INFO" if not level else level
-      log.log(globals()[log_level], line)
-
   def checkout(self, prompt=None):
-    while self.task.poll() is None:
-      for key, val in self.sel.select():
-        line = key.fileobj.read1().decode()
-        line = line.strip()
-        if key.fileobj is self.task.stdout:
-          self._format_out(line)
-        else:
-          self._format_out(line, "ERROR")
-        if prompt and prompt in line:
-          log.debug("Prompt in line, sending yes")
-          self.task.stdin.write("y\n".encode("utf-8"))
-          self.task.stdin.flush()
-    self.task_end = time.time()
-    self.task_duration = self.task_end - self.task_start
-    if self.task.returncode == 0:
-      log.info("Task completed succesfully in %.0f seconds" % self.task_duration)
+    """Logs the output of the task started by run() in this thread until it
+    exits. Every line goes to the log file, the console gets at most
+    `console_lines_per_second` of them. With a tee_output Tee set on the
+    action, the raw output is also appended to it.
+
+    :param prompt: Answers yes when the task prints this, defaults to None
+    :type prompt: str, optional
+    :raises TaskFailedError: When the task exits with a non-zero returncode
+    """
+    task = self._task
+    tee = getattr(self, "tee_output", None)
+    if tee:
+      tee.open()
+    streams = {task.process.stdout: LogStream(INFO, tee),
+               task.process.stderr: LogStream(ERROR, tee)}
+    self._rate_limit.attach()
+    try:
+      # Until both pipes are closed, so the last lines aren't lost
+      while len(task.sel.get_map()):
+        for key, val in task.sel.select():
+          data = key.fileobj.read1(65536)
+          stream = streams[key.fileobj]
+          if not data:
+            task.sel.unregister(key.fileobj)
+            stream.flush()
+            continue
+          stream.feed(data)
+          # Prompts usually don't end with a newline
+          if prompt and (prompt in data.decode(errors="replace")
+                         or prompt in stream.pending()):
+            log.debug("Prompt in line, sending yes")
+            stream.flush()
+            task.process.stdin.write("y\n".encode("utf-8"))
+            task.process.stdin.flush()
+      task.process.wait()
+    finally:
+      self._rate_limit.detach()
+      task.sel.close()
+      if tee:
+        tee.close()
+    log.debug(f"{task.name} printed "
+              f"{sum(s.lines for s in streams.values())} lines")
+    duration = time.time() - task.start
+    if task.process.returncode == 0:
+      log.info("Task %s completed succesfully in %.0f seconds"
+               % (task.name, duration))
     else:
-      log.error("Task failed with returncode %s in %.0f seconds"
-                % (self.task.returncode, self.task_duration))
-      sys.exit(-1)
+      log.error("Task %s failed with returncode %s in %.0f seconds"
+                % (task.name, task.process.returncode, duration))
+      raise TaskFailedError(f"{task.name} exited with returncode "
+                            f"{task.process.returncode}")
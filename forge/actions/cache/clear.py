@@ -0,0 +1,12 @@
+from logzero import logger as log
+
+from forge.actions.base import Base
+
+
+class Clear(Base):
+  """ Removes the on-disk metadata cache of the satellite
+  """
+  def __init__(self, cfg):
+    super().__init__(cfg)
+    log.info(f"Removing cached metadata from {self._cfg.cache.path}")
+    self._cfg.cache.clear()
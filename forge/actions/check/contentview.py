@@ -1,9 +1,13 @@
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps
 
 from prettytable import PrettyTable
 
 from forge.actions.base import Base
 from forge.entities.contentview import ContentViews as ContentViewEntity
+from forge.entities.contentviewversion import ContentViewVersions
 from forge.entities.activationkey import ActivationKeys
 from forge.entities.organization import Org
 from logzero import logger as log
@@ -11,48 +15,111 @@ from alive_progress import alive_bar
 
 
 class Contentview(Base):
-  def __init__(self, cfg, delete=False, match=None):
+  field_names = ["ID", "Label", "Version", "Repositories", "Last Published"]
+
+  def __init__(self, cfg, delete=False, match=None, output_format="table",
+               jobs=None):
     super().__init__(cfg)
+    if not jobs:
+      jobs = self._cfg.satellite.getint("publish_jobs", 1)
     self.org = Org(cfg, name=self._cfg.satellite["default_org"])
     cvs = ContentViewEntity(cfg, self.org)
-    search_string = {"per_page": 10000}
+    search_string = {}
     if match:
       search_string["operator"] = "like"
       search_string["name"] = match
     log.info(f"Search pattern: {search_string}")
-    items = cvs.search(cvs.item, **search_string)
-    items.sort(key=lambda x: x.composite, reverse=True)
+    items = cvs.search(cvs.item, records=True, **search_string)
+    items.sort(key=lambda x: bool(x.composite), reverse=True)
+    cvvs = ContentViewVersions(self._cfg)
+    ak = ActivationKeys(self._cfg, self.org)
+    # The versions of each CV are fetched with one search, `jobs` CVs at a
+    # time. map() keeps the order, rows come out as soon as they're ready.
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+      versions = executor.map(lambda c: cvvs.get_by_cv(c.id), items)
+      rows = (self.get_row(c, v, delete, cvvs, ak)
+              for c, v in zip(items, versions))
+      if output_format == "json":
+        self.print_json(rows)
+      elif output_format == "csv":
+        self.print_csv(rows)
+      else:
+        self.print_table(rows, len(items))
+
+  def get_row(self, c, versions, delete, cvvs, ak):
+    """Returns the report of a ContentView, optionally deleting it
+
+    :param c: ContentView record
+    :type c: forge.records.Record
+    :param versions: Versions json, see ContentViewVersions.get_by_cv()
+    :type versions: list
+    :param delete: Delete the CV, its versions and activation keys
+    :type delete: bool
+    :param cvvs: Forged ContentViewVersions, to delete the versions
+    :type cvvs: forge.entities.ContentViewVersions
+    :param ak: Forged ActivationKeys, to delete the activation keys
+    :type ak: forge.entities.ActivationKeys
+    :return: Values of the row, by field name
+    :rtype: dict
+    """
+    if delete:
+      log.info(f"Deleting activation keys for {c.name}")
+      for aks in ak.get_by_cv(c):
+        aks.delete()
+    row_versions = []
+    for vd in sorted(versions, key=lambda x: float(x["version"])):
+      # Only the versions in an environment are listed
+      if not len(vd["environments"]):
+        continue
+      row_versions.append({
+        "version": vd["version"], "updated": vd["updated_at"],
+        "package_count": vd["package_count"],
+        "environments": [{"name": x["name"], "host_count": x["host_count"],
+                          "activation_key_count": x["activation_key_count"]}
+                         for x in vd["environments"]]})
+      if delete:
+        for env in vd["environments"]:
+          log.info(f"Deleting from {env['name']}")
+          c.delete_from_environment(env["id"], synchronous=True)
+        cvvs.new_item(id=vd["id"]).delete()
+    if delete:
+      c.delete()
+    return {"ID": c.id, "Label": c.label, "Version": row_versions,
+            "Repositories": self.get_item_ids(c.repository or []),
+            "Last Published": c.last_published}
+
+  def print_table(self, rows, count):
     x = PrettyTable()
-    x.field_names = ["ID", "Label", "Version", "Repositories", "Last Published"]
+    x.field_names = self.field_names
     x.max_width["Version"] = 80
-    number_of_versions = sum([len(c.version) for c in items])
-    ak = ActivationKeys(self._cfg, self.org)
-    with alive_bar(number_of_versions,
-      title="Getting CV version information") as bar:
-      for c in items:
+    with alive_bar(count, title="Getting CV version information") as bar:
+      for row in rows:
         versions = []
-        if delete:
-          log.info(f"Deleting activation keys for {c.name}")
-          for aks in ak.get_by_cv(c):
-            aks.delete()
-        for version in c.version:
-          vd = version.read_json()
-          bar(f"Got {c.name} {vd['version']}")
-          if len(vd["environments"]):
-            versions.extend(list(map(lambda x: f"{x['name']} "
-                                               f"Host: {x['host_count']}, "
-                                               f"AK: {x['activation_key_count']}",
-                                     vd["environments"])))
-            versions.extend([f"version: {vd['version']}",
-                             f"updated: {vd['updated_at']}",
-                             f"package_count: {vd['package_count']}"])
-            if delete:
-              for env in vd["environments"]:
-                log.info(f"Deleting from {env['name']}")
-                c.delete_from_environment(env["id"], synchronous=True)
-              version.delete()
-        if delete:
-          c.delete()
-        x.add_row([c.id, c.label, dumps(versions, sort_keys=True, indent=2),
-                   self.get_item_ids(c.repository), c.last_published])
+        for v in row["Version"]:
+          versions.extend(f"{e['name']} Host: {e['host_count']}, "
+                          f"AK: {e['activation_key_count']}"
+                          for e in v["environments"])
+          versions.extend([f"version: {v['version']}",
+                           f"updated: {v['updated']}",
+                           f"package_count: {v['package_count']}"])
+        bar(f"Got {row['Label']}")
+        x.add_row([row["ID"], row["Label"],
+                   dumps(versions, sort_keys=True, indent=2),
+                   row["Repositories"], row["Last Published"]])
     print(x)
+
+  def print_json(self, rows):
+    # A json array, written one row at a time
+    sys.stdout.write("[")
+    for i, row in enumerate(rows):
+      sys.stdout.write(f"{',' if i else ''}\n  {dumps(row, sort_keys=True)}")
+      sys.stdout.flush()
+    sys.stdout.write("\n]\n")
+
+  def print_csv(self, rows):
+    writer = csv.DictWriter(sys.stdout, fieldnames=self.field_names)
+    writer.writeheader()
+    for row in rows:
+      writer.writerow({**row, "Version": dumps(row["Version"], sort_keys=True),
+                       "Repositories": dumps(row["Repositories"])})
+      sys.stdout.flush()
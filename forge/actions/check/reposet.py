@@ -1,5 +1,6 @@
 from prettytable import PrettyTable
 
+from forge import aio
 from forge.actions.base import Base
 from forge.entities.organization import Org
 from forge.entities.repository_set import RepositorySets
@@ -10,15 +11,19 @@ class Reposet(Base):
     super().__init__(cfg)
     self.org = Org(cfg, name=self._cfg.satellite["default_org"])
     self.repos = RepositorySets(cfg, self.org)
-    search_string = {"per_page": 10000}
+    search_string = {}
     if repo_type:
       search_string["content_type"] = repo_type
     if label:
       search_string["label"] = label
-    items = self.repos.search(**search_string)
     x = PrettyTable()
     x.field_names = ["Repo Label", "Name", "Product", "Repositories"]
-    for r in items:
+    if self._cfg.engine == "async":
+      reposets = aio.run(self._cfg, self.repos.asearch, None, records=True,
+                         **search_string)
+    else:
+      reposets = self.repos.search_iter(records=True, **search_string)
+    for r in reposets:
       if not enabled or len(r.repositories) > 0:
         x.add_row([r.label, r.name, r.product.id, r.repositories])
     print(x)
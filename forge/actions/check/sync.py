@@ -1,31 +1,140 @@
+import asyncio
+from datetime import datetime
+from time import sleep
+
+import click
 from prettytable import PrettyTable
 
+from forge import aio
 from forge.actions.base import Base
 from forge.entities.organization import Org
+from forge.entities.product import Products
 from forge.entities.repository import Repositories
+from forge.entities.task import Tasks
 
 
 class Sync(Base):
   """ Satellite product creation
   """
-  def __init__(self, cfg):
+  def __init__(self, cfg, watch=None):
     super().__init__(cfg)
     self.org = Org(cfg, name=self._cfg.satellite["default_org"])
     self.repos = Repositories(cfg, self.org)
-    self.repos.get_all()
+    self.products = Products(cfg, self.org)
+    self.tasks = Tasks(cfg)
+    # Products and tasks already read, by id. Many repositories share a
+    # product, and a stopped task won't change anymore.
+    self.product_memo = {}
+    self.task_memo = {}
+    rows = self.get_rows()
+    if not watch:
+      print(self.table(rows))
+      return
+    try:
+      while True:
+        previous = rows
+        rows = self.get_rows()
+        changed = [repo_id for repo_id, row in rows.items()
+                   if previous.get(repo_id) != row]
+        click.clear()
+        print(self.table(rows, changed))
+        print(f"Refreshed at {datetime.now():%H:%M:%S}, {len(changed)} rows "
+              f"changed. Refreshing every {watch}s, ctrl-c to exit.")
+        sleep(watch)
+    except KeyboardInterrupt:
+      pass
+
+  def table(self, rows, changed=[]):
+    """Formats the rows of the report
+
+    :param rows: Rows returned by get_rows()
+    :type rows: dict
+    :param changed: Repository ids of the rows that changed since the last
+                    refresh, marked with a *, defaults to []
+    :type changed: list, optional
+    :return: The report
+    :rtype: prettytable.PrettyTable
+    """
     x = PrettyTable()
     x.field_names = ["Repo Label", "Product Label", "Sync State",
                      "Result", "Time", "Duration", "Task ID"]
-    for r in self.repos.items:
-      product = r.product.read()
-      task = r.last_sync.read()
-      if not task:
-        continue
-      duration = self.get_duration(task.started_at, task.ended_at)
-      fields = [r.label, product.label, task.state, task.result, task.started_at,
-                duration, task.id]
+    for repo_id, fields in rows.items():
+      result = fields[3]
       row = []
       for field in fields:
-        row.append(self.color_by_name(task.result, field))
+        row.append(self.color_by_name(result, field))
+      if repo_id in changed:
+        row[0] = f"* {row[0]}"
       x.add_row(row)
-    print(x)
+    return x
+
+  def get_rows(self):
+    """Reads the repositories, their product and their last sync task.
+    Products are searched once and memoized, and tasks are searched by
+    chunks of ids. Only the tasks that weren't stopped the last time are
+    searched again.
+
+    :return: Fields of each repository with a sync task, by repository id
+    :rtype: dict
+    """
+    if self._cfg.engine == "async":
+      repos = aio.run(self._cfg, self.async_resolve)
+    else:
+      repos = self.repos.search(records=True)
+      if not len(self.product_memo):
+        self.memoize_products(self.products.search(records=True))
+      self.memoize_tasks(self.tasks.get_by_ids(self.tasks_to_read(repos),
+                                               records=True))
+    rows = {}
+    for r in repos:
+      task = self.task_memo.get(getattr(r.last_sync, "id", None))
+      if not task:
+        continue
+      product = self.product_memo.get(r.product.id)
+      if not product:
+        product = self.product_memo[r.product.id] = r.product.read()
+      duration = self.get_duration(task.started_at, task.ended_at)
+      rows[r.id] = [r.label, product.label, task.state, task.result,
+                  task.started_at, duration, task.id]
+    return rows
+
+  async def async_resolve(self):
+    """Same as get_rows(), with the searches running concurrently
+
+    :return: Repository entities, with their product and tasks memoized
+    :rtype: list
+    """
+    if len(self.product_memo):
+      repos = await self.repos.asearch(records=True)
+    else:
+      repos, products = await asyncio.gather(
+        self.repos.asearch(records=True), self.products.asearch(records=True))
+      self.memoize_products(products)
+    self.memoize_tasks(await self.tasks.aget_by_ids(self.tasks_to_read(repos),
+                                                    records=True))
+    return repos
+
+  def tasks_to_read(self, repos):
+    """Returns the ids of the last sync tasks that need to be read: the ones
+    never read and the ones that weren't stopped
+
+    :param repos: Repository entities
+    :type repos: list
+    :return: Foreman task IDs
+    :rtype: set
+    """
+    task_ids = set()
+    for r in repos:
+      task_id = getattr(r.last_sync, "id", None)
+      if not task_id:
+        continue
+      task = self.task_memo.get(task_id)
+      if not task or task.state != "stopped":
+        task_ids.add(task_id)
+    return task_ids
+
+  def memoize_products(self, products):
+    self.product_memo.update({p.id: p for p in products})
+
+  def memoize_tasks(self, tasks):
+    self.task_memo.update(tasks)
@@ -5,7 +5,7 @@ import tempfile
 from logzero import logger as log
 from prettytable import PrettyTable
 
-from forge.actions.base import Base
+from forge.actions.base import Base, TaskFailedError
 from forge.entities.task import Tasks
 
 
@@ -57,7 +57,7 @@ reset_pulp_task('%FOREMAN_TASK_ID%')"""
     log.info(tmp.name)
     cmd = ["foreman-rake", tmp.name, "--trace"]
     if self.run(cmd, "reset-pulp-task"):
-      self.checkout()
+      self.checkout_or_exit()
 
   def delete_blocked_tasks(self, actions=['Promote', 'Publish'],
     states=['paused', 'pending]']):
@@ -79,7 +79,13 @@ reset_pulp_task('%FOREMAN_TASK_ID%')"""
         f"TASK_SEARCH='{task_search}'", f"STATES='{','.join(states)}''",
         "VERBOSE=true"]
       if self.run(cmd, "delete-blocked-task"):
-        self.checkout()
+        self.checkout_or_exit()
+
+  def checkout_or_exit(self):
+    try:
+      self.checkout()
+    except TaskFailedError:
+      sys.exit(-1)
 
   def get_incompletes(self):
     log.debug("Searching for incomplete tasks")
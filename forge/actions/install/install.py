@@ -10,6 +10,8 @@ import requests
 from requests.exceptions import HTTPError
 
 from forge.actions.base import Base
+from forge.logstream import Tee
+from forge.scheduler import Scheduler
 
 
 class Install(Base):
@@ -22,14 +24,13 @@ class Install(Base):
   - Uploading and refreshing a manifest
   - Installing the insights-client
   """
-  def __init__(self, cfg, skip_tasks = [], only_tasks = []):
+  def __init__(self, cfg, skip_tasks = [], only_tasks = [], tee_output=None):
     self.register_insights = False
     self.manifest = None
-    self.pgid = None
-    self.task = None
     super().__init__(cfg)
     self.skip_tasks = skip_tasks
     self.only_tasks = only_tasks
+    self.tee_output = Tee(tee_output) if tee_output else None
     self.set_defaults(["manifest", "register_insights", "host", "username",
                        "password"])
     if socket.gethostname() != self.host:
@@ -43,23 +44,35 @@ class Install(Base):
     self.env = os.environ.copy()
     self.env["PATH"] = ":".join(list(filter(lambda x: ".python" not in x,
                                             self.env["PATH"].split(":"))))
-    # We need to make sure our IP is in /etc/hosts because satellite does a reverse
-    # lookup on that IP.
     if len(self.skip_tasks):
       log.warning(f"Skipping these tasks: {skip_tasks}")
     if len(self.only_tasks):
       log.warning(f"Only these tasks: {only_tasks}")
-    self.check_host_file()
-    self.install_packages()
-    self.install_satellite()
-    self.set_hammer_defaults()
+    # Skipped tasks are completed without running anything, so the tasks
+    # depending on them still run.
+    graph = Scheduler(cfg, jobs=cfg.satellite.getint("install_jobs", 4))
+    # We need to make sure our IP is in /etc/hosts because satellite does a
+    # reverse lookup on that IP.
+    graph.add("check-host-file", self.check_host_file)
+    graph.add("pkg-install", self.install_packages, ["check-host-file"])
+    graph.add("satellite-install", self.install_satellite, ["pkg-install"])
+    graph.add("set-default-org", self.set_default_org, ["satellite-install"])
+    graph.add("set-default-loc", self.set_default_location,
+              ["satellite-install"])
     if self.manifest:
-      self.get_manifest()
-      self.upload_manifest()
-      self.refresh_manifest()
+      # The download doesn't need satellite, it runs with the installer
+      graph.add("manifest-download", self.get_manifest)
+      graph.add("manifest-upload", self.upload_manifest,
+                ["manifest-download", "satellite-install"])
+      graph.add("manifest-refresh", self.refresh_manifest, ["manifest-upload"])
     if self.register_insights:
-      self.install_insights_client()
-      self.register_insights_client()
+      graph.add("insights-client-install", self.install_insights_client,
+                ["satellite-install"])
+      graph.add("insights-client-register", self.register_insights_client,
+                ["insights-client-install"])
+    if len(graph.run()):
+      log.error("Satellite installation process failed")
+      sys.exit(-1)
     log.info("Satellite installation process completed")
 
   def test_sh(self):
@@ -108,14 +121,19 @@ class Install(Base):
     if self.run(cmd, "satellite-install"):
       self.checkout()
 
-  def set_hammer_defaults(self):
+  def set_default_org(self):
     """
-    Setting the defaults org and location for easier management later
+    Setting the default org for easier management later
     """
     if self.default_org and self.run(["hammer", "defaults", "add", "--param-name",
                                       "oraganization", "--param-value",
                                       self.default_org], "set-default-org"):
       self.checkout()
+
+  def set_default_location(self):
+    """
+    Setting the default location for easier management later
+    """
     if self.default_location and self.run(["hammer", "defaults", "add",
                                            "--param-name", "location",
                                            "--param-value", self.default_location],
@@ -124,8 +142,10 @@ class Install(Base):
 
   def get_manifest(self):
     """
-    Downloading the manifest
+    Downloading the manifest, only when it will be uploaded
     """
+    if not self.wanted("manifest-upload"):
+      return
     log.info("Downloading manifest file %s" % self.manifest)
     time_start = time.time()
     try:
@@ -133,22 +153,22 @@ class Install(Base):
       r.raise_for_status()
     except HTTPError as http_err:
       log.error(f'HTTP error occurred: {http_err}')
+      raise
     except Exception as err:
       log.error(f'Other error occurred: {err}')
-    else:
-      duration = time.time() - time_start
-      log.info("Downloaded succesfully in %.0f seconds" % duration)
-    if r.headers.get('content-type') == "application/zip":
-      self.manifest_file = "/tmp/%s" % self.manifest.split('/')[-3]
-      try:
-        os.remove(self.manifest_file)
-      except OSError:
-        pass
-      open(self.manifest_file, 'wb').write(r.content)
-    else:
-      log.error("Invalid manifest file %s - Type: %s - We're looking for a zip file"
-                "here." % (self.manifest, r.headers.get('content-type')))
-      sys.exit(-1)
+      raise
+    duration = time.time() - time_start
+    log.info("Downloaded succesfully in %.0f seconds" % duration)
+    if r.headers.get('content-type') != "application/zip":
+      raise ValueError("Invalid manifest file %s - Type: %s - We're looking for "
+                       "a zip file here." % (self.manifest,
+                                             r.headers.get('content-type')))
+    self.manifest_file = "/tmp/%s" % self.manifest.split('/')[-3]
+    try:
+      os.remove(self.manifest_file)
+    except OSError:
+      pass
+    open(self.manifest_file, 'wb').write(r.content)
 
   def upload_manifest(self):
     if self.run(["hammer", "subscription", "upload", "--file", self.manifest_file,
@@ -1,7 +1,10 @@
+import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from copy import deepcopy
 from datetime import datetime
+from hashlib import sha1
 from re import sub
 from tempfile import mkdtemp
 
@@ -10,6 +13,7 @@ from alive_progress import alive_bar
 from forge.actions.base import Base
 from forge.entities.contentview import ContentViews
 from forge.entities.organization import Org
+from forge.entities.repository import Repositories
 from logzero import logger as log
 
 
@@ -17,12 +21,23 @@ class Containerprepare(Base):
   """ Generating container prepare templates
   as per this article:
   https://access.redhat.com/solutions/5171441
+
+  A template is only generated again when the CCV version or the tags of its
+  z-stream changed, and only written when its content changed. The manifest
+  written next to the templates tells which ones changed during the run.
+  This requires the output directory of the previous run, a new temporary
+  directory is used otherwise. The registry credentials aren't part of the
+  fingerprints, a change of user or password alone requires force.
   """
+  manifest_name = "container-image-prepare.manifest.json"
+
   def __init__(self, cfg, releases=[], zreleases=[], output_dir=None, user=None,
-               password=None):
+               password=None, force=False):
     super().__init__(cfg)
     if not output_dir:
       output_dir = mkdtemp(prefix="container_prepare_templates")
+      log.info(f"Generating all the templates in {output_dir}, use the same "
+               "output directory to only generate the outdated ones")
     self.org = Org(cfg, name=self._cfg.satellite["default_org"])
     releases = self.read_releases(releases, zreleases)
     base = {'parameter_defaults': {'ContainerImagePrepare': []}}
@@ -36,96 +51,227 @@ class Containerprepare(Base):
       }
       base_param["ContainerImageRegistryLogin"] = True
     base_param["DockerInsecureRegistryAddress"] = registry_url
+    manifest_file = os.path.join(output_dir, self.manifest_name)
+    previous = self.read_manifest(manifest_file)
+    # The templates that aren't part of this run stay in the manifest
+    manifest = {name: {**entry, "changed": False}
+                for name, entry in previous.items()}
+    cvs = ContentViews(self._cfg, self.org)
+    cvs.get_all()
     for release, r in releases.items():
       if r["container"]:
-        cvs = ContentViews(self._cfg, self.org).get_by_releases(release,
-                                                                zreleases)
-        cvs = list(filter(lambda x: x.composite, cvs))
-        self._build_repo_cache(cvs)
-        log.info(f"Fetching all repo informations for content-views ({len(cvs)})")
+        outdated = []
         for z, containers in r["zstream"].items():
-          cv = list(filter(lambda x: x.name.endswith(f"{release}-{z}"), cvs))
-          if not len(cv):
+          cv = cvs.find_cv("CCV", r["tag"], release, z)
+          if not cv:
             log.error(f"Unable to find CV for {release}-{z}")
             continue
-          else:
-            cv = cv[0]
-            log.info(f"Checking repos in {cv.name}")
-          content = deepcopy(base)
-          clist = content["parameter_defaults"]["ContainerImagePrepare"]
           latest_tag = f"{release}{z}".replace("z", ".").replace("OSP", "")
           filename = f"container-image-prepare.{latest_tag}.yaml"
           template = os.path.join(output_dir, filename)
           if z == "latest":
             latest_tag = "latest"
-          excludes = []
-          # removing ceph
-          noceph_containers = self.filter_containers(containers, 'openstack-|rhel')
-          for container, tag in noceph_containers.items():
-            log.debug(f"Container {container} Tag: {tag}")
-            container_name = sub('^openstack-', '', container)
-            # We need to include/exclude with some kind of end-of-pattern string (:)
-            # because of this bug: https://bugzilla.redhat.com/show_bug.cgi?id=1853354
-            # Other wise, "heat-api" will also match "heat-api-cfn" for example.
-            excludes.append(f"{container_name}:")
-            repo = self.get_repo_by_name(cv, container_name)
-            if repo:
-              prefix = repo.container_repository_name.replace(container_name, "")
-              clist.append({
-                "includes": [f"{container_name}:"],
-                "push_destination": False,
-                "set": {
-                  "name_prefix": prefix,
-                  "name_suffix": '',
-                  "namespace": self.get_namespace(repo),
-                  "tag": tag
-                }
-              })
-          ceph_container = self.filter_containers(containers,
-                             r["container_ceph_prefix"])
-          log.info(ceph_container)
-          if len(ceph_container):
-            ceph_name = list(ceph_container.keys())[0]
-            ceph_tag = list(ceph_container.values())[0]
-            ceph = self.get_repo_by_name(cv, ceph_name)
-            ceph_image = ''
-            if ceph:
-              ceph_image = ceph.container_repository_name
-          else:
-            ceph_tag = ''
-            ceph_image = ''
-          namespace = self.get_namespace(repo)
-          clist.append({
-            "excludes": excludes,
-            "push_destination": False,
-            "set": {
-              "ceph_image": ceph_image,
-              "ceph_namespace": namespace,
-              "ceph_tag": ceph_tag,
-              "name_prefix": prefix,
-              "name_suffix": '',
-              "namespace": namespace,
-              "tag": latest_tag
-            }
-          })
-          now = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+          versions = sorted(v.id for v in cv.version or [])
+          latest = cvs.get_latest_version(cv)
+          entry = {
+            "release": release,
+            "zrelease": z,
+            "content_view": cv.name,
+            "content_view_version": latest.id if latest else None,
+            "inputs": self.fingerprint(self.without_credentials(base), cv.id,
+                                       versions, containers,
+                                       r["container_ceph_prefix"], latest_tag),
+            "changed": False,
+          }
+          old = previous.get(filename, {})
+          if (not force and old.get("inputs") == entry["inputs"]
+              and os.path.exists(template)):
+            log.info(f"{filename} is up to date")
+            manifest[filename] = {**old, **entry}
+            continue
+          outdated.append((z, containers, cv, template, latest_tag, entry))
+        if not len(outdated):
+          continue
+        # Only the repositories of the outdated templates are read
+        self._build_repo_cache(list({cv.id: cv for _, _, cv, _, _, _
+                                     in outdated}.values()))
+        log.info(f"Fetching all repo informations for content-views "
+                 f"({len(outdated)})")
+        for z, containers, cv, template, latest_tag, entry in outdated:
+          log.info(f"Checking repos in {cv.name}")
+          content = self.generate(deepcopy(base), r, cv, containers, latest_tag)
+          filename = os.path.basename(template)
+          entry["content"] = self.fingerprint(self.without_credentials(content))
+          old = previous.get(filename, {})
+          if (not force and old.get("content") == entry["content"]
+              and os.path.exists(template)):
+            log.info(f"{filename} didn't change")
+            manifest[filename] = {**old, **entry}
+            continue
+          now = datetime.now()
           with os.fdopen(os.open(template, os.O_CREAT | os.O_TRUNC | os.O_WRONLY,
                                  0o666), 'w') as f:
-            f.write(f"# File {filename} was prepared by forge for OSP {release}{z}")
-            f.write(f"# Generated on {now}")
-            f.write("# https://github.com/valleedelisle/forge")
+            f.write(f"# File {filename} was prepared by forge for OSP "
+                    f"{release}{z}\n")
+            f.write(f"# Generated on {now.strftime('%d/%m/%Y %H:%M:%S')}\n")
+            f.write("# https://github.com/valleedelisle/forge\n")
             yaml.dump(content, f, default_flow_style=False)
+          entry.update({"changed": True, "generated": now.isoformat()})
+          manifest[filename] = entry
           log.info(f"generated {filename}")
+    self.write_manifest(manifest_file, manifest)
+    changed = [name for name, entry in manifest.items() if entry["changed"]]
+    log.info(f"{len(changed)} templates changed, see {manifest_file}")
+
+  def generate(self, content, r, cv, containers, latest_tag):
+    """Fills the ContainerImagePrepare of a z-stream template
+
+    :param content: Base of the template
+    :type content: dict
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param cv: Composite ContentView of the z-stream
+    :type cv: nailgun.entity.ContentView
+    :param containers: Tag of each container of the z-stream, by name
+    :type containers: dict
+    :param latest_tag: Tag used for the containers not listed
+    :type latest_tag: str
+    :return: The template content
+    :rtype: dict
+    """
+    clist = content["parameter_defaults"]["ContainerImagePrepare"]
+    excludes = []
+    # removing ceph
+    noceph_containers = self.filter_containers(containers, 'openstack-|rhel')
+    for container, tag in noceph_containers.items():
+      log.debug(f"Container {container} Tag: {tag}")
+      container_name = sub('^openstack-', '', container)
+      # We need to include/exclude with some kind of end-of-pattern string (:)
+      # because of this bug: https://bugzilla.redhat.com/show_bug.cgi?id=1853354
+      # Other wise, "heat-api" will also match "heat-api-cfn" for example.
+      excludes.append(f"{container_name}:")
+      repo = self.get_repo_by_name(cv, container_name)
+      if repo:
+        prefix = repo.container_repository_name.replace(container_name, "")
+        clist.append({
+          "includes": [f"{container_name}:"],
+          "push_destination": False,
+          "set": {
+            "name_prefix": prefix,
+            "name_suffix": '',
+            "namespace": self.get_namespace(repo),
+            "tag": tag
+          }
+        })
+    ceph_container = self.filter_containers(containers,
+                       r["container_ceph_prefix"])
+    log.info(ceph_container)
+    if len(ceph_container):
+      ceph_name = list(ceph_container.keys())[0]
+      ceph_tag = list(ceph_container.values())[0]
+      ceph = self.get_repo_by_name(cv, ceph_name)
+      ceph_image = ''
+      if ceph:
+        ceph_image = ceph.container_repository_name
+    else:
+      ceph_tag = ''
+      ceph_image = ''
+    namespace = self.get_namespace(repo)
+    clist.append({
+      "excludes": excludes,
+      "push_destination": False,
+      "set": {
+        "ceph_image": ceph_image,
+        "ceph_namespace": namespace,
+        "ceph_tag": ceph_tag,
+        "name_prefix": prefix,
+        "name_suffix": '',
+        "namespace": namespace,
+        "tag": latest_tag
+      }
+    })
+    return content
+
+  def fingerprint(self, *inputs):
+    """Returns a fingerprint of the inputs or content of a template
+
+    :param inputs: json serializable values
+    :type inputs: list
+    :return: sha1 of the inputs
+    :rtype: str
+    """
+    return sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+  def without_credentials(self, content):
+    """Returns a copy of a template without the registry credentials, so
+    they're never written to the manifest, even hashed
+
+    :param content: Template, or its base
+    :type content: dict
+    :return: Copy of the template
+    :rtype: dict
+    """
+    content = deepcopy(content)
+    content["parameter_defaults"].pop("ContainerImageRegistryCredentials", None)
+    return content
+
+  def read_manifest(self, manifest_file):
+    """Reads the manifest of the previous run
+
+    :param manifest_file: Path of the manifest
+    :type manifest_file: str
+    :return: Entry of each template, by file name
+    :rtype: dict
+    """
+    try:
+      with open(manifest_file) as f:
+        return json.load(f)["templates"]
+    except FileNotFoundError:
+      return {}
+    except (ValueError, KeyError) as err:
+      log.warning(f"Ignoring invalid manifest {manifest_file}: {err}")
+      return {}
+
+  def write_manifest(self, manifest_file, templates):
+    """Writes the manifest. Each template has the CCV version and the
+    fingerprints it was generated from, and whether it changed during this run.
+
+    :param manifest_file: Path of the manifest
+    :type manifest_file: str
+    :param templates: Entry of each template, by file name
+    :type templates: dict
+    """
+    with open(manifest_file, "w") as f:
+      json.dump({"generated": datetime.now().isoformat(),
+                 "templates": templates}, f, indent=2, sort_keys=True)
 
   def _build_repo_cache(self, cvs):
+    """Reads the repositories of all the content-views on a bounded thread
+    pool. Repositories shared between content-views are only read once.
+
+    :param cvs: List of ContentView entities
+    :type cvs: list, nailgun.entity.ContentView
+    """
     self.repo_cache = {}
+    search_item = Repositories(self._cfg, self.org).new_item()
+    unique_repos = {}
+    for cv in cvs:
+      for repo in cv.repository:
+        unique_repos.setdefault(repo.id, repo)
+    log.info(f"{len(cvs)} content-views have {len(unique_repos)} repositories "
+             "to fetch metadata")
+    repos = {}
+    # Don't run more reads than we have connections in the HTTP pool
+    workers = self._cfg.satellite.getint("http_pool_size", 10)
+    with alive_bar(len(unique_repos)) as bar, \
+         ThreadPoolExecutor(max_workers=workers) as executor:
+      futures = {executor.submit(self._cfg.cache.read, repo, search_item): repo_id
+                 for repo_id, repo in unique_repos.items()}
+      for future in as_completed(futures):
+        repos[futures[future]] = future.result()
+        bar(f"Got {repos[futures[future]].name}")
     for cv in cvs:
-      log.info(f"{cv.name} has {len(cv.repository)} repositories to fetch metadata")
-      self.repo_cache[cv.id] = []
-      with alive_bar(len(cv.repository)) as bar:
-        for repo in cv.repository:
-          self.repo_cache[cv.id].append(repo.read())
-          bar(f"Got {self.repo_cache[cv.id][-1].name}")
+      self.repo_cache[cv.id] = [repos[repo.id] for repo in cv.repository]
 
   def get_repo_by_name(self, cv, name):
     namespaces = list(filter(lambda x: x.name == name,
@@ -7,9 +7,10 @@ class Contentviews(Base):
   """ Satellite product creation
   """
   def __init__(self, cfg, promote_only=False, composite_only=False, releases=[],
-               zreleases=[], force=False):
+               zreleases=[], force=False, jobs=None, republish=False):
     super().__init__(cfg)
     self.org = Org(cfg, name=self._cfg.satellite["default_org"])
     self.cvs = ContentViewEntity(cfg, self.org)
     release_list = self.read_releases(releases, zreleases)
-    self.cvs.create_all(release_list, promote_only, composite_only, force)
+    self.cvs.create_all(release_list, promote_only, composite_only, force,
+                        jobs, republish)
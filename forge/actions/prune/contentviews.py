@@ -0,0 +1,41 @@
+import sys
+
+import click
+from logzero import logger as log
+
+from forge.actions.base import Base
+from forge.entities.contentview import ContentViews as ContentViewEntity
+from forge.entities.organization import Org
+from forge.query import Query
+
+
+class Contentviews(Base):
+  """ Satellite content views deletion
+  """
+  def __init__(self, cfg, releases=[], zreleases=[], match=None, jobs=None,
+               force=False, yes=False):
+    super().__init__(cfg)
+    if not (len(releases) or len(zreleases) or match):
+      raise ValueError("Select the content views to prune with releases, "
+                       "zreleases or a match")
+    self.org = Org(cfg, name=self._cfg.satellite["default_org"])
+    self.cvs = ContentViewEntity(cfg, self.org)
+    if len(releases) or len(zreleases):
+      items = self.cvs.get_by_releases(
+        list(self.read_releases(releases, zreleases)), zreleases)
+    else:
+      items = self.cvs.get_all(query=Query(name=match, operator="like"))
+    if match:
+      items = [c for c in items if match.lower() in c.name.lower()]
+    # we need to skip the default content view
+    items = [c for c in items if c.name != "Default Organization View"]
+    if not len(items):
+      log.info("No content views to prune")
+      return
+    for c in sorted(items, key=lambda x: x.name):
+      log.info(f"Pruning {c.name}")
+    if not (yes or self._cfg.plan):
+      click.confirm(f"Delete these {len(items)} content views, their versions "
+                    "and activation keys?", abort=True)
+    if len(self.cvs.prune_all(items, jobs, force)):
+      sys.exit(-1)
@@ -0,0 +1,225 @@
+import asyncio
+from importlib.util import find_spec
+from json import loads
+from time import time
+
+from logzero import logger as log
+from requests import Response
+from requests.exceptions import HTTPError
+
+# Imported by AsyncSatellite, it's slower to import than the rest of forge
+aiohttp = None
+
+
+def available():
+  """Whether aiohttp is installed
+
+  :rtype: bool
+  """
+  return find_spec("aiohttp") is not None
+
+
+def http_error(status, body, url):
+  """Builds the HTTPError raised by requests for an error response, the
+  handlers of the sync engine read its response
+
+  :param status: HTTP status code
+  :type status: int
+  :param body: Body of the response
+  :type body: bytes
+  :param url: URL of the request
+  :type url: str
+  :return: HTTPError with a response
+  :rtype: requests.exceptions.HTTPError
+  """
+  response = Response()
+  response.status_code = status
+  response._content = body
+  response.url = url
+  return HTTPError(f"{status} Error: {body[:500].decode(errors='replace')} "
+                   f"for url: {url}", response=response)
+
+
+class AsyncSatellite(object):
+  """asyncio client of the satellite API, used by the async engine.
+
+  Requests are sent with aiohttp, on the same paths and with the same payloads
+  as nailgun, and at most `concurrency` of them are in flight on the satellite
+  at any time. The forged entities use it through their asearch(), aread(),
+  acreate() and aupdate() methods.
+  """
+  # Only idempotent verbs are retried, like forge.session.SatelliteSession
+  retry_methods = ["HEAD", "GET", "PUT", "DELETE", "OPTIONS"]
+  retry_status = [502, 503, 504]
+  backoff_factor = 0.5
+
+  def __init__(self, cfg, concurrency=None):
+    """Class initialization
+
+    :param cfg: Configuration object
+    :type cfg: forge.config
+    :param concurrency: Maximum number of requests in flight, defaults to the
+                        `async_concurrency` setting, or 20
+    :type concurrency: int, optional
+    """
+    global aiohttp
+    import aiohttp
+    self._cfg = cfg
+    if not concurrency:
+      concurrency = self._cfg.satellite.getint("async_concurrency", 20)
+    self.concurrency = max(1, concurrency)
+    self.max_retries = self._cfg.satellite.getint("http_retries", 3)
+    self._session = None
+    self._limiter = None
+
+  async def __aenter__(self):
+    server_config = self._cfg.server_config
+    # The semaphore has to be created in the running loop
+    self._limiter = asyncio.Semaphore(self.concurrency)
+    connector = aiohttp.TCPConnector(
+      limit=self.concurrency, ssl=None if server_config.verify else False)
+    self._session = aiohttp.ClientSession(
+      connector=connector, auth=aiohttp.BasicAuth(*server_config.auth),
+      headers={"accept": "application/json"})
+    log.debug(f"Async client created with {self.concurrency} concurrent "
+              "requests")
+    return self
+
+  async def __aexit__(self, *args):
+    await self._session.close()
+
+  async def request(self, method, url, data=None):
+    """Sends a request to the satellite
+
+    :param method: HTTP Verb to use (ex: get, post, put, delete)
+    :type method: str
+    :param url: Full URL of the endpoint
+    :type url: str
+    :param data: json payload, defaults to None
+    :type data: dict, optional
+    :raises HTTPError: If the satellite returns an error, with its response
+                       like the sync engine
+    :return: Decoded response
+    :rtype: dict
+    """
+    method = method.upper()
+    retries = self.max_retries if method in self.retry_methods else 0
+    for attempt in range(retries + 1):
+      try:
+        status, body = await self._send(method, url, data, attempt)
+        if status not in self.retry_status:
+          break
+      except aiohttp.ClientConnectionError:
+        if attempt == retries:
+          raise
+      if attempt < retries:
+        await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+    if status >= 400:
+      raise http_error(status, body, url)
+    return loads(body) if body else {}
+
+  async def _send(self, method, url, data, retries):
+    async with self._limiter:
+      start = time()
+      status = size = None
+      try:
+        async with self._session.request(method, url, json=data) as response:
+          body = await response.read()
+          status, size = response.status, len(body)
+          return status, body
+      finally:
+        if self._cfg.profiler:
+          self._cfg.profiler.record(method, url, status, size, time() - start,
+                                    retries)
+
+  async def search(self, item, query, limit=None):
+    """Searches all the pages of an entity. The first page gives the number
+    of results, the other pages are then fetched concurrently.
+
+    :param item: nailgun entity the search is run on, its values are added
+                 to the search payload like nailgun does
+    :type item: nailgun.entities.item
+    :param query: Search query, see forge.entities.Base.search_query()
+    :type query: dict
+    :param limit: Maximum number of results, defaults to all of them
+    :type limit: int, optional
+    :return: Results of the search
+    :rtype: list, dict
+    """
+    url = item.path("base")
+    per_page = query["per_page"]
+    first = await self.request("get", url,
+                               item.search_payload(query={**query, "page": 1}))
+    results = first["results"]
+    total = first.get("subtotal") or len(results)
+    if limit:
+      total = min(total, limit)
+    pages = await asyncio.gather(*[
+      self.request("get", url, item.search_payload(query={**query, "page": page}))
+      for page in range(2, (total - 1) // per_page + 2)])
+    for page in pages:
+      results.extend(page["results"])
+    return results[:limit] if limit else results
+
+  async def read(self, item):
+    """Reads an entity
+
+    :param item: nailgun entity with an id
+    :type item: nailgun.entities.item
+    :return: Attributes of the entity
+    :rtype: dict
+    """
+    return await self.request("get", item.path("self"))
+
+  async def create(self, item):
+    """Creates an entity
+
+    :param item: nailgun entity to create
+    :type item: nailgun.entities.item
+    :return: Attributes of the created entity
+    :rtype: dict
+    """
+    return await self.request("post", item.path("base"), item.create_payload())
+
+  async def update(self, item, fields=None):
+    """Updates an entity
+
+    :param item: nailgun entity to update
+    :type item: nailgun.entities.item
+    :param fields: Names of the fields to update, defaults to all of them
+    :type fields: list, optional
+    :return: Attributes of the updated entity
+    :rtype: dict
+    """
+    return await self.request("put", item.path("self"),
+                              item.update_payload(fields))
+
+  async def delete(self, item):
+    """Deletes an entity
+
+    :param item: nailgun entity to delete
+    :type item: nailgun.entities.item
+    :return: Response of the satellite, a foreman task for some entities
+    :rtype: dict
+    """
+    return await self.request("delete", item.path("self"))
+
+
+def run(cfg, main, *args, **kwargs):
+  """Runs a coroutine function with the async client of the satellite
+  available as cfg.aio
+
+  :param cfg: Configuration object
+  :type cfg: forge.config
+  :param main: Coroutine function
+  :type main: callable
+  :return: Result of the coroutine
+  """
+  async def runner():
+    async with AsyncSatellite(cfg) as satellite:
+      cfg.aio = satellite
+      try:
+        return await main(*args, **kwargs)
+      finally:
+        cfg.aio = None
+  return asyncio.run(runner())
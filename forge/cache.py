@@ -0,0 +1,162 @@
+import json
+import os
+from shutil import rmtree
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import time
+
+from logzero import logger as log
+
+
+class MetadataCache(object):
+  """On-disk cache of the satellite entities metadata.
+
+  Every entity read through this cache is stored as json in
+  ~/.cache/forge/<satellite-name>/<entity>/<id>.json and served from there
+  while it's younger than the entity TTL and its updated_at still matches
+  what the satellite reports.
+  """
+  def __init__(self, cfg, enabled=None):
+    """Class initialization
+
+    :param cfg: Configuration object
+    :type cfg: forge.config
+    :param enabled: Overrides the `enabled` key of the [cache] section,
+                    defaults to None
+    :type enabled: bool, optional
+    """
+    try:
+      self.config = cfg.config["cache"]
+    except KeyError:
+      self.config = {}
+    if enabled is None:
+      enabled = self.config and self.config.getboolean("enabled", False)
+    self.enabled = bool(enabled)
+    cache_home = os.environ.get("XDG_CACHE_HOME",
+                                os.path.expanduser("~/.cache"))
+    self.path = os.path.join(cache_home, "forge", cfg.satellite["name"])
+    # updated_at of all the items of an entity type, by id
+    self._stamps = {}
+    self._stamps_lock = Lock()
+
+  def get_ttl(self, entity):
+    """Returns the time to live of an entity type, in seconds
+
+    :param entity: Nailgun entity name (ex: Repository)
+    :type entity: str
+    :return: TTL in seconds
+    :rtype: int
+    """
+    if not self.config:
+      return 3600
+    return self.config.getint(entity.lower(), self.config.getint("ttl", 3600))
+
+  def get_stamps(self, search_item):
+    """Returns the updated_at of all the items of an entity type, by id.
+    This is fetched once, page by page, and kept for the whole run.
+
+    :param search_item: Entity used to run the search
+    :type search_item: nailgun.entities.item
+    :return: updated_at by id
+    :rtype: dict
+    """
+    entity = type(search_item).__name__
+    # Concurrent readers wait for the first one to fetch the stamps
+    with self._stamps_lock:
+      if entity not in self._stamps:
+        stamps = {}
+        page = 1
+        while True:
+          results = search_item.search_json(query={"per_page": 1000,
+                                                   "page": page})["results"]
+          stamps.update({r["id"]: r.get("updated_at") for r in results})
+          if len(results) < 1000:
+            break
+          page += 1
+        self._stamps[entity] = stamps
+    return self._stamps[entity]
+
+  def read(self, item, search_item=None):
+    """Returns item.read(), served from the cache when it's fresh
+
+    :param item: Entity to read, only the id needs to be set
+    :type item: nailgun.entities.item
+    :param search_item: Entity used to fetch the updated_at of all the items
+                        of that type, defaults to None (TTL only)
+    :type search_item: nailgun.entities.item, optional
+    :return: Entity populated with all its attributes
+    :rtype: nailgun.entities.item
+    """
+    if not self.enabled or getattr(item, "id", None) is None:
+      return item.read()
+    entity = type(item).__name__
+    updated_at = None
+    if search_item is not None:
+      updated_at = self.get_stamps(search_item).get(item.id)
+    attrs = self.load(entity, item.id, updated_at)
+    if attrs is None:
+      attrs = item.read_json()
+      self.store(entity, item.id, attrs)
+    return item.read(attrs=attrs)
+
+  def _file(self, entity, item_id):
+    return os.path.join(self.path, entity, f"{item_id}.json")
+
+  def load(self, entity, item_id, updated_at=None):
+    """Loads an entity attributes from the cache
+
+    :param entity: Nailgun entity name (ex: Repository)
+    :type entity: str
+    :param item_id: Entity ID
+    :type item_id: int
+    :param updated_at: Last update reported by the satellite, defaults to None
+    :type updated_at: str, optional
+    :return: Entity attributes, or None if it's missing or stale
+    :rtype: dict
+    """
+    try:
+      with open(self._file(entity, item_id)) as f:
+        cached = json.load(f)
+    except (OSError, ValueError):
+      return None
+    if time() - cached["stored"] > self.get_ttl(entity):
+      log.debug(f"Cached {entity} {item_id} expired")
+      return None
+    if updated_at and cached["attrs"].get("updated_at") != updated_at:
+      log.debug(f"Cached {entity} {item_id} was updated on the satellite")
+      return None
+    return cached["attrs"]
+
+  def store(self, entity, item_id, attrs):
+    """Stores an entity attributes in the cache
+
+    :param entity: Nailgun entity name (ex: Repository)
+    :type entity: str
+    :param item_id: Entity ID
+    :type item_id: int
+    :param attrs: Attributes returned by read_json()
+    :type attrs: dict
+    """
+    folder = os.path.join(self.path, entity)
+    temp_file = None
+    # The cache is optional, a read-only or full disk only means the next
+    # read goes to the satellite
+    try:
+      os.makedirs(folder, exist_ok=True)
+      # Write and rename so a concurrent reader never sees a partial file
+      with NamedTemporaryFile("w", dir=folder, delete=False) as f:
+        temp_file = f.name
+        json.dump({"stored": time(), "attrs": attrs}, f)
+      os.replace(temp_file, self._file(entity, item_id))
+    except (OSError, TypeError, ValueError) as err:
+      log.debug(f"Unable to cache {entity} {item_id}: {err}")
+      if temp_file:
+        try:
+          os.remove(temp_file)
+        except OSError:
+          pass
+
+  def clear(self):
+    """Removes all the cached metadata of the satellite"""
+    rmtree(self.path, ignore_errors=True)
+    self._stamps = {}
@@ -1,12 +1,17 @@
 import configparser
+import importlib
 import importlib.util
 import os
 from sys import exit
 
 from logzero import logger as log
-from nailgun.config import ServerConfig
 from dotenv import load_dotenv
 
+# Root of the forge package, the modules under it are imported by name
+package_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# Modules loaded by load_module(), by path
+loaded_modules = {}
+
 
 class EnvInterpolation(configparser.BasicInterpolation):
   """Interpolation which expands environment variables in values."""
@@ -22,6 +27,17 @@ class Config(object):
     self.config_file = config_file
     self.config = configparser.SafeConfigParser(interpolation=EnvInterpolation())
     self.server_config = None
+    self.session = None
+    self.cache = None
+    self.task_watcher = None
+    self.profiler = None
+    self.plan = None
+    # Engine used by the read-heavy commands, "sync" or "async" (forge.aio)
+    self.engine = "sync"
+    # forge.aio.AsyncSatellite, while running with the async engine
+    self.aio = None
+    # forge.releases.ReleaseModel, parsed on first use
+    self.releases = None
     load_dotenv()
 
   def read_config(self, satellite_server=None):
@@ -45,24 +61,96 @@ class Config(object):
       except KeyError:
         log.error(f"Unknown satellite servers: {satellite_server}")
         exit(1)
+    # Only imported once a command runs, so --help doesn't wait for nailgun
+    # and requests
+    from nailgun.config import ServerConfig
+    from forge.cache import MetadataCache
+    from forge.session import install_session
+    from forge.taskwatcher import TaskWatcher
     self.server_config = ServerConfig(
       verify=False,
       auth=(self.satellite["username"], self.satellite["password"]),
       url="https://%s" % self.satellite["host"]
     )
+    self.session = install_session(
+      self.server_config,
+      pool_size=self.satellite.getint("http_pool_size", 10),
+      max_retries=self.satellite.getint("http_retries", 3))
+    self.cache = MetadataCache(self)
+    self.task_watcher = TaskWatcher(self)
+
+  def enable_profiler(self, dump_file=None):
+    """Records all the API calls, see forge.profiler
+
+    :param dump_file: Path of the json lines dump, defaults to None
+    :type dump_file: str, optional
+    :return: The profiler
+    :rtype: forge.profiler.Profiler
+    """
+    from forge.profiler import Profiler
+    self.profiler = Profiler(dump_file)
+    self.session.profiler = self.profiler
+    return self.profiler
+
+  def enable_plan(self):
+    """Records the changes instead of applying them, see forge.plan
+
+    :return: The plan
+    :rtype: forge.plan.Plan
+    """
+    from forge.plan import Plan
+    self.plan = Plan()
+    return self.plan
+
+  def get_releases(self):
+    """Returns the releases of the configuration, parsed and validated once,
+    see forge.releases
+
+    :rtype: forge.releases.ReleaseModel
+    """
+    if not self.releases:
+      from forge.releases import load_releases
+      try:
+        self.releases = load_releases(self)
+      except ValueError as err:
+        log.error(f"Invalid release in {self.config_file}: {err}")
+        exit(1)
+    return self.releases
+
+  def set_engine(self, engine):
+    """Selects the engine used by the read-heavy commands
+
+    :param engine: Either "sync" or "async"
+    :type engine: str
+    """
+    from forge import aio
+    if engine == "async" and not aio.available():
+      log.error("The async engine requires aiohttp: pip install aiohttp")
+      exit(1)
+    self.engine = engine
 
 
 def load_module(folder, target, class_name=None):
   """ Function to load modules from a file as a class_name.
   This is used by the forger.py command and also used in the entitles.base
-  when passing strings as classes to be loaded. """
+  when passing strings as classes to be loaded.
+  Modules are only loaded once. The ones from the forge package are imported
+  by name, so they're shared with the regular imports. """
   if not class_name:
     class_name = target.capitalize()
   if "/" not in folder:
     folder = f"./forge/actions/{folder}"
-  file_name = f"{folder}/{target}.py"
-  spec = importlib.util.spec_from_file_location(f"{class_name}", file_name)
-  module = importlib.util.module_from_spec(spec)
-  spec.loader.exec_module(module)
-  log.debug(f"Loading class {class_name} from {folder} as {module}")
+  file_name = os.path.realpath(f"{folder}/{target}.py")
+  module = loaded_modules.get(file_name)
+  if not module:
+    relative = os.path.relpath(file_name, package_root)
+    if relative.startswith(f"forge{os.sep}"):
+      module = importlib.import_module(
+        relative[:-len(".py")].replace(os.sep, "."))
+    else:
+      spec = importlib.util.spec_from_file_location(f"{class_name}", file_name)
+      module = importlib.util.module_from_spec(spec)
+      spec.loader.exec_module(module)
+    loaded_modules[file_name] = module
+    log.debug(f"Loaded {file_name} as {module}")
   return getattr(module, class_name)
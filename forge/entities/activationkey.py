@@ -1,11 +1,14 @@
+from functools import partial
 from re import sub
 
 from alive_progress import alive_bar
 from forge.entities.base import Base
 from forge.entities.contentview import ContentViews
+from forge.entities.lifecycle_environment import LifecycleEnvironments
 from forge.entities.product import Products
 from forge.entities.repository_set import RepositorySets
 from forge.entities.subscription import Subscriptions
+from forge.scheduler import Scheduler
 from logzero import logger as log
 
 
@@ -27,16 +30,36 @@ class ActivationKeys(Base):
     :type org: forge.entities.Org
     """
     self.entity = "ActivationKey"
+    # Content overrides of the activation keys found by the searches, by id
+    self.overrides = {}
     super().__init__(cfg, org=org)
 
+  def _search_page(self, item, query, page, records=False):
+    # nailgun drops the content overrides from the search results, they're
+    # kept to skip the overrides that are already set
+    with self.profile("search"):
+      results = item.search_json(query={**query, "page": page})["results"]
+    for result in results:
+      if "content_overrides" in result:
+        self.overrides[result["id"]] = result["content_overrides"]
+    if records:
+      return self.to_records(item, results)
+    return [type(item)(self._cfg.server_config, **attrs)
+            for attrs in item.search_normalize(results)]
+
   def get_by_cv(self, cv):
     return self.search(None, **{"content_view_id": cv.id})
 
-  def create_all(self, releases):
-    """Loops through the configured releases and generates the ActivationKeys
+  def create_all(self, releases, jobs=None):
+    """Loops through the configured releases and generates the ActivationKeys.
+    The environments, content views and activation keys are loaded once, then
+    the activation keys are created concurrently through the Scheduler.
 
     :param releases: List of releases generated by make/base:read_releases
     :type releases: list
+    :param jobs: Number of activation keys created concurrently, defaults to
+                 the `publish_jobs` setting
+    :type jobs: int, optional
     """
     # If a release has an ak_sub configured, we need to try to add a  matching
     # product to the AK. For this, we need to pull the subs, products and reposets
@@ -44,32 +67,40 @@ class ActivationKeys(Base):
     if len(releases_sub):
       log.info("Some AKs must be attached to subs.")
       self.load_sub_metadata()
+    envs = LifecycleEnvironments(self._cfg, self.org)
+    envs.get_all()
+    cvs = ContentViews(self._cfg, self.org)
+    cvs.get_all()
+    # The activation keys that already exist are updated from this cache
+    self.get_all()
+    active_subs = self.get_active_subscriptions() if len(releases_sub) else {}
+    scheduler = Scheduler(self._cfg, jobs)
     for release in releases:
       r = releases[release]
-      self.release_subs = []
       label_list = r["labels"].split(",")
       reposets = self.reposet.get_by_labels(label_list)
       sub_match = r["ak_sub"] if "ak_sub" in r else None
-      self.get_subs(reposets, sub_match)
-      if len(self.release_subs):
-        log.info(f"Will attach to {[s.name for s in self.release_subs]}")
-      cvs = ContentViews(self._cfg, self.org).get_by_releases(release)
-      if r["container"]:
-        cvs = list(filter(lambda x: x.composite, cvs))
-      total_ak = sum([len(cv.environment) for cv in cvs])
-      with alive_bar(total_ak * 3, title="Creating AK") as bar:
-        for cv in cvs:
-          for env in cv.environment:
-            self.create_for_cv(cv, env, r["releasever"], bar, label_list)
-
-  def add_sub(self, sub):
-    """ Adding a subscription to the subscription list if it's not there
-
-    :param sub: Subscription to append
-    :type sub: nailgun.entity.Subscription
-    """
-    if sub not in self.release_subs:
-      self.release_subs.append(sub)
+      release_subs = self.get_subs(reposets, sub_match)
+      if len(release_subs):
+        log.info(f"Will attach to {[s.name for s in release_subs]}")
+      # The containers are only in the composite CVs
+      release_cvs = cvs.get_by_releases(release, refresh=False,
+                                        composite=True if r["container"]
+                                        else None)
+      for cv in release_cvs:
+        for cv_env in cv.environment:
+          env = envs.find(cv_env.id, "id")
+          if not env:
+            log.error(f"Unknown lifecycle environment {cv_env.id} of "
+                      f"{cv.name}, skipping its activation key")
+            continue
+          scheduler.add(f"AK {env.label} {cv.label}",
+                        partial(self.create_for_cv, cv, env, r["releasever"],
+                                release_subs, label_list, active_subs))
+    log.info(f"Creating {len(scheduler)} activation keys, {scheduler.jobs} at "
+             "a time")
+    with alive_bar(len(scheduler), title="Creating AK") as bar:
+      scheduler.run(bar)
 
   def get_subs(self, reposets, sub_match=None):
     """Get the best matching sub for a list of reposets
@@ -78,7 +109,10 @@ class ActivationKeys(Base):
     :type reposets: list, nailgun.entity.RepositorySet
     :param sub_match: Subscription name to look for, defaults to None
     :type sub_match: str, optional
+    :return: Subscriptions to attach, without duplicates
+    :rtype: list, nailgun.entity.Subscription
     """
+    release_subs = []
     for repo in reposets:
       # for each repo, we get the product id
       product = self.products.find(repo.product.id, "id")
@@ -92,13 +126,34 @@ class ActivationKeys(Base):
         log.info(
           f"[{repo.name}] Found {len(matching_subs)} matching sub(s), "
           f"using the first one: {matching_subs[0].name}")
-        self.add_sub(matching_subs[0])
+        subc = matching_subs[0]
       else:
         psub = sorted(product_subs, key=lambda x: x.quantity, reverse=True)[0]
         log.warning(
           f"[{repo.name}] Found no matching sub, using first "
           f"product subs {psub.name}")
-        self.add_sub(psub)
+        subc = psub
+      if subc not in release_subs:
+        release_subs.append(subc)
+    return release_subs
+
+  def get_active_subscriptions(self):
+    """Returns the subscriptions attached to the activation keys loaded by
+    get_all(). They come from the search of the subscriptions run by
+    load_sub_metadata(), the keys are only queried one by one when the
+    satellite doesn't list the activation keys of the subscriptions.
+
+    :return: Subscription ids, by activation key id
+    :rtype: dict
+    """
+    if self.subs.activation_keys is not None:
+      return self.subs.activation_keys
+    active_subs = {}
+    for ak in self.items:
+      with self.profile("subscriptions"):
+        results = ak.subscriptions()["results"]
+      active_subs[ak.id] = {s["subscription_id"] for s in results}
+    return active_subs
 
   def load_sub_metadata(self):
     """Loads the Subscriptions, Products and RepositorySets metadata
@@ -113,7 +168,8 @@ class ActivationKeys(Base):
       self.log_bar("Loading repos", bar)
       self.reposet = RepositorySets(self._cfg, self.org)
 
-  def create_for_cv(self, cv, env, releasever, bar, labels=[]):
+  def create_for_cv(self, cv, env, releasever, subs=[], labels=[],
+                    active_subs={}):
     """ Creates an ActivationKey for a ContentView's environment
 
     :param cv: ContentView entity
@@ -122,42 +178,85 @@ class ActivationKeys(Base):
     :type env: nailgun.entity.LifecycleEnvironment
     :param releasever: Release Version (ex: 7Server, 8.2, etc)
     :type releasever: str
-    :param bar: Alive progress bar context
-    :type bar: context
+    :param subs: Subscriptions to attach, defaults to []
+    :type subs: list, optional
     :param labels: List of labels to enable in content_override,
                    defaults to []
     :type labels: list, optional
+    :param active_subs: Subscription ids attached to the existing activation
+                        keys, by activation key id, defaults to {}
+    :type active_subs: dict, optional
     """
     item = self.new_item()
-    env = env.read()
     item.name = sub(r"^[C]{1,2}V_", f"AK_{env.label.capitalize()}_", cv.label)
-    self.log_bar(f"Creating {item.name}", bar)
+    log.debug(f"Creating {item.name}")
     item.content_view = cv
     item.environment = env
     item.release_version = releasever
     item.unlimited_hosts = True
     item.auto_attach = True
-    self.create(item)
-    self.log_bar(f"Adding subs to {item.name}", bar)
-    if len(self.release_subs):
-      active_subs = self.item.subscriptions()["results"]
-      for subc in self.release_subs:
-        added = list(filter(lambda x: x["subscription_id"] == subc.subscription.id,
-                            active_subs))
-        if not len(added):
-          self.item.add_subscriptions(data={
-            'subscription_id': subc.id
-          })
-        else:
-          log.debug(f"Subscription {subc.name} already added to AK")
-
-    self.log_bar(f"Setting content override for {item.name}", bar)
+    ak = self.create(item)
+    if len(subs):
+      log.debug(f"Adding subs to {item.name}")
+      # With --plan, the AK might not exist yet
+      self.add_subscriptions(ak, subs,
+                             active_subs.get(getattr(ak, "id", None), set()))
     if len(labels):
-      overrides = []
-      for label in labels:
-        overrides.append({
-            'content_label': label,
-            'name': 'enabled',
-            'value': '1'
-            })
-      self.item.content_override(data={'content_overrides': overrides})
+      log.debug(f"Setting content override for {item.name}")
+      self.set_overrides(ak, labels)
+
+  def add_subscriptions(self, ak, subs, active_ids=set()):
+    """Attaches the subscriptions missing on an activation key, in one call
+
+    :param ak: ActivationKey entity
+    :type ak: nailgun.entity.ActivationKey
+    :param subs: Subscriptions to attach
+    :type subs: list, nailgun.entity.Subscription
+    :param active_ids: Ids of the subscriptions already attached, see
+                       get_active_subscriptions(), defaults to none
+    :type active_ids: set, optional
+    """
+    missing = []
+    for subc in subs:
+      if subc.subscription.id in active_ids:
+        log.debug(f"Subscription {subc.name} already added to {ak.name}")
+      else:
+        missing.append(subc)
+    if not len(missing):
+      return
+    data = {"subscriptions": [{"id": s.id, "quantity": 1} for s in missing]}
+    if not self.planned("add_subscriptions", ak, data):
+      with self.profile("add_subscriptions"):
+        ak.add_subscriptions(data=data)
+
+  def set_overrides(self, ak, labels):
+    """Enables the content of some repositories on an activation key, unless
+    the satellite returned them already enabled
+
+    :param ak: ActivationKey entity
+    :type ak: nailgun.entity.ActivationKey
+    :param labels: Labels of the repositories to enable
+    :type labels: list
+    """
+    overrides = [{"content_label": label, "name": "enabled", "value": "1"}
+                 for label in labels]
+    current = [(o.get("content_label", o.get("contentLabel")), o.get("name"),
+                self._override_value(o.get("value")))
+               for o in self.overrides.get(getattr(ak, "id", None), [])]
+    if all((o["content_label"], o["name"], self._override_value(o["value"]))
+           in current for o in overrides):
+      log.debug(f"Content overrides of {ak.name} are already set")
+      return
+    data = {"content_overrides": overrides}
+    if not self.planned("content_override", ak, data):
+      with self.profile("content_override"):
+        ak.content_override(data=data)
+
+  def _override_value(self, value):
+    # The satellite returns the overrides it enabled as true, or "1"
+    value = self._comparable(value)
+    if value in ("1", "true"):
+      return "1"
+    if value in ("0", "false"):
+      return "0"
+    return value
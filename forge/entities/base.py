@@ -1,18 +1,24 @@
 import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from json import dumps
 from os import path
-from time import sleep
+from time import time
 
 from forge.config import load_module
+from forge.query import Query
+from forge.records import Record, record_type
 from logzero import logger as log
 from nailgun import entities, entity_mixins
-from requests import request
 from requests.exceptions import HTTPError
 
 
 class Base(object):
   """Base object used for all forged entities
   """
+  # Attributes indexed by get_all() for constant time find()
+  _index_keys = ["name", "id", "label"]
+
   def __init__(self, cfg, org=None, orgs=[], **kwargs):
     """Class initialization
 
@@ -26,6 +32,7 @@ class Base(object):
     :type orgs: list, optional
     """
     self.items = []
+    self._index = {}
     self.org = org
     self.orgs = orgs
     self._cfg = cfg
@@ -35,6 +42,10 @@ class Base(object):
       self._pass_to_new = []
     if not hasattr(self, "_search_key"):
       self._search_key = "name"
+    # Attributes that are not compared when looking for changes, because the
+    # satellite doesn't return them or because they're generated each run
+    if not hasattr(self, "_diff_ignore_keys"):
+      self._diff_ignore_keys = []
     if not hasattr(self, "entity"):
       self.entity = ""
 
@@ -78,7 +89,20 @@ class Base(object):
     log.debug(msg)
     bar(msg)
 
-  def _raw_req(self, method, endpoint, data={}):
+  def profile(self, action):
+    """Context attributing the API calls made in it to this entity, when
+    profiling is enabled
+
+    :param action: Action executed (ex: search, update)
+    :type action: str
+    :return: Context manager
+    :rtype: context
+    """
+    if not self._cfg.profiler:
+      return nullcontext()
+    return self._cfg.profiler.context(self.entity, action)
+
+  def _raw_req(self, method, endpoint, data={}, results=True):
     """Send a raw request to the satellite API
 
     :param method: HTTP Verb to use (ex: get, post, put, delete)
@@ -87,20 +111,26 @@ class Base(object):
     :type endpoint: str
     :param data: data to pass, defaults to {}
     :type data: dict, optional
-    :return: Result key from the response
+    :param results: The endpoint is a listing, only its results are
+                    returned, defaults to True
+    :type results: bool, optional
+    :return: Result key from the response, or the whole response
     :rtype: dict
     """
-    data["per_page"] = 1000
-    response = request(method,
-        f'{self._cfg.server_config.url}/katello/api/v2/{endpoint}',
-        data=dumps(data),
-        auth=self._cfg.server_config.auth,
-        headers={"content-type": "application/json"},
-        verify=self._cfg.server_config.verify,
-    )
+    data = dict(data)
+    if results:
+      data["per_page"] = 1000
+    with self.profile(f"raw {method}"):
+      response = self._cfg.session.request(method,
+          f'{self._cfg.server_config.url}/katello/api/v2/{endpoint}',
+          data=dumps(data),
+          headers={"content-type": "application/json"},
+      )
     response.raise_for_status()
     decoded = response.json()
-    return decoded["results"]
+    if results:
+      return decoded["results"]
+    return decoded
 
   def new_item(self, **kwargs):
     """Generates an entity item.
@@ -124,7 +154,8 @@ class Base(object):
       return item(self._cfg.server_config, **kwargs)
     return item(self._cfg.server_config)
 
-  def get_all(self, full=False, key_name=None, value=None):
+  def get_all(self, full=False, key_name=None, value=None, records=False,
+              query=None):
     """Populates a cached list of all items
 
     :param full: sets the "full_result" key on the search, defaults to False
@@ -133,19 +164,47 @@ class Base(object):
     :type key_name: str, optional
     :param value: Value to filter key_name on, defaults to None
     :type value: str, optional
-    :return: List of cached items
+    :param records: Cache read-only records instead of nailgun entities, see
+                    search(), defaults to False
+    :type records: bool, optional
+    :param query: Only fetch the items matching this search, defaults to None
+    :type query: forge.query.Query, optional
+    :return: List of the items found, all the cached items are in self.items
     :rtype: list, nailgun.entities.item
     """
-    search_string = {}
+    search_string = {"records": records}
     if key_name and value:
       search_string[key_name] = value
     if full:
       search_string["full_result"] = full
-    self.items = self.search(None, **search_string)
-    return self.items
+    if query:
+      search_string["query"] = query
+    items = self.search(None, **search_string)
+    if query or (key_name and value):
+      # A filtered search only refreshes the items it found, the ones cached
+      # before are kept
+      merged = {item.id: item for item in self.items}
+      merged.update((item.id, item) for item in items)
+      self.items = list(merged.values())
+    else:
+      self.items = items
+    self.index_items()
+    return items
+
+  def index_items(self):
+    """Builds the lookup tables used by find() from the cached items.
+    When multiple items share the same value, the first one is kept.
+    """
+    self._index = {key: {} for key in self._index_keys}
+    for item in self.items:
+      for key in self._index_keys:
+        value = getattr(item, key, None)
+        if value is not None:
+          self._index[key].setdefault(value, item)
 
   def find(self, value, key_name="name"):
-    """Search the cache and returns the first item matching criterium
+    """Search the cache and returns the first item matching criterium.
+    Indexed keys are looked up in constant time, others are scanned.
 
     :param value: Value to look for, normally it's by name
     :type name: str
@@ -154,12 +213,14 @@ class Base(object):
     :return: Nailgun entity
     :rtype: nailgun.entities.item or None
     """
-    for item in self.items:
-      if getattr(item, key_name) == value:
-        return item
+    if key_name in self._index:
+      item = self._index[key_name].get(value)
     else:
+      item = next(filter(lambda x: getattr(x, key_name) == value, self.items),
+                  None)
+    if item is None:
       log.warn(f"Item {self.entity} with key {key_name} = {value} not found")
-      return None
+    return item
 
   def find_or_new(self, name, key_name="name"):
     """Search the cache and returns the first item matching criterium,
@@ -207,68 +268,228 @@ class Base(object):
     :rtype: nailgun.entities.item or new item
     """
     item = self.get(name)
-    return item if item else self.new_item().create()
+    if item:
+      return item
+    if self.planned("create", name):
+      return self.new_item()
+    return self.new_item().create()
 
-  def search(self, item, **kwargs):
+  def search(self, item=None, **kwargs):
     """Wrapper around the search function.
+    All the pages are fetched, see search_iter() to stream them instead.
 
     :param kwargs:
-      "operator": Can be "not" to compare with "!=", otherwise "="
-      "per_page": Number of items to return, defaults to 1000
+      "operator": Can be "not" to compare with "!=", "like" to compare with
+                  "~", otherwise "="
+      "query": forge.query.Query run by the satellite, with the other
+               keywords
+      "params": Other parameters of the listing (ex: {"enabled": True})
+      "per_page": Number of items to fetch per page, defaults to 1000
+      "limit": Maximum number of items to return, defaults to all of them
       "full_result": Passed to the search query.
+      "records": Returns read-only records (see forge.records) instead of
+                 nailgun entities. Much lighter for listings, the entity is
+                 built only if a method like update() is called.
       anything else will be added to the search string.
     :param item: Use a specific entity to run the search
     :type item: nailgun.entities.item
     :return: List of items matching search query
     :rtype: list, nailgun.entities.item
     """
+    return list(self.search_iter(item, **kwargs))
+
+  def search_iter(self, item=None, **kwargs):
+    """Lazy version of search(). Pages are fetched on demand and the next
+    page is prefetched in the background while the current one is consumed.
+
+    :param kwargs: Same as search()
+    :param item: Use a specific entity to run the search
+    :type item: nailgun.entities.item
+    :raises HTTPError: When a page after the first one can't be fetched, the
+                       listing would be incomplete otherwise
+    :return: Generator of items matching search query
+    :rtype: generator, nailgun.entities.item
+    """
     if not item:
       item = self.new_item()
-    if "full_result" in kwargs and not kwargs["full_result"]:
-      del kwargs["full_result"]
-    try:
-      per_page = kwargs["per_page"]
-      del kwargs["per_page"]
-    except KeyError:
-      per_page = 1000
-    operator = " = "
-    try:
-      if kwargs["operator"] == "not":
-        operator = " != "
-      elif kwargs["operator"] == "like":
-        operator = " ~ "
-      del kwargs["operator"]
-    except KeyError:
-      pass
-    # Takes kwargs, quote them if necessary and join them
-    quoted_values = map(lambda x: '"' + str(x) + '"' if type(x) != int else str(x),
-                        kwargs.values())
-    search_string = " AND " .join(map(operator.join,
-                                      dict(zip(kwargs, quoted_values)).items()))
-    query = {'per_page': per_page, 'search': search_string}
+    limit = kwargs.pop("limit", None)
+    records = kwargs.pop("records", False)
+    query = self.search_query(**kwargs)
+    if limit:
+      query["per_page"] = min(query["per_page"], limit)
     log.debug(f"Searching for {query} on {item}")
-    try:
-      return item.search(query=query)
-    except HTTPError as err:
-      log.error(f"Search Error {err.response.status_code}: "
-                f"{err.response._content}")
+    count = 0
+    page = 1
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      future = executor.submit(self._search_page, item, query, page, records)
+      while future:
+        try:
+          items = future.result()
+        except HTTPError as err:
+          log.error(f"Search Error {err.response.status_code}: "
+                    f"{err.response._content}")
+          # Nothing was returned yet, the search simply found nothing
+          if page == 1:
+            return
+          raise
+        future = None
+        # A full page means there's probably another one
+        if (len(items) == query["per_page"]
+            and (not limit or count + len(items) < limit)):
+          page += 1
+          future = executor.submit(self._search_page, item, query, page,
+                                   records)
+        for i in items:
+          yield i
+          count += 1
+          if limit and count >= limit:
+            return
+
+  def _search_page(self, item, query, page, records=False):
+    with self.profile("search"):
+      if not records:
+        return item.search(query={**query, "page": page})
+      results = item.search_json(query={**query, "page": page})["results"]
+    return self.to_records(item, results)
+
+  def to_records(self, item, results):
+    """Converts search results to read-only records
+
+    :param item: Entity the search was run on
+    :type item: nailgun.entities.item
+    :param results: json results of the search
+    :type results: list, dict
+    :return: Records
+    :rtype: list, forge.records.Record
+    """
+    row = record_type(item)
+    return [row(self._cfg.server_config, **attrs)
+            for attrs in item.search_normalize(results)]
+
+  async def asearch(self, item=None, **kwargs):
+    """Async version of search(), used by the async engine (see forge.aio).
+    The pages are fetched concurrently.
+
+    :param kwargs: Same as search()
+    :param item: Use a specific entity to run the search
+    :type item: nailgun.entities.item
+    :return: List of items matching search query
+    :rtype: list, nailgun.entities.item
+    """
+    if not item:
+      item = self.new_item()
+    limit = kwargs.pop("limit", None)
+    records = kwargs.pop("records", False)
+    return await self.asearch_query(item, self.search_query(**kwargs), limit,
+                                    records)
+
+  async def asearch_query(self, item, query, limit=None, records=False):
+    """asearch() with a query already built, see search_query()
 
-  def nailrun(self, item, action, **kwargs):
+    :param item: Entity to run the search on
+    :type item: nailgun.entities.item
+    :param query: Search query
+    :type query: dict
+    :param limit: Maximum number of items to return, defaults to all of them
+    :type limit: int, optional
+    :param records: Returns read-only records, defaults to False
+    :type records: bool, optional
+    :return: List of items matching search query
+    :rtype: list, nailgun.entities.item
+    """
+    log.debug(f"Searching for {query} on {item}")
+    results = await self._cfg.aio.search(item, query, limit)
+    if records:
+      return self.to_records(item, results)
+    # Same as nailgun's search()
+    return [type(item)(self._cfg.server_config, **result)
+            for result in item.search_normalize(results)]
+
+  async def aread(self, item):
+    """Async version of nailgun's read()
+
+    :param item: Entity to read, with an id
+    :type item: nailgun.entities.item
+    :return: The item read from the satellite
+    :rtype: nailgun.entities.item
+    """
+    return item.read(attrs=await self._cfg.aio.read(item))
+
+  async def acreate(self, item):
+    """Async version of create()
+
+    :param item: Entity to create
+    :type item: nailgun.entities.item
+    :return: The created item
+    :rtype: nailgun.entities.item
+    """
+    if self.planned("create", item):
+      return item
+    self.log_item("Creating", item)
+    attrs = await self._cfg.aio.create(item)
+    return await self.aread(type(item)(self._cfg.server_config, id=attrs["id"]))
+
+  async def aupdate(self, item, fields=None):
+    """Async version of nailgun's update()
+
+    :param item: Entity to update
+    :type item: nailgun.entities.item
+    :param fields: Names of the fields to update, defaults to all of them
+    :type fields: list, optional
+    :return: The updated item
+    :rtype: nailgun.entities.item
+    """
+    if self.planned("update", item):
+      return item
+    self.log_item("Updating", item)
+    await self._cfg.aio.update(item, fields)
+    return await self.aread(item)
+
+  def search_query(self, **kwargs):
+    """Converts the search() keywords into a search query
+
+    :param kwargs: See search()
+    :return: Query passed to nailgun's search
+    :rtype: dict
+    """
+    per_page = kwargs.pop("per_page", 1000)
+    params = dict(kwargs.pop("params", {}))
+    if kwargs.pop("full_result", False):
+      params["full_result"] = True
+    query = kwargs.pop("query", None)
+    # The keywords are compared with the operator, all of them have to match
+    search = Query(kwargs.pop("operator", None), **kwargs)
+    if query and search:
+      search = search & query
+    elif query:
+      search = query
+    return {**params, 'per_page': per_page, 'search': str(search)}
+
+  def nailrun(self, item, action, raise_errors=False, **kwargs):
     """ executes a CUD command on an entity
 
     :param item: Entity to run the command
     :type item: nailgun.entities.item
     :param action: Action to perform (create, update, delete)
     :type action: str
+    :param raise_errors: Raise when the action is rejected or skipped instead
+                         of logging it, defaults to False
+    :type raise_errors: bool, optional
     :raises Exception: Unknown exception
+    :raises RuntimeError: If the action failed, with raise_errors
     :return: The new version of the item
     :rtype: nailgun.entities.item
     """
+    if self.planned(action, item, kwargs.get("data")):
+      return item
     executed = False
     response = None
+    # Why the action wasn't executed
+    failed = None
     while not executed:
       try:
-        response = getattr(item, action)(**kwargs)
+        with self.profile(action):
+          response = getattr(item, action)(**kwargs)
         log.debug(f"Response: {response}")
         executed = True
       except HTTPError as err:
@@ -292,9 +513,21 @@ class Base(object):
                        f" Progress: {round(float(task.progress) * 100, 2)}%")
               if task.state == "paused":
                 log.error("Task is in paused state, skipping job")
+                failed = f"locked by paused task {task.id}"
                 executed = True
               else:
-                sleep(5)
+                # Retry as soon as the locking task is done
+                start = time()
+                try:
+                  self._cfg.task_watcher.wait(
+                    task.id, self._cfg.task_watcher.timeout,
+                    must_succeed=False)
+                except Exception as wait_err:
+                  log.error(f"Not retrying {action} on {self.entity}: "
+                            f"{wait_err}")
+                  failed = f"locked by task {task.id}: {wait_err}"
+                  executed = True
+                self.profile_lock_wait(time() - start)
             else:
               log.error(f"{self.entity} locked: {err.response._content}")
             pass
@@ -302,28 +535,43 @@ class Base(object):
                 in str(err.response._content)):
             # We skip here because the item is going to be there a bit later
             log.error(f"Task timeout, skipping: {err.response._content}")
+            failed = "foreman task timeout"
             executed = True
             pass
         else:
           log.error(f"Error running {action} on {self.entity}: "
                     f"{err.response.status_code}  {err.response._content}")
           log.debug(f"Item: {item.__dict__}")
+          failed = f"{err.response.status_code} {err.response._content}"
           executed = True
         pass
       except entity_mixins.TaskTimedOutError as err:
         log.error("TaskTimedOutError raised")
         log.exception(err)
+        if raise_errors:
+          raise
         return item
       except Exception as err:
         log.error(f"Unknown exception {err}: {item}")
         log.error(f"Unknown exception {err}: (dict) {item.__dict__}")
         log.exception(err)
         raise Exception
+    if failed and raise_errors:
+      raise RuntimeError(f"{action} {self.entity} failed: {failed}")
     if response:
       return response
     else:
       return item
 
+  def profile_lock_wait(self, seconds):
+    """Records the time spent waiting on other tasks, when profiling
+
+    :param seconds: Time waited
+    :type seconds: float
+    """
+    if self._cfg.profiler:
+      self._cfg.profiler.lock_wait(self.entity, seconds)
+
   def get_task(self, key, value):
     """Returns a task based on key/value
 
@@ -357,10 +605,9 @@ class Base(object):
     """Blocking loop that checks for any running tasks.
     The loop breaks when there are no more running tasks.
     """
-    tasks = ["running tasks"]
+    log.info("Looking if there's still running tasks...")
+    tasks = self.get_tasks("state", "running")
     while len(tasks):
-      log.info("Looking if there's still running tasks...")
-      tasks = self.get_tasks("state", "running")
       for task in tasks:
         log.warning(
           f"{task.id}: {task.label} Started {task.started_at}, "
@@ -373,7 +620,20 @@ class Base(object):
               log.info(f"{k}: {v['name']}")
             except (KeyError, TypeError):
               pass
-      sleep(5)
+      start = time()
+      watcher = self._cfg.task_watcher
+      futures = {task.id: watcher.watch(task.id) for task in tasks}
+      _, pending = wait(futures.values(), timeout=watcher.timeout)
+      for task_id, future in futures.items():
+        if future in pending:
+          watcher.forget(task_id, future)
+      if len(pending):
+        log.warning(f"{len(pending)} tasks still running after "
+                    f"{watcher.timeout}s")
+      self.profile_lock_wait(time() - start)
+      # Other tasks might have started in the meantime
+      log.info("Looking if there's still running tasks...")
+      tasks = self.get_tasks("state", "running")
 
   def create(self, item, attribute_converter={}):
     """Wraps around the create_or_update to build the config_keys
@@ -424,19 +684,101 @@ class Base(object):
       search_string[self._search_key] = getattr(item, self._search_key)
     if hasattr(item, "product_id"):
       search_string["product_id"] = item.product_id
-    items = self.search(search_item, **search_string)
+    items = []
+    if len(search_string) == 1 and self._search_key in self._index:
+      # get_all() already fetched the current state, no need to search again
+      found = self._index[self._search_key].get(search_string[self._search_key])
+      items = [found] if found else []
+    if not len(items):
+      # Not cached, or created since get_all(), the satellite knows
+      items = self.search(search_item, **search_string)
     if len(items):
       if len(items) > 1:
         log.warning(f"Found more than one item matching {search_string}, "
                     "taking the first.")
 
       old_item = items[0]
-      self.log_item("create", item, "Item is already present, updating")
-      log.debug(f"Old item: {old_item.__dict__}")
-      old_item.__dict__.update(item.__dict__)
-      log.debug(f"Resulting item: {old_item.__dict__}")
-      self.item = self.nailrun(old_item, "update")
+      changes = self.diff(old_item, item)
+      if not len(changes):
+        self.log_item("create", item, "Item is already up to date")
+        result = old_item
+      else:
+        self.log_item("create", item, f"Item is already present, updating "
+                                      f"{', '.join(changes)}")
+        if self.planned("update", item, changes):
+          result = old_item
+        else:
+          log.debug(f"Old item: {old_item.__dict__}")
+          old_item.__dict__.update(item.__dict__)
+          log.debug(f"Resulting item: {old_item.__dict__}")
+          result = self.nailrun(old_item, "update")
     else:
       log.debug(f"No item found matching {search_string}")
-      self.item = self.nailrun(item, "create")
-    return self.item
+      if self.planned("create", item):
+        result = item
+      else:
+        result = self.nailrun(item, "create")
+    # self.item is shared by the jobs running concurrently, the caller gets
+    # its own item
+    self.item = result
+    return result
+
+  def diff(self, old_item, item):
+    """Compares the attributes set on an item with the ones of the item
+    currently on the satellite.
+
+    :param old_item: Entity as returned by the satellite
+    :type old_item: nailgun.entities.item
+    :param item: Entity with the attributes we want
+    :type item: nailgun.entities.item
+    :return: Attributes that differ, as {attribute: (old, new)}
+    :rtype: dict
+    """
+    changes = {}
+    # nailgun drops the attributes that aren't entity fields when searching,
+    # those can't be compared and are only sent along with the other changes
+    fields = old_item.get_fields()
+    for key, value in item.__dict__.items():
+      if (key.startswith("_") or key == "id" or key not in fields
+          or key in self._diff_ignore_keys):
+        continue
+      if not hasattr(old_item, key):
+        # We can't tell if it changed, the satellite didn't return it
+        changes[key] = (None, value)
+        continue
+      old_value = getattr(old_item, key)
+      if self._comparable(old_value) != self._comparable(value):
+        changes[key] = (old_value, value)
+    return changes
+
+  def _comparable(self, value):
+    if isinstance(value, (entity_mixins.Entity, Record)):
+      return getattr(value, "id", None)
+    if isinstance(value, (list, tuple, set)):
+      return sorted(map(self._comparable, value), key=str)
+    if value is None:
+      return None
+    value = str(value)
+    # configparser gives us "True", the satellite returns true
+    if value.lower() in ("true", "false"):
+      return value.lower()
+    return value
+
+  def planned(self, action, item, changes=None):
+    """Records an action in the plan instead of running it, when running
+    with --plan
+
+    :param action: Action we're about to run (ex: create, update, publish)
+    :type action: str
+    :param item: Entity item, or its name
+    :type item: nailgun.entities.item or str
+    :param changes: Changes or data sent, defaults to None
+    :type changes: dict, optional
+    :return: True if the action must be skipped
+    :rtype: bool
+    """
+    if not self._cfg.plan:
+      return False
+    name = getattr(item, "name", None) or getattr(item, "id", None) or item
+    self._cfg.plan.add(action, self.entity, str(name), changes)
+    return True
@@ -1,24 +1,27 @@
-import sys
-from re import match, sub
-from time import sleep
+from functools import partial, reduce
+from hashlib import sha1
+from json import dumps
+from operator import or_
+from os import path
+from re import compile as re_compile, sub
 
 from alive_progress import alive_bar
+from forge.config import load_module
 from forge.entities.base import Base
 from forge.entities.contentviewfilterrule import ContentViewFilterRules
-from forge.entities.dockercontentviewfilter import \
-    DockerContentViewFilters  # noqa: F401,E501
-from forge.entities.erratumcontentviewfilter import \
-    ErratumContentViewFilters  # noqa: F401,E501
+from forge.entities.contentviewversion import ContentViewVersions
 from forge.entities.lifecycle_environment import LifecycleEnvironments
-from forge.entities.modulestreamcontentviewfilter import \
-    ModuleStreamContentViewFilters  # noqa: F401,E501
 from forge.entities.organization import Org
 from forge.entities.repository import Repositories
 from forge.entities.repository_set import RepositorySets
-from forge.entities.rpmcontentviewfilter import \
-    RPMContentViewFilters as RpmContentViewFilters  # noqa: F401,E501
+from forge.query import Query
+from forge.scheduler import Scheduler
 from logzero import logger as log
 
+# Name of the CVs generated by forge, see ContentViews.get_cv_name()
+cv_name = re_compile(r"^(?P<cv_type>CV RHEL|CV Container|CCV) (?P<tag>\S+) "
+                     r"(?P<release>\S+)-(?P<zrelease>[^\s-]+)$")
+
 
 class ContentViews(Base):
   """Forged ContentViews object.
@@ -29,6 +32,18 @@ class ContentViews(Base):
   :return: List of ContentView entities
   :rtype: list
   """
+  # Prefix of the fingerprint stored in the description of published versions
+  fingerprint_prefix = "forge fingerprint: "
+  # Module and class of the forged filters, by filter type. They're only
+  # loaded when a CV uses that type of filter.
+  filter_classes = {
+    "docker": ("dockercontentviewfilter", "DockerContentViewFilters"),
+    "erratum": ("erratumcontentviewfilter", "ErratumContentViewFilters"),
+    "module_stream": ("modulestreamcontentviewfilter",
+                      "ModuleStreamContentViewFilters"),
+    "rpm": ("rpmcontentviewfilter", "RPMContentViewFilters"),
+  }
+
   def __init__(self, cfg, org):
     """Class initialization
 
@@ -38,10 +53,48 @@ class ContentViews(Base):
     :type org: forge.entities.Org
     """
     self.entity = "ContentView"
+    self.republish = False
+    # CVs generated by forge, by (type, tag, release, zrelease) and by release
+    # then zrelease, built by get_all()
+    self.names = {}
+    self.releases = {}
+    # Versions returned by the searches, by CV id
+    self.versions = {}
     super().__init__(cfg, org)
 
-  def create_all(self, releases, promote_only, composite_only, force=False):
-    """Loops through the configured releases and generates the ContenViews
+  def _search_page(self, item, query, page, records=False):
+    # nailgun only keeps the ids of the versions, their number and
+    # environments are kept to find the latest one without reading the CV
+    with self.profile("search"):
+      results = item.search_json(query={**query, "page": page})["results"]
+    for result in results:
+      if "versions" in result:
+        self.versions[result["id"]] = result["versions"]
+    if records:
+      return self.to_records(item, results)
+    return [type(item)(self._cfg.server_config, **attrs)
+            for attrs in item.search_normalize(results)]
+
+  def index_items(self):
+    """Also indexes the CVs generated by forge by the parts of their name,
+    see get_cv_name()
+    """
+    super().index_items()
+    self.names = {}
+    self.releases = {}
+    for item in self.items:
+      key = self.parse_cv_name(item.name)
+      if not key:
+        continue
+      self.names.setdefault(key, item)
+      _, _, release, zrelease = key
+      self.releases.setdefault(release, {}).setdefault(zrelease, []).append(item)
+
+  def create_all(self, releases, promote_only, composite_only, force=False,
+                 jobs=None, republish=False):
+    """Builds the publish and promote graph of the configured releases and
+    runs it through the Scheduler.
+    CV publish -> CCV publish -> promote per lifecycle environment
 
     :param releases: List of releases generated by make/base:read_releases
     :type releases: list
@@ -51,124 +104,287 @@ class ContentViews(Base):
     :type composite_only: bool
     :param force: Runs operation even if tasks are still running. Defaults to False
     :type force: bool, optional
+    :param jobs: Maximum number of concurrent jobs, defaults to the
+                 `publish_jobs` setting
+    :type jobs: int, optional
+    :param republish: Publish even if the inputs of the CVs didn't change,
+                      defaults to False
+    :type republish: bool, optional
     """
-    self.created_cvs = []
+    if not force:
+      self.block_by_running_tasks()
+    self.republish = republish
+    # ContentView entities shared between the nodes of the graph, by name
+    self.published = {}
+    # Names of the CVs that would be published, with --plan
+    self.planned_publishes = set()
+    self.envs = self.get_promote_envs()
+    # The CVs that already exist, the CCVs are built from the index
+    self.get_all()
+    scheduler = Scheduler(self._cfg, jobs)
     for release in releases:
       r = releases[release]
-      if not force:
-        self.block_by_running_tasks()
+      cv_nodes = {}
       if not composite_only:
-        if not promote_only:
-          self.create_rhel_cvs(r, release)
+        if promote_only:
+          self.promote_existing_cvs(scheduler, r, release)
+        else:
+          cv_nodes = self.create_rhel_cvs(scheduler, r, release)
           if r["container"]:
-            self.create_container_cvs(r, release)
-        self.promote_all(releases, force=force)
+            for zrelease, node in self.create_container_cvs(scheduler, r,
+                                                            release).items():
+              cv_nodes.setdefault(zrelease, []).append(node)
       if composite_only or (not promote_only and r["container"]):
-        self.create_composite_cvs(r, release)
-        self.promote_all(releases, composites=True, force=force)
+        self.create_composite_cvs(scheduler, r, release, cv_nodes)
+    log.info(f"Running {len(scheduler)} publish and promote jobs, "
+             f"{scheduler.jobs} at a time")
+    with alive_bar(len(scheduler), title="Publishing CVS") as bar:
+      scheduler.run(bar)
     print("Content views recreated. Make sure you update the container-prepare-"
           "parameters.yaml files because the content-view version is part of the "
           "container repository url in satellite. This can be done with forger:")
     print("./forger.py make container-prepare --help")
 
-  def create_rhel_cvs(self, r, release):
-    """Function to create the RHEL CVs with erratum date filter
+  def create_rhel_cvs(self, scheduler, r, release):
+    """Schedules the creation of the RHEL CVs with erratum date filter
     and RPMs without Errata, based on the cvs and zdates sections
     of the configuration
 
+    :param scheduler: Scheduler running the publish and promote graph
+    :type scheduler: forge.scheduler.Scheduler
     :param r: Sub dictionnary from the releases dict
     :type r: dict
     :param release: Release name (OSP10, OSP13, OSP16.1, etc)
     :type release: str
+    :return: Publish node names, by zrelease
+    :rtype: dict
     """
     repos = RepositorySets(self._cfg, self.org).get_by_labels(r["labels"]
                                                .split(","))
-    with alive_bar(len(r["zdates"].items()) * 4, title="RHEL CVS") as bar:
-      for zrelease, date in r["zdates"].items():
-        if zrelease == "latest":
-          continue
-        # For some reason, configparser lowers everything like this
-        zrelease = "GA" if zrelease == "ga" else zrelease
-        self.log_bar(f"Generating RHEL CV {release}-{zrelease}", bar)
-        self.generate_cv("RHEL", r, release, zrelease, repos=repos)
-        self.log_bar(f"Deleting existing filters {release}-{zrelease}", bar)
-        # self.delete_filters(self.item, "erratum")
-        # self.delete_filters(self.item, "rpm")
-        self.log_bar(f"Adding filters {release}-{zrelease}", bar)
-        if date != "latest":
-          self.generate_filter("erratum", self.item, repos, date=date)
-          self.generate_filter("rpm", self.item, repos)
-          self.generate_filter("module_stream", self.item, repos)
-        self.log_bar(f"Publishing {release}-{zrelease}", bar)
-        self.item.publish(
-          synchronous=self._cfg.satellite.getboolean("async_publish"),
-          timeout=3600)
-        self.created_cvs.append(self.item)
-
-  def create_container_cvs(self, r, release):
-    """Function to create the Container CVs based on the cvs, and containertags
-    sections of the configuration
+    nodes = {}
+    for zrelease, date in r.get("zdates", {}).items():
+      if zrelease == "latest":
+        continue
+      # For some reason, configparser lowers everything like this
+      zrelease = "GA" if zrelease == "ga" else zrelease
+      name = self.get_cv_name("CV RHEL", r, release, zrelease)
+      nodes[zrelease] = [scheduler.add(
+        f"Publish {name}",
+        partial(self.publish_rhel_cv, r, release, zrelease, date, repos))]
+      self.schedule_promote(scheduler, name, nodes[zrelease][0], 600)
+    return nodes
+
+  def publish_rhel_cv(self, r, release, zrelease, date, repos):
+    """Generates a RHEL CV with its filters and publishes it
 
     :param r: Sub dictionnary from the releases dict
     :type r: dict
     :param release: Release name (OSP10, OSP13, OSP16.1, etc)
     :type release: str
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :param date: Erratum date, or "latest" to skip the filters
+    :type date: str
+    :param repos: List of RepositorySet entities
+    :type repos: list
+    :return: Publish foreman task, None if the CV is up to date
+    :rtype: dict
+    """
+    # Each node works on its own forged object because self.item is
+    # overwritten on every create.
+    cvs = ContentViews(self._cfg, self.org)
+    cv = cvs.generate_cv("RHEL", r, release, zrelease, repos=repos)
+    if date != "latest":
+      cvs.generate_filter("erratum", cv, repos, date=date)
+      cvs.generate_filter("rpm", cv, repos)
+      cvs.generate_filter("module_stream", cv, repos)
+    return self.publish_cv(cv, "RHEL", sorted(repo.id for repo in repos), date)
+
+  def create_container_cvs(self, scheduler, r, release):
+    """Schedules the creation of the Container CVs based on the cvs, and
+    containertags sections of the configuration
+
+    :param scheduler: Scheduler running the publish and promote graph
+    :type scheduler: forge.scheduler.Scheduler
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    :return: Publish node name, by zrelease
+    :rtype: dict
     """
     repos = Repositories(self._cfg, self.org).get_containers(release)
-    with alive_bar(len(r["zstream"]) * 4, title="Container CVS") as bar:
-      for zrelease in r["zstream"]:
-        self.log_bar(f"Generating Container CV {release}-{zrelease}", bar)
-        self.generate_cv("Container", r, release, zrelease, repos=repos)
-        self.log_bar(f"Deleting existing filters {release}-{zrelease}", bar)
-        # self.delete_filters(self.item, "docker")
-        self.log_bar(f"Adding filters {release}-{zrelease}", bar)
-        for repo in repos:
-          openstack_repo_name = f"openstack-{repo.name}"
-          try:
-            tag = r["zstream"][zrelease][f"openstack-{repo.name}"]
-          except KeyError:
-            try:
-              tag = r["zstream"][zrelease][repo.name]
-            except KeyError:
-              log.warning(
-                f"{openstack_repo_name} is not in the zstream tag list for "
-                f"{release}-{zrelease}, no filter generated.")
-              continue
-          version = f"{release}{zrelease}".replace("z", ".").replace("OSP", "")
-          self.generate_filter("docker", self.item, [repo], tag=tag,
-            default_tag=version)
-        self.log_bar(f"Publishing {release}-{zrelease}", bar)
-        self.item.publish(
-          synchronous=self._cfg.satellite.getboolean("async_publish"))
-        self.created_cvs.append(self.item)
-
-  def create_composite_cvs(self, r, release):
-    """ Creates all the composite content views based
+    nodes = {}
+    for zrelease in r["zstream"]:
+      name = self.get_cv_name("CV Container", r, release, zrelease)
+      nodes[zrelease] = scheduler.add(
+        f"Publish {name}",
+        partial(self.publish_container_cv, r, release, zrelease, repos))
+      self.schedule_promote(scheduler, name, nodes[zrelease], 1800)
+    return nodes
+
+  def publish_container_cv(self, r, release, zrelease, repos):
+    """Generates a Container CV with its docker filters and publishes it
+
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :param repos: List of container Repository entities
+    :type repos: list
+    :return: Publish foreman task, None if the CV is up to date
+    :rtype: dict
+    """
+    cvs = ContentViews(self._cfg, self.org)
+    cv = cvs.generate_cv("Container", r, release, zrelease, repos=repos)
+    tags = {}
+    for repo in repos:
+      openstack_repo_name = f"openstack-{repo.name}"
+      try:
+        tag = r["zstream"][zrelease][f"openstack-{repo.name}"]
+      except KeyError:
+        try:
+          tag = r["zstream"][zrelease][repo.name]
+        except KeyError:
+          log.warning(
+            f"{openstack_repo_name} is not in the zstream tag list for "
+            f"{release}-{zrelease}, no filter generated.")
+          continue
+      version = f"{release}{zrelease}".replace("z", ".").replace("OSP", "")
+      cvs.generate_filter("docker", cv, [repo], tag=tag, default_tag=version)
+      tags[repo.id] = [tag, version]
+    return self.publish_cv(cv, "Container", sorted(repo.id for repo in repos),
+                           tags)
+
+  def create_composite_cvs(self, scheduler, r, release, cv_nodes={}):
+    """Schedules the creation of all the composite content views based
     on the information we have in r, matchin release
 
+    :param scheduler: Scheduler running the publish and promote graph
+    :type scheduler: forge.scheduler.Scheduler
     :param r: Sub dictionnary from the releases dict
     :type r: dict
     :param release: Release name (OSP10, OSP13, OSP16.1, etc)
     :type release: str
+    :param cv_nodes: Publish node names of the component CVs, by zrelease,
+                     defaults to {}
+    :type cv_nodes: dict, optional
     """
-    self.get_all()
-    with alive_bar(len(r["zstream"]) * 3, title="Composite CVS") as bar:
-      for zrelease in r["zstream"]:
-        cvvs = []
-        for cv in self.items:
-          if match(rf"CV .*{release}-{zrelease}$", cv.name):
-            log.debug(f"Adding {cv.name} to CCV")
-            cvvs.append(cv.version[-1])
-        if len(cvvs):
-          self.log_bar(f"Generating CCV {release}-{zrelease}", bar)
-          self.generate_cv("CCV", r, release, zrelease, cvvs=cvvs)
-          self.log_bar(f"Publishing {release}-{zrelease}", bar)
-          self.item.publish(synchronous=False)
-          self.created_cvs.append(self.item)
-        else:
-          log.warning(f"No Content views found for {release}-{zrelease}")
-          bar("Skipped")
-          bar("Skipped")
+    for zrelease in r["zstream"]:
+      name = self.get_cv_name("CCV", r, release, zrelease)
+      node = scheduler.add(f"Publish {name}",
+                           partial(self.publish_composite_cv, r, release,
+                                   zrelease),
+                           deps=cv_nodes.get(zrelease, []))
+      self.schedule_promote(scheduler, name, node, 1800)
+
+  def publish_composite_cv(self, r, release, zrelease):
+    """Generates a CCV from the latest version of the matching CVs
+    and publishes it if one of these versions changed
+
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :raises LookupError: If there's no CV for that zrelease
+    :return: Publish foreman task, None if the CCV is up to date
+    :rtype: dict
+    """
+    cvs = ContentViews(self._cfg, self.org)
+    cvvs = []
+    # CVs whose publish is only planned, with --plan
+    planned = []
+    for cv_type in ["CV RHEL", "CV Container"]:
+      name = self.get_cv_name(cv_type, r, release, zrelease)
+      # Published in this run, or already on the satellite
+      cv = self.published.get(name) or self.find_cv(cv_type, r["tag"], release,
+                                                     zrelease)
+      if not cv:
+        continue
+      if name in self.planned_publishes:
+        # The version it would publish doesn't exist, the CV might not either
+        planned.append(name)
+        continue
+      cvv = self.get_latest_version(cv)
+      if cvv:
+        log.debug(f"Adding {cv.name} to CCV")
+        cvvs.append(cvv)
+    if not len(cvvs) and not len(planned):
+      raise LookupError(f"No Content views found for {release}-{zrelease}")
+    ccv = cvs.generate_cv("CCV", r, release, zrelease, cvvs=cvvs)
+    if len(planned):
+      # A new version of a component means a new version of the CCV
+      self.published[ccv.name] = ccv
+      self.planned("publish", ccv, {"components": planned})
+      self.planned_publishes.add(ccv.name)
+      return
+    return self.publish_cv(ccv, "CCV", sorted(cvv.id for cvv in cvvs))
+
+  def publish_cv(self, cv, *inputs):
+    """Publishes a ContentView, unless its latest version was published from
+    the same inputs. The fingerprint of the inputs is stored in the
+    description of the published version.
+
+    :param cv: ContentView entity
+    :type cv: nailgun.entity.ContentView
+    :param inputs: Everything the content of the CV depends on (repositories,
+                   erratum date, tags, component versions...)
+    :type inputs: json serializable
+    :return: Publish foreman task, None if the CV is up to date
+    :rtype: dict
+    """
+    self.published[cv.name] = cv
+    fingerprint = self.fingerprint_prefix + self.fingerprint(*inputs)
+    # With --plan, the CV might not exist yet
+    if not self.republish and getattr(cv, "id", None):
+      latest = self.get_latest_version(cv)
+      if latest and latest.read_json().get("description") == fingerprint:
+        log.info(f"{cv.name} is up to date, not publishing")
+        return
+    if self.planned("publish", cv):
+      self.planned_publishes.add(cv.name)
+      return
+    log.info(f"Publishing {cv.name}")
+    # The versions of the search don't have the new one
+    self.versions.pop(cv.id, None)
+    return cv.publish(synchronous=False, data={"description": fingerprint})
+
+  def fingerprint(self, *inputs):
+    """Returns a fingerprint of the inputs of a ContentView
+
+    :param inputs: json serializable values
+    :type inputs: list
+    :return: sha1 of the inputs
+    :rtype: str
+    """
+    return sha1(dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+  def promote_existing_cvs(self, scheduler, r, release):
+    """Schedules the promotion of the latest version of the existing,
+    non-composite, ContentViews of a release
+
+    :param scheduler: Scheduler running the publish and promote graph
+    :type scheduler: forge.scheduler.Scheduler
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    """
+    zreleases = [z.lower() for z in list(r.get("zdates", {}))
+                 + list(r.get("zstream", {}))]
+    for cv in self.get_by_releases(release, composite=False):
+      # we need to skip the default content view
+      if cv.id <= 1:
+        continue
+      if cv.name.split("-")[-1].lower() not in zreleases:
+        continue
+      self.published[cv.name] = cv
+      timeout = 1800 if "CV Container" in cv.name else 600
+      self.schedule_promote(scheduler, cv.name, None, timeout)
 
   def delete_filters(self, cv, filter_type):
     """ Deletes all the filters associated with a ContentView
@@ -217,7 +433,7 @@ class ContentViews(Base):
     else:
       item.repository = repos
       cv_type = "CV " + cv_type
-    item.name = f"{cv_type} {r['tag']} {release}-{zrelease}"
+    item.name = self.get_cv_name(cv_type, r, release, zrelease)
     item.label = sub(r'[\s]+|\.', '_', item.name)
     log.debug(f"Creating CV {item.name}")
     for repo in repos:
@@ -257,7 +473,8 @@ class ContentViews(Base):
     for repo in repos:
       log.debug(f"Adding repo {repo.label}")
     cvf.item = cvf.create(cvf.item)
-    if date or tag:
+    # With --plan, a filter that doesn't exist yet has no rules to look at
+    if (date or tag) and getattr(cvf.item, "id", None):
       self.generate_filter_rules(cvf.item, cv, date, tag)
       if tag and default_tag != tag:
         self.generate_filter_rules(cvf.item, cv, date, default_tag)
@@ -290,7 +507,8 @@ class ContentViews(Base):
     cvfr.create(cvfr.item)
     return cvfr.item
 
-  def get_by_releases(self, releases, zreleases=[]):
+  def get_by_releases(self, releases, zreleases=[], refresh=True,
+                      composite=None):
     """ Returns the list of ContentView entities matching a list of releases
     and optionnaly zreleases
 
@@ -299,18 +517,85 @@ class ContentViews(Base):
     :param zreleases: List of zreleases to look for (ex: ['z1', 'z2]),
                       defaults to []
     :type zreleases: list, optional
+    :param refresh: Search the satellite again instead of using the items
+                    already loaded, defaults to True
+    :type refresh: bool, optional
+    :param composite: Only the composite CVs if True, only the others if
+                      False, defaults to None, all of them
+    :type composite: bool, optional
     :return: List of ContentView entities
     :rtype: list, nailgun.entity.ContentView
     """
-    self.get_all()
-    if type(releases) is dict:
-      cv_list = self.filter_items_by_names(self.items, releases.keys())
-    elif type(releases) is str:
-      cv_list = list(filter(lambda x: releases in x.name.split()[-1], self.items))
-    if len(zreleases):
-      cv_list = self.filter_items_by_names(cv_list, zreleases)
+    if type(releases) is str:
+      releases = [releases]
+    candidates = self.items
+    if refresh or not len(self.items):
+      # Only the CVs of these releases are fetched, the names are matched
+      # exactly below
+      names = [f"{release}-{zrelease}" for release in releases
+               for zrelease in zreleases] or [f" {r}-" for r in releases]
+      if not len(names):
+        return []
+      query = reduce(or_, [Query(name=name, operator="like") for name in names])
+      if composite is not None:
+        query = query & Query(composite=composite)
+      candidates = self.get_all(query=query)
+    cv_list = []
+    for release in releases:
+      for cv in candidates:
+        key = self.parse_cv_name(cv.name)
+        if (key and key[2] == release
+            and (not len(zreleases) or key[3] in zreleases)):
+          cv_list.append(cv)
+    if composite is not None:
+      cv_list = [cv for cv in cv_list if bool(cv.composite) == composite]
     return cv_list
 
+  def find_cv(self, cv_type, tag, release, zrelease):
+    """Returns a CV generated by forge from the ones loaded by get_all()
+
+    :param cv_type: Either "CV RHEL", "CV Container" or "CCV"
+    :type cv_type: str
+    :param tag: Tag of the release
+    :type tag: str
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :return: ContentView entity, None if it doesn't exist
+    :rtype: nailgun.entity.ContentView
+    """
+    return self.names.get((cv_type, tag, release, zrelease))
+
+  def parse_cv_name(self, name):
+    """Splits the name of a CV generated by forge, see get_cv_name()
+
+    :param name: ContentView name
+    :type name: str
+    :return: (type, tag, release, zrelease), None if forge didn't generate it
+    :rtype: tuple
+    """
+    matched = cv_name.match(name or "")
+    if not matched:
+      return None
+    return matched.group("cv_type", "tag", "release", "zrelease")
+
+  def get_cv_name(self, cv_type, r, release, zrelease):
+    """Returns the name of a ContentView
+
+    :param cv_type: Either "CV RHEL", "CV Container" or "CCV"
+    :type cv_type: str
+    :param r: Sub dictionnary from the releases dict
+    :type r: dict
+    :param release: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type release: str
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :return: ContentView name
+    :rtype: str
+    """
+    return f"{cv_type} {r['tag']} {release}-{zrelease}"
+
   def get_cvf_obj(self, filter_type):
     """Generates a forged FilterTypeContentViewFilters object
 
@@ -319,8 +604,9 @@ class ContentViews(Base):
     :return: New forged FilterTypeContentViewFilters object
     :rtype: forge.entities.FilterTypeContentViewFilters
     """
-    return getattr(sys.modules[__name__],
-      f"{self.camel_case(filter_type)}ContentViewFilters")(self._cfg)
+    module, class_name = self.filter_classes[filter_type]
+    return load_module(path.dirname(path.realpath(__file__)), module,
+                       class_name)(self._cfg)
 
   def camel_case(self, value):
     """Converts a string to CamelCase name for easy import.
@@ -334,65 +620,180 @@ class ContentViews(Base):
     """
     return "".join(list(map(lambda m: m.capitalize(), value.split("_"))))
 
-  def get_created_cvs_names(self):
-    return ", ".join([x.name for x in self.created_cvs])
+  def get_promote_envs(self):
+    """Returns the lifecycle environments we promote to, in path order
 
-  def filter_items_by_names(self, items, name_list):
-    return list(filter(lambda x: len([x for y in name_list
-                                      if y in x.name.split()[-1]]),
-                                      items))
-
-  def promote_all(self, releases, composites=False, force=False):
-    """Promotes all the created ContentViews to all environments.
-    If self.created_cvs list is empty, all matching ContentViews are
-    promoted.
-
-    :param releases: List of releases generated by make/base:read_releases
-    :type releases: list
-    :param composites: Only promote composite content-views, defaults to False
-    :type composites: bool, optional
-    :param force: Runs operation even if tasks are still running. Defaults to False
-    :type force: bool, optional
+    :return: List of LifecycleEnvironment entities
+    :rtype: list, nailgun.entity.LifecycleEnvironment
     """
-    log.info("Promoting all published content_views")
     envs = LifecycleEnvironments(self._cfg, self.org)
-    envs.get_all()
+    envs.get_all(records=True)
     envs.items.sort(key=lambda x: x.id)
-    envs.items.pop(0)
-    if not hasattr(self, "created_cvs") or not self.created_cvs:
-      log.warning("Didn't find the list of created ContentViews, promoting "
-                  "them all")
-      self.created_cvs = self.get_by_releases(releases)
-    # we need to remove the default content view
-    self.created_cvs = list(filter(lambda x: x.id > 1, self.created_cvs))
-    # Filter wether or not we want to promote CCVs.
-    self.created_cvs = list(filter(lambda x: x.composite == composites,
-                                   self.created_cvs))
+    # Library is the first environment and it's not promotable
+    return envs.items[1:]
+
+  def schedule_promote(self, scheduler, name, publish_node, timeout):
+    """Schedules the promotion of a ContentView to every lifecycle environment,
+    one environment after the other.
+
+    :param scheduler: Scheduler running the publish and promote graph
+    :type scheduler: forge.scheduler.Scheduler
+    :param name: ContentView name
+    :type name: str
+    :param publish_node: Name of the node publishing this ContentView,
+                         None if it's already published
+    :type publish_node: str
+    :param timeout: Maximum time to wait for each promotion
+    :type timeout: int
+    """
+    prior = publish_node
+    for env in self.envs:
+      prior = scheduler.add(f"Promote {name} to {env.name}",
+                            partial(self.promote_cv, name, env),
+                            deps=[prior] if prior else [], timeout=timeout)
+
+  def promote_cv(self, name, env):
+    """Promotes the latest version of a ContentView to an environment
+
+    :param name: ContentView name, as stored in self.published
+    :type name: str
+    :param env: LifecycleEnvironment entity
+    :type env: nailgun.entity.LifecycleEnvironment
+    :raises LookupError: If the ContentView has no version
+    :raises RuntimeError: If the satellite rejected the promotion
+    :return: Promote foreman task, None if the version is already there
+    :rtype: dict
+    """
+    cv = self.published[name]
+    if name in self.planned_publishes:
+      # Published with --plan, there's no version to look at yet
+      self.planned("promote", cv, {"environment": env.name})
+      return
+    cv_version = self.get_latest_version(cv)
+    if cv_version is None:
+      raise LookupError(f"{name} has no version to promote")
+    if env.id in [e.id for e in cv_version.environment]:
+      log.info(f"{name} version {cv_version.id} is already in {env.name}")
+      return
+    if self.planned("promote", cv, {"environment": env.name}):
+      return
+    log.debug(f"Promoting {name} (version_id {cv_version.id}) to {env.name}")
+    return self.nailrun(cv_version, "promote", raise_errors=True,
+                        synchronous=False,
+                        data={u'environment_ids': [env.id], u'force': True})
+
+  def prune_all(self, cvs, jobs=None, force=False):
+    """Deletes ContentViews with their versions and activation keys, through
+    the Scheduler. Each CV is torn down in this order:
+    activation keys -> versions and environments -> ContentView
+    The versions of a CV are only removed once the CCVs using them are
+    deleted, CVs used by a CCV that isn't pruned are left untouched. The CVs
+    that don't depend on each other are torn down concurrently.
+
+    :param cvs: ContentView entities to delete, from get_all()
+    :type cvs: list, nailgun.entity.ContentView
+    :param jobs: Maximum number of concurrent jobs, defaults to the
+                 `publish_jobs` setting
+    :type jobs: int, optional
+    :param force: Runs operation even if tasks are still running. Defaults to False
+    :type force: bool, optional
+    :return: List of the failed or skipped job names
+    :rtype: list
+    """
+    from forge.entities.activationkey import ActivationKeys
     if not force:
       self.block_by_running_tasks()
+    pruned = {cv.id: cv for cv in cvs}
+    # The CCVs reference the versions of their components
+    owners = {v["id"]: cv_id for cv_id in pruned
+              for v in self.versions.get(cv_id, [])}
+    used_by = {}
+    for ccv in self.search(None, composite=True):
+      for component in ccv.component or []:
+        if component.id in owners:
+          used_by.setdefault(owners[component.id], []).append(ccv)
+    aks = ActivationKeys(self._cfg, self.org)
+    keys = {}
+    if len(pruned):
+      for ak in aks.search(None, content_view_id=list(pruned)):
+        keys.setdefault(ak.content_view.id, []).append(ak)
+    scheduler = Scheduler(self._cfg, jobs)
+    skipped = []
+    for cv in pruned.values():
+      kept = sorted({c.name for c in used_by.get(cv.id, [])
+                     if c.id not in pruned})
+      if len(kept):
+        log.error(f"Skipping {cv.name}, it's used by {', '.join(kept)}")
+        skipped.append(f"Delete {cv.name}")
+        continue
+      deps = [f"Delete {c.name}" for c in used_by.get(cv.id, [])]
+      if cv.id in keys:
+        deps.append(scheduler.add(
+          f"Delete the activation keys of {cv.name}",
+          partial(self.delete_activation_keys, aks, keys[cv.id])))
+      versions = self.versions.get(cv.id, [])
+      if len(versions):
+        timeout = 1800 if cv.composite or "CV Container" in cv.name else 600
+        deps = [scheduler.add(f"Remove the versions of {cv.name}",
+                              partial(self.remove_versions, cv, versions),
+                              deps=deps, timeout=timeout)]
+      scheduler.add(f"Delete {cv.name}",
+                    partial(self.nailrun, cv, "delete", raise_errors=True),
+                    deps=deps)
+    log.info(f"Running {len(scheduler)} prune jobs, {scheduler.jobs} at a "
+             "time")
+    with alive_bar(len(scheduler), title="Pruning CVS") as bar:
+      return skipped + scheduler.run(bar)
+
+  def delete_activation_keys(self, aks, keys):
+    """Deletes the activation keys of a ContentView
+
+    :param aks: Forged ActivationKeys
+    :type aks: forge.entities.ActivationKeys
+    :param keys: ActivationKey entities
+    :type keys: list, nailgun.entity.ActivationKey
+    """
+    for ak in keys:
+      aks.nailrun(ak, "delete", raise_errors=True)
 
-    log.debug(f"Promoting these CVS: {self.get_created_cvs_names()}")
-    initial_length = len(self.created_cvs)
-    with alive_bar(initial_length * 2, title="Promoting CVS") as bar:
-      while len(self.created_cvs):
-        for cv in self.created_cvs[:]:
-          ccv = cv.read()
-          if len(ccv.version):
-            cv_version = sorted(list(map(lambda x: x.read(), ccv.version)),
-                                          key = lambda x: float(x.version))[-1]
-            envs_id = list(map(lambda x: x.id, envs.items))
-            log.debug(
-              f"Promoting {cv.name} (version_id {cv_version.id})"
-              f" to {envs_id}")
-            timeout = 600
-            if cv.composite or "CV Container" in cv.name:
-              timeout = 1800
-            self.log_bar(f"Promoting {cv.name}", bar)
-            self.nailrun(cv_version, "promote", timeout=timeout,
-                         data={u'environment_ids': envs_id, u'force': True})
-            self.log_bar(f"Promoted {cv.name}", bar)
-            self.created_cvs.remove(cv)
-        if len(self.created_cvs):
-          log.info(f"Waiting for these CVS: {self.get_created_cvs_names()}")
-          sleep(3)
-    log.info("Promotion completed")
+  def remove_versions(self, cv, versions):
+    """Removes all the versions of a ContentView from all their environments
+    and deletes them, with a single foreman task
+
+    :param cv: ContentView entity
+    :type cv: nailgun.entity.ContentView
+    :param versions: Versions json, as returned by the search of the CV
+    :type versions: list
+    :return: Remove foreman task, None with --plan
+    :rtype: dict
+    """
+    data = {"content_view_version_ids": [v["id"] for v in versions],
+            "environment_ids": sorted({e for v in versions
+                                       for e in v.get("environment_ids", [])})}
+    if self.planned("remove", cv, data):
+      return
+    log.debug(f"Removing versions {data['content_view_version_ids']} of "
+              f"{cv.name} from environments {data['environment_ids']}")
+    # nailgun has no binding for the bulk remove endpoint
+    return self._raw_req("put", f"content_views/{cv.id}/remove", data,
+                         results=False)
+
+  def get_latest_version(self, cv):
+    """Returns the latest version of a ContentView, by version number. The
+    versions returned by the last search are used when the CV wasn't
+    published since, otherwise the CV is read.
+
+    :param cv: ContentView entity
+    :type cv: nailgun.entity.ContentView
+    :return: ContentViewVersion entity, with the environments it's in,
+             None if the CV was never published
+    :rtype: nailgun.entity.ContentViewVersion
+    """
+    versions = self.versions.get(cv.id)
+    if versions is None:
+      versions = cv.read_json()["versions"]
+    if not len(versions):
+      return None
+    latest = max(versions, key=lambda x: float(x["version"]))
+    return ContentViewVersions(self._cfg).new_item(
+      id=latest["id"], environment=latest.get("environment_ids", []))
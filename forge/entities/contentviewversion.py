@@ -18,3 +18,28 @@ class ContentViewVersions(Base):
     """
     self.entity = "ContentViewVersion"
     super().__init__(cfg)
+
+  def get_by_cv(self, cv_id, per_page=1000):
+    """Returns the versions of a ContentView, with one search instead of one
+    read per version. The json is returned as is, it has the environments
+    with their host and activation key counts.
+
+    :param cv_id: ContentView ID
+    :type cv_id: int
+    :param per_page: Number of versions per page, defaults to 1000
+    :type per_page: int, optional
+    :return: Versions json
+    :rtype: list
+    """
+    item = self.new_item()
+    versions = []
+    page = 1
+    while True:
+      with self.profile("search"):
+        results = item.search_json(query={"content_view_id": cv_id,
+                                          "per_page": per_page,
+                                          "page": page})["results"]
+      versions.extend(results)
+      if len(results) < per_page:
+        return versions
+      page += 1
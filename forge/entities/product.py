@@ -50,5 +50,5 @@ class Products(Base):
         Repositories(self._cfg, self.org).create_container_repo(product.id,
                                            prefix, container)
 
-    if sync:
+    if sync and not self.planned("sync", self.item):
       self.item.sync(synchronous=self._cfg.satellite.getboolean("async_sync"))
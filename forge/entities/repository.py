@@ -12,6 +12,8 @@ class Repositories(Base):
   """
   def __init__(self, cfg, org):
     self.entity = "Repository"
+    # The satellite never returns the password
+    self._diff_ignore_keys = ["upstream_password"]
     super().__init__(cfg, org)
 
   def get_containers(self, r):
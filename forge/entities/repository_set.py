@@ -1,9 +1,14 @@
+from functools import partial
+
 from logzero import logger as log
 
 from forge.entities.base import Base
+from forge.entities.product import Products
+from forge.entities.repository import Repositories
 from requests.exceptions import HTTPError
 from alive_progress import alive_bar
 from forge.entities.syncplan import SyncPlans
+from forge.scheduler import Scheduler
 
 import json
 
@@ -39,19 +44,35 @@ class RepositorySets(Base):
             log.error(f"Repository labeled {label} is not found. Skipping")
             continue
           if not rh_repo:
-            self._repos[label] = [r.read() for r in repo[0].repositories]
+            search_item = Repositories(self._cfg, self.org).new_item()
+            self._repos[label] = [self._cfg.cache.read(r, search_item)
+                                  for r in repo[0].repositories]
           else:
             self._repos[label] = repo
         repos.append(self._repos[label][0])
     return repos
 
   def get_enabled(self):
-    self.get_all()
-    return list(filter(lambda x: len(x.repositories), self.items))
+    # The satellite only returns the reposets with repositories
+    return self.search(None, params={"enabled": True})
+
+  def enable_all(self, sync=False, jobs=None):
+    """Enables the configured repository sets, assigns their product to a sync
+    plan and optionally syncs it. Independent calls run concurrently through
+    the Scheduler, products are updated once all their reposets are enabled.
 
-  def enable_all(self, sync=False):
+    :param sync: Also sync the products, defaults to False
+    :type sync: bool, optional
+    :param jobs: Number of calls running concurrently, defaults to the
+                 `publish_jobs` setting
+    :type jobs: int, optional
+    """
     sync_plans = SyncPlans(self._cfg, self.org)
     plan_map = sync_plans.get_plan_map("daily")
+    named_plans = {}
+    # Current sync plan of the products, to skip the updates that are no-ops
+    current_products = Products(self._cfg, self.org)
+    current_products.get_all()
     planinc = 0
 
     for section in self._cfg.config:
@@ -60,50 +81,107 @@ class RepositorySets(Base):
         config_keys = dict(self._cfg.config.items(section))
         log.debug(config_keys)
         products = json.loads(config_keys["list"])
-        multiplier = 5 if sync else 4
         repos = self.get_by_labels(list(map(lambda x: x["repository_set"],
           products)), True)
-        with alive_bar(len(products) * multiplier,
-          title="Enabling repo-sets") as bar:
-          for i in products:
-            self.log_bar(f"Getting reposet {i['repository_set']}", bar)
-            filtered_repos = list(filter(lambda x: x.label == i["repository_set"],
-              repos))
-            log.debug(f"Filtered repos: {filtered_repos}")
-            if not len(filtered_repos):
-              log.warning(f"Skipping {i['repository_set']}")
-              for x in range(multiplier - 1):
-                bar("Skipping")
-              continue
-            repo = filtered_repos[0]
-            self.log_bar(f"Looking for repo-set: {repo.label}", bar)
-            if len(repo.repositories) == 0:
-              attributes = {"basearch": config_keys["arch"],
-                            "organization_id": self.org.item.id}
-              if "releasever" in i:
-                attributes["releasever"] = i["releasever"]
-              log.debug(f"Enabling {self.entity} {attributes}")
-              try:
-                self.log_bar(f"Enabling {repo.label}", bar)
-                repo.enable(data=attributes)
-              except HTTPError as err:
-                if err.response.status_code == 409:
-                  log.warning(f"{self.entity} {repo.label} already enabled...")
-                else:
-                  log.error(f"Error creating {self.entity}: "
-                            f"{err.response.status_code} {err.response._content}")
-            else:
-              log.debug("Repository {repo.label} already enabled")
-              self.log_bar(f"Skipped {repo.label}", bar)
-            self.log_bar("Updating sync plan", bar)
-            if "daily" in i["sync_plan"]:
+        scheduler = Scheduler(self._cfg, jobs)
+        # Product updates wait for all the enable calls of their reposets
+        product_deps = {}
+        product_plans = {}
+        for i in products:
+          filtered_repos = list(filter(lambda x: x.label == i["repository_set"],
+            repos))
+          log.debug(f"Filtered repos: {filtered_repos}")
+          if not len(filtered_repos):
+            log.warning(f"Skipping {i['repository_set']}")
+            continue
+          repo = filtered_repos[0]
+          deps = product_deps.setdefault(repo.product.id, [])
+          if len(repo.repositories) == 0:
+            attributes = {"basearch": config_keys["arch"],
+                          "organization_id": self.org.item.id}
+            if "releasever" in i:
+              attributes["releasever"] = i["releasever"]
+            deps.append(scheduler.add(f"Enable {repo.label}",
+                                      partial(self.enable, repo, attributes)))
+          else:
+            log.debug(f"Repository {repo.label} already enabled")
+          # The daily plans are assigned round-robin, in configuration order,
+          # so the assignment doesn't depend on the execution order.
+          plan_id = None
+          if "daily" in i["sync_plan"]:
+            if plan_map:
               planinc += 1
-              plan_id = plan_map[planinc % 6]
-            else:
-              plan_id = sync_plans.get(i["sync_plan"]).id
-            repo.product.sync_plan_id = plan_id
-            repo.product.update()
-            if sync:
-              self.log_bar(f"Syncing {repo.label}", bar)
-              repo.product.sync(
-                synchronous=self._cfg.satellite.getboolean("async_sync"))
+              plan_id = plan_map[planinc % len(plan_map)]
+          else:
+            if i["sync_plan"] not in named_plans:
+              plan = sync_plans.get(i["sync_plan"])
+              named_plans[i["sync_plan"]] = plan.id if plan else None
+            plan_id = named_plans[i["sync_plan"]]
+          if plan_id is None:
+            log.error(f"Sync plan {i['sync_plan']} not found, run 'make init' "
+                      f"first. Keeping the sync plan of {repo.label}")
+          # When reposets share a product, the last one wins
+          product_plans[repo.product.id] = (repo.product, plan_id)
+        for product_id, (product, plan_id) in product_plans.items():
+          current = current_products.find(product_id, "id")
+          current_plan_id = None
+          if current and current.sync_plan:
+            current_plan_id = current.sync_plan.id
+          if plan_id is None:
+            plan_id = current_plan_id
+          if current_plan_id == plan_id and not sync:
+            log.debug(f"Product {product_id} already uses sync plan {plan_id}")
+            continue
+          scheduler.add(f"Update product {product_id}",
+                        partial(self.update_product, product, plan_id, sync,
+                                current_plan_id),
+                        deps=product_deps[product_id])
+        with alive_bar(len(scheduler), title="Enabling repo-sets") as bar:
+          scheduler.run(bar)
+
+  def enable(self, repo, attributes):
+    """Enables a repository set
+
+    :param repo: RepositorySet entity
+    :type repo: nailgun.entity.RepositorySet
+    :param attributes: basearch, releasever and organization_id
+    :type attributes: dict
+    """
+    log.debug(f"Enabling {self.entity} {repo.label} {attributes}")
+    if self.planned("enable", repo, attributes):
+      return
+    try:
+      repo.enable(data=attributes)
+    except HTTPError as err:
+      if err.response.status_code == 409:
+        log.warning(f"{self.entity} {repo.label} already enabled...")
+      else:
+        log.error(f"Error creating {self.entity}: "
+                  f"{err.response.status_code} {err.response._content}")
+
+  def update_product(self, product, plan_id, sync=False, current_plan_id=None):
+    """Sets the sync plan of a product and optionally syncs it
+
+    :param product: Product entity
+    :type product: nailgun.entity.Product
+    :param plan_id: SyncPlan ID
+    :type plan_id: int
+    :param sync: Also sync the product, defaults to False
+    :type sync: bool, optional
+    :param current_plan_id: SyncPlan ID currently used by the product, the
+                            product isn't updated if it matches,
+                            defaults to None
+    :type current_plan_id: int, optional
+    :return: Sync foreman task, when we wait for the sync to complete
+    :rtype: dict
+    """
+    products = Products(self._cfg, self.org)
+    if (plan_id != current_plan_id and not products.planned(
+        "update", product, {"sync_plan_id": (current_plan_id, plan_id)})):
+      product.sync_plan_id = plan_id
+      product.update()
+    if sync and not products.planned("sync", product):
+      log.info(f"Syncing product {product.id}")
+      task = product.sync(synchronous=False)
+      if self._cfg.satellite.getboolean("async_sync"):
+        return task
@@ -18,6 +18,8 @@ class Settings(Base):
 
   def set(self, setting, value):
     if setting.value != value:
+      if self.planned("update", setting, {"value": (setting.value, value)}):
+        return
       log.info(f"Updating setting {setting.name} with {value}")
       setting.value = value
       setting.update()
@@ -13,22 +13,48 @@ class Subscriptions(Base):
   """
   def __init__(self, cfg, **kwargs):
     self.entity = "Subscription"
+    # Subscription ids attached to each activation key, by activation key id.
+    # None when the satellite doesn't list the activation keys of the
+    # subscriptions
+    self.activation_keys = None
     super().__init__(cfg, **kwargs)
 
+  def _search_page(self, item, query, page, records=False):
+    # nailgun drops the activation keys of the subscriptions, they're kept to
+    # find the subscriptions already attached without a call per key
+    with self.profile("search"):
+      results = item.search_json(query={**query, "page": page})["results"]
+    for result in results:
+      if "activation_keys" not in result:
+        continue
+      if self.activation_keys is None:
+        self.activation_keys = {}
+      for ak in result["activation_keys"]:
+        self.activation_keys.setdefault(ak["id"], set()).add(
+          result["subscription_id"])
+    if records:
+      return self.to_records(item, results)
+    return [type(item)(self._cfg.server_config, **attrs)
+            for attrs in item.search_normalize(results)]
+
   def get_all_subs(self):
     self.get_all()
     sub_list = []
     for i in self.items:
       try:
-        sub = i.subscription.read()
+        sub = self._cfg.cache.read(i.subscription, self.new_item())
       # The insights repos doesn't contain a product_provided field
       # so it breaks here
       except MissingValueError:
         continue
       sub_list.append(sub)
     self.sub_items = sub_list
+    # Inverted index of the subscriptions providing each product
+    self.product_index = {}
+    for sub in sub_list:
+      for product_id in set(map(lambda x: x.id, sub.provided_product)):
+        self.product_index.setdefault(product_id, []).append(sub)
     return sub_list
 
   def get_subs_for_product(self, product):
-    return list(filter(lambda x: product.id in map(lambda y: y.id,
-      x.provided_product), self.sub_items))
+    return list(self.product_index.get(product.id, []))
@@ -1,6 +1,7 @@
 from datetime import date, datetime, time, timedelta
 
 from forge.entities.base import Base
+from forge.query import Query
 
 
 class SyncPlans(Base):
@@ -19,6 +20,8 @@ class SyncPlans(Base):
 
   def __init__(self, cfg, org):
     self.entity = "SyncPlan"
+    # The sync date is computed from today, it changes on every run
+    self._diff_ignore_keys = ["sync_date"]
     super().__init__(cfg, org)
 
   def next_day(self, weekday, hour):
@@ -27,8 +30,7 @@ class SyncPlans(Base):
     return now + timedelta(days=day_shift)
 
   def get_by_interval(self, interval):
-    self.get_all()
-    return list(filter(lambda x: x.interval == interval, self.items))
+    return self.get_all(query=Query(interval=interval))
 
   def get_plan_map(self, interval):
     return list(map(
@@ -36,6 +38,7 @@ class SyncPlans(Base):
       SyncPlans(self._cfg, self.org).get_by_interval(interval)))
 
   def create_all(self):
+    self.get_all()
     for section in self._cfg.config:
       if section.startswith("syncplans"):
         name = "-".join(section.split("-")[1:])
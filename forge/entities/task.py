@@ -1,4 +1,7 @@
+import asyncio
+
 from forge.entities.base import Base
+from forge.query import Query
 
 
 class Tasks(Base):
@@ -10,6 +13,53 @@ class Tasks(Base):
   :return: List of ForemanTask entities
   :rtype: list
   """
+  # Number of task ids per search, to keep the query string short
+  chunk_size = 50
+
   def __init__(self, cfg):
     self.entity = "ForemanTask"
     super().__init__(cfg)
+
+  def ids_queries(self, task_ids):
+    """Returns the search queries matching a list of task ids, one per chunk
+
+    :param task_ids: Foreman task IDs
+    :type task_ids: list
+    :return: Search queries
+    :rtype: list, dict
+    """
+    task_ids = list(task_ids)
+    return [self.search_query(query=Query(id=chunk), per_page=len(chunk))
+            for chunk in (task_ids[i:i + self.chunk_size]
+                          for i in range(0, len(task_ids), self.chunk_size))]
+
+  def get_by_ids(self, task_ids, records=False):
+    """Returns the tasks of a list of ids, with one search per chunk of ids
+    instead of one read per task
+
+    :param task_ids: Foreman task IDs
+    :type task_ids: list
+    :param records: Returns read-only records, defaults to False
+    :type records: bool, optional
+    :return: ForemanTask entities, by id
+    :rtype: dict
+    """
+    item = self.new_item()
+    return {task.id: task for query in self.ids_queries(task_ids)
+            for task in self._search_page(item, query, 1, records)}
+
+  async def aget_by_ids(self, task_ids, records=False):
+    """Async version of get_by_ids(), the chunks are searched concurrently
+
+    :param task_ids: Foreman task IDs
+    :type task_ids: list
+    :param records: Returns read-only records, defaults to False
+    :type records: bool, optional
+    :return: ForemanTask entities, by id
+    :rtype: dict
+    """
+    item = self.new_item()
+    pages = await asyncio.gather(*[
+      self.asearch_query(item, query, records=records)
+      for query in self.ids_queries(task_ids)])
+    return {task.id: task for page in pages for task in page}
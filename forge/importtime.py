@@ -0,0 +1,70 @@
+import re
+import subprocess
+import sys
+
+from prettytable import PrettyTable
+
+# Line written by python -X importtime for every module imported
+import_line = re.compile(r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+)"
+                         r" \|(?P<indent>\s+)(?P<module>\S+)$")
+
+
+def timing_imports(argv, top=20):
+  """Runs a forger.py command again with python -X importtime and prints
+  where the import time went once it exits
+
+  :param argv: Command line, without --timing-imports
+  :type argv: list
+  :param top: Number of modules listed, defaults to 20
+  :type top: int, optional
+  :return: Exit code of the command
+  :rtype: int
+  """
+  process = subprocess.Popen([sys.executable, "-X", "importtime"] + argv,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+  imports = []
+  for line in process.stderr:
+    if line.startswith("import time: self"):
+      continue
+    matched = import_line.match(line)
+    if not matched:
+      # Logs and errors of the command
+      sys.stderr.write(line)
+      continue
+    # Nested imports are indented by 2 spaces per level
+    imports.append((matched["module"], (len(matched["indent"]) - 1) // 2,
+                    int(matched["self"]), int(matched["cumulative"])))
+  returncode = process.wait()
+  print(imports_report(imports, top))
+  return returncode
+
+
+def imports_report(imports, top=20):
+  """Formats the slowest imports
+
+  :param imports: (module, level, self, cumulative) of each import, times in
+                  microseconds, as written by python -X importtime
+  :type imports: list
+  :param top: Number of modules listed, defaults to 20
+  :type top: int, optional
+  :return: The report
+  :rtype: str
+  """
+  total = sum(i[3] for i in imports if i[1] == 0)
+  forge = sum(i[2] for i in imports if i[0].split(".")[0] == "forge")
+  x = PrettyTable()
+  x.field_names = ["Module", "Imported by", "Self (ms)", "Cumulative (ms)"]
+  x.align["Module"] = "l"
+  x.align["Imported by"] = "l"
+  # importtime lists the children before their parent
+  parents = {}
+  latest = {}
+  for module, level, _, _ in reversed(imports):
+    latest[level] = module
+    parents[module] = latest[level - 1] if level else "-"
+  for module, level, own, cumulative in sorted(imports, key=lambda i: i[3],
+                                               reverse=True)[:top]:
+    x.add_row([module, parents[module], f"{own / 1000:.1f}",
+               f"{cumulative / 1000:.1f}"])
+  return (f"{x}\n{len(imports)} modules imported in {total / 1000:.0f}ms, "
+          f"{forge / 1000:.0f}ms in forge itself")
@@ -0,0 +1,177 @@
+import gzip
+import logging
+import re
+from threading import Lock
+from time import time
+
+from logzero import logger as log
+
+ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+log_regex = (r"\[ (?P<level>INFO|WARN|ERROR|DEBUG) [\d]{4}-[\d]{1,2}-[\d]{1,2}"
+             r"[T\s][\d]{1,2}:[\d]{1,2}:[\d]{2} verbose\] (?P<line>.*)")
+sat_log = re.compile(log_regex)
+levels = {"DEBUG": logging.DEBUG, "INFO": logging.INFO,
+          "WARN": logging.WARN, "ERROR": logging.ERROR}
+
+
+class LogStream(object):
+  """Logs the output of a command, line by line.
+
+  The output is fed as it's read, lines split across reads are kept until
+  they're complete. The lines of the satellite-installer carry their own log
+  level, the other lines are logged with the level of the stream.
+  """
+  def __init__(self, level=logging.INFO, tee=None):
+    """Class initialization
+
+    :param level: Level of the lines without one, defaults to INFO
+    :type level: int, optional
+    :param tee: Where the raw output is also written to, defaults to None
+    :type tee: forge.logstream.Tee, optional
+    """
+    self.level = level
+    self.tee = tee
+    self.partial = b""
+    self.lines = 0
+
+  def feed(self, data):
+    """Logs the complete lines of a chunk of output
+
+    :param data: Output read from the command
+    :type data: bytes
+    """
+    if self.tee:
+      self.tee.write(data)
+    *lines, self.partial = (self.partial + data).split(b"\n")
+    for line in lines:
+      self.log_line(line)
+
+  def pending(self):
+    """Returns the last line, not terminated yet (ex: a prompt)
+
+    :rtype: str
+    """
+    return self.partial.decode(errors="replace")
+
+  def flush(self):
+    """Logs the line not terminated yet, if any"""
+    if self.partial:
+      self.log_line(self.partial)
+      self.partial = b""
+
+  def log_line(self, line):
+    line = line.decode(errors="replace").rstrip()
+    if "\x1b" in line:
+      line = ansi_escape.sub("", line)
+    if not line:
+      return
+    self.lines += 1
+    level = self.level
+    # Only the installer lines start with "[ ", no need to run the regex
+    # on the others
+    if line.startswith("[ "):
+      matched = sat_log.match(line)
+      if matched:
+        line = matched["line"]
+        if level < logging.ERROR:
+          level = levels[matched["level"]]
+    log.log(level, line, extra={"command_output": True})
+
+
+class ConsoleRateLimit(logging.Filter):
+  """Limits the number of output lines of the commands printed on the console.
+  The log file still gets all of them, warnings and errors always go through.
+
+  The tasks running concurrently share it, so the rate applies to all of
+  their lines. The filter is attached by the first task and detached by the
+  last one.
+  """
+  def __init__(self, rate=20):
+    """Class initialization
+
+    :param rate: Maximum number of lines per second, defaults to 20
+    :type rate: int, optional
+    """
+    super().__init__()
+    self.rate = rate
+    self.window = 0
+    self.count = 0
+    self.skipped = 0
+    self.handlers = []
+    self.users = 0
+    self.lock = Lock()
+
+  def filter(self, record):
+    if (not getattr(record, "command_output", False)
+        or record.levelno >= logging.WARN):
+      return True
+    with self.lock:
+      now = int(time())
+      if now != self.window:
+        self.window = now
+        self.count = 0
+      self.count += 1
+      if self.count > self.rate:
+        self.skipped += 1
+        return False
+    return True
+
+  def attach(self):
+    """Adds the filter to the console handlers of the logger"""
+    with self.lock:
+      self.users += 1
+      if self.users > 1:
+        return
+      self.handlers = [h for h in log.handlers
+                       if isinstance(h, logging.StreamHandler)
+                       and not isinstance(h, logging.FileHandler)]
+      for handler in self.handlers:
+        handler.addFilter(self)
+
+  def detach(self):
+    """Removes the filter from the console handlers"""
+    with self.lock:
+      self.users -= 1
+      if self.users:
+        return
+      for handler in self.handlers:
+        handler.removeFilter(self)
+      self.handlers = []
+      skipped, self.skipped = self.skipped, 0
+    if skipped:
+      log.info(f"{skipped} lines of output were only written to the log file")
+
+
+class Tee(object):
+  """Gzipped file the raw output of the commands is appended to.
+
+  The tasks running concurrently share it, each chunk of output is written
+  whole. The file is opened by the first task and closed by the last one.
+  """
+  def __init__(self, path):
+    """Class initialization
+
+    :param path: Path of the gzipped file
+    :type path: str
+    """
+    self.path = path
+    self.file = None
+    self.users = 0
+    self.lock = Lock()
+
+  def open(self):
+    with self.lock:
+      if not self.users:
+        self.file = gzip.open(self.path, "ab")
+      self.users += 1
+
+  def write(self, data):
+    with self.lock:
+      self.file.write(data)
+
+  def close(self):
+    with self.lock:
+      self.users -= 1
+      if not self.users:
+        self.file.close()
+        self.file = None
@@ -0,0 +1,51 @@
+from threading import Lock
+
+from prettytable import PrettyTable
+
+
+class Plan(object):
+  """Changes forge would apply to the satellite.
+
+  When running with --plan, the forged entities record their creates,
+  updates, deletes and actions (publish, promote, sync...) here instead of
+  sending them, and the plan is printed at exit.
+  """
+  def __init__(self):
+    self.changes = []
+    self._lock = Lock()
+
+  def add(self, action, entity, name, changes=None):
+    """Records a change
+
+    :param action: Action that would be executed (ex: create, update, publish)
+    :type action: str
+    :param entity: Nailgun entity name (ex: ContentView)
+    :type entity: str
+    :param name: Name of the item
+    :type name: str
+    :param changes: Attributes changed, as {attribute: (old, new)}, or the
+                    data that would be sent, defaults to None
+    :type changes: dict, optional
+    """
+    with self._lock:
+      self.changes.append((action, entity, name, changes or {}))
+
+  def report(self):
+    """Prints the planned changes"""
+    if not len(self.changes):
+      print("No changes, the satellite matches the configuration")
+      return
+    x = PrettyTable()
+    x.field_names = ["Action", "Entity", "Name", "Changes"]
+    x.align["Name"] = "l"
+    x.align["Changes"] = "l"
+    for action, entity, name, changes in self.changes:
+      details = []
+      for key, value in changes.items():
+        if isinstance(value, tuple):
+          details.append(f"{key}: {value[0]} -> {value[1]}")
+        else:
+          details.append(f"{key}: {value}")
+      x.add_row([action, entity, name, "\n".join(details)])
+    print(f"{len(self.changes)} planned changes")
+    print(x)
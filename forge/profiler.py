@@ -0,0 +1,151 @@
+import json
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock, local
+from time import time
+from urllib.parse import urlsplit
+
+from prettytable import PrettyTable
+
+# Numeric ids and foreman task uuids are replaced by :id in the endpoints
+id_regex = re.compile(r"/([0-9]+|[0-9a-f]{8}-[0-9a-f\-]{27})(?=/|$)")
+
+
+class Profiler(object):
+  """Records every API call sent to the satellite.
+
+  The calls are recorded by the pooled session and attributed to the forged
+  entity and action running in the same thread. A summary with the top
+  endpoints, the N+1 patterns and the time spent waiting on locks can be
+  printed at exit, and every call can be dumped as json lines.
+  """
+  # Minimum number of distinct ids on an endpoint to call it an N+1 pattern
+  n_plus_one = 5
+
+  def __init__(self, dump_file=None, top=10):
+    """Class initialization
+
+    :param dump_file: Path of the json lines dump, defaults to None
+    :type dump_file: str, optional
+    :param top: Number of endpoints in the summary, defaults to 10
+    :type top: int, optional
+    """
+    self.top = top
+    self.calls = []
+    self.lock_waits = []
+    self.started = time()
+    self._lock = Lock()
+    self._context = local()
+    self._dump = open(dump_file, "w") if dump_file else None
+
+  @contextmanager
+  def context(self, entity, action):
+    """Attributes the calls made by the current thread to an entity
+
+    :param entity: Nailgun entity name (ex: ContentView)
+    :type entity: str
+    :param action: Forge action (ex: search, update)
+    :type action: str
+    """
+    stack = self._context.__dict__.setdefault("stack", [])
+    stack.append((entity, action))
+    try:
+      yield
+    finally:
+      stack.pop()
+
+  def record(self, method, url, status, size, latency, retries=0):
+    """Records an API call
+
+    :param method: HTTP verb
+    :type method: str
+    :param url: Requested URL
+    :type url: str
+    :param status: HTTP status code, None on connection errors
+    :type status: int
+    :param size: Size of the response body, in bytes
+    :type size: int
+    :param latency: Time spent on the call, in seconds
+    :type latency: float
+    :param retries: Number of retries, defaults to 0
+    :type retries: int, optional
+    """
+    path = urlsplit(url).path
+    stack = getattr(self._context, "stack", [])
+    entity, action = stack[-1] if len(stack) else (None, None)
+    call = {"time": time(), "method": method.upper(), "path": path,
+            "endpoint": id_regex.sub("/:id", path), "entity": entity,
+            "action": action, "status": status, "bytes": size,
+            "latency": round(latency, 4), "retries": retries}
+    with self._lock:
+      self.calls.append(call)
+      if self._dump:
+        self._dump.write(json.dumps(call) + "\n")
+
+  def lock_wait(self, entity, seconds):
+    """Records the time spent waiting on a task holding a lock
+
+    :param entity: Nailgun entity name that was locked
+    :type entity: str
+    :param seconds: Time waited
+    :type seconds: float
+    """
+    with self._lock:
+      self.lock_waits.append((entity, seconds))
+      if self._dump:
+        self._dump.write(json.dumps({"time": time(), "lock_wait": entity,
+                                     "latency": round(seconds, 4)}) + "\n")
+
+  def report(self):
+    """Prints the summary of the recorded calls"""
+    if self._dump:
+      self._dump.close()
+      self._dump = None
+    duration = time() - self.started
+    endpoints = defaultdict(lambda: {"count": 0, "time": 0, "bytes": 0,
+                                     "retries": 0, "paths": set()})
+    for call in self.calls:
+      e = endpoints[f"{call['method']} {call['endpoint']}"]
+      e["count"] += 1
+      e["time"] += call["latency"]
+      e["bytes"] += call["bytes"] or 0
+      e["retries"] += call["retries"]
+      e["paths"].add(call["path"])
+    api_time = sum(e["time"] for e in endpoints.values())
+    print(f"{len(self.calls)} API calls in {duration:.1f}s, "
+          f"{api_time:.1f}s spent in API calls")
+    for key, title in (("count", "Top endpoints by count"),
+                       ("time", "Top endpoints by time")):
+      x = PrettyTable()
+      x.field_names = ["Endpoint", "Calls", "Time (s)", "Avg (ms)", "KiB",
+                       "Retries"]
+      x.align["Endpoint"] = "l"
+      for name, e in sorted(endpoints.items(), key=lambda x: x[1][key],
+                            reverse=True)[:self.top]:
+        x.add_row([name, e["count"], f"{e['time']:.2f}",
+                   f"{e['time'] / e['count'] * 1000:.0f}",
+                   f"{e['bytes'] / 1024:.0f}", e["retries"]])
+      print(title)
+      print(x)
+    patterns = [(name, e) for name, e in endpoints.items()
+                if len(e["paths"]) >= self.n_plus_one]
+    if len(patterns):
+      x = PrettyTable()
+      x.field_names = ["Endpoint", "Distinct ids", "Time (s)", "Called from"]
+      x.align["Endpoint"] = "l"
+      for name, e in sorted(patterns, key=lambda x: len(x[1]["paths"]),
+                            reverse=True):
+        callers = {f"{c['entity']}.{c['action']}" for c in self.calls
+                   if f"{c['method']} {c['endpoint']}" == name and c["entity"]}
+        x.add_row([name, len(e["paths"]), f"{e['time']:.2f}",
+                   ", ".join(sorted(callers))])
+      print("N+1 patterns (same endpoint with different ids)")
+      print(x)
+    if len(self.lock_waits):
+      by_entity = defaultdict(float)
+      for entity, seconds in self.lock_waits:
+        by_entity[entity] += seconds
+      waits = ", ".join(f"{entity}: {seconds:.1f}s"
+                        for entity, seconds in by_entity.items())
+      print(f"Lock wait time: {sum(by_entity.values()):.1f}s ({waits})")
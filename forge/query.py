@@ -0,0 +1,95 @@
+class Query(object):
+  """Scoped search expression, run by the satellite instead of filtering the
+  results here. Passed to Base.search() and Base.get_all() as `query`.
+
+  Keywords are compared like in search(), `operator` being "not" or "like":
+    Query(interval="daily")                  interval = "daily"
+    Query(name="OSP13", operator="like")     name ~ "OSP13"
+    Query(id=[1, 2, 3])                      id ^ (1, 2, 3)
+    Query(name=["a", "b"], operator="like")  (name ~ "a" or name ~ "b")
+    Query(version=(2, 5))                    version >= 2 and version <= 5
+    Query(composite=False)                   composite = false
+    Query(last_sync=None)                    null? last_sync
+  Expressions are combined with & and |, and negated with ~.
+  """
+  # Comparison and list operators, like has no list operator
+  operators = {None: ("=", "^"), "not": ("!=", "!^"), "like": ("~", None)}
+
+  def __init__(self, operator=None, **kwargs):
+    """Class initialization
+
+    :param operator: Either "not" or "like", defaults to None, which is "="
+    :type operator: str, optional
+    :param kwargs: Values by field, all of them have to match
+    """
+    if operator not in self.operators:
+      raise ValueError(f"Unknown search operator {operator}")
+    self.clauses = [self.clause(field, value, operator)
+                    for field, value in kwargs.items()]
+    self.joiner = "and"
+
+  def clause(self, field, value, operator=None):
+    compare, contains = self.operators[operator]
+    if value is None:
+      return f"{'set' if operator == 'not' else 'null'}? {field}"
+    if isinstance(value, (list, set, frozenset)) and not contains:
+      if not len(value):
+        raise ValueError(f"No value to compare {field} with")
+      likes = [f"{field} {compare} {self.quote(v)}" for v in value]
+      if len(likes) > 1:
+        return f"({' or '.join(likes)})"
+      return likes[0]
+    if isinstance(value, (list, set, frozenset)):
+      values = ", ".join(self.quote(v, listed=True) for v in value)
+      return f"{field} {contains} ({values})"
+    if isinstance(value, tuple):
+      low, high = value
+      bounds = []
+      if low is not None:
+        bounds.append(f"{field} >= {self.quote(low)}")
+      if high is not None:
+        bounds.append(f"{field} <= {self.quote(high)}")
+      if len(bounds) > 1:
+        return f"({' and '.join(bounds)})"
+      return bounds[0]
+    return f"{field} {compare} {self.quote(value)}"
+
+  def quote(self, value, listed=False):
+    if isinstance(value, bool):
+      return "true" if value else "false"
+    if isinstance(value, (int, float)):
+      return str(value)
+    value = str(value)
+    # The values of a list are only quoted when they have to
+    if listed and value and not any(c in value for c in ' ,()"\\'):
+      return value
+    # Escaped like in scoped_search, a quote would end the value otherwise
+    value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+  def combine(self, other, joiner):
+    query = Query()
+    query.clauses = [f"({self})" if len(self.clauses) > 1 else str(self),
+                     f"({other})" if len(other.clauses) > 1 else str(other)]
+    query.joiner = joiner
+    return query
+
+  def __and__(self, other):
+    return self.combine(other, "and")
+
+  def __or__(self, other):
+    return self.combine(other, "or")
+
+  def __invert__(self):
+    query = Query()
+    query.clauses = [f"not ({self})"]
+    return query
+
+  def __bool__(self):
+    return bool(len(self.clauses))
+
+  def __str__(self):
+    return f" {self.joiner} ".join(self.clauses)
+
+  def __repr__(self):
+    return f"Query({str(self)!r})"
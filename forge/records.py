@@ -0,0 +1,148 @@
+from abc import ABC, abstractmethod
+
+from nailgun.entity_mixins import OneToManyField, OneToOneField
+
+
+class Record(ABC):
+  """Read-only, compact version of a nailgun entity, used by the listings.
+
+  Records only hold the values of the fields, in slots, without the fields
+  metadata nailgun creates for every entity. Anything else (read(), update(),
+  delete(), path()...) hydrates the full nailgun entity on first use and is
+  delegated to it. Use entity() to get that entity and modify it.
+  """
+  __slots__ = ("_server_config", "_entity")
+
+  def __init__(self, server_config):
+    object.__setattr__(self, "_server_config", server_config)
+    object.__setattr__(self, "_entity", None)
+
+  def __getattr__(self, name):
+    # Only called for the attributes that aren't set on the record
+    if name.startswith("_"):
+      raise AttributeError(name)
+    return getattr(self.entity(), name)
+
+  def __setattr__(self, name, value):
+    raise AttributeError(f"{type(self).__name__} records are read-only, "
+                         "modify the entity() instead")
+
+  # Read-only, so copies can share the record (prettytable deep-copies rows)
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+  def entity(self):
+    """Returns the nailgun entity of this record, built on first use
+
+    :return: Nailgun entity
+    :rtype: nailgun.entities.item
+    """
+    if self._entity is None:
+      object.__setattr__(self, "_entity", self._hydrate())
+    return self._entity
+
+  @abstractmethod
+  def _hydrate(self):
+    """Builds the nailgun entity of this record
+
+    :return: Nailgun entity
+    :rtype: nailgun.entities.item
+    """
+
+  def values(self):
+    """Returns the values set on the record, like nailgun's get_values()
+
+    :return: Values by field name
+    :rtype: dict
+    """
+    values = {}
+    for name in self.__slots__:
+      try:
+        values[name] = object.__getattribute__(self, name)
+      except AttributeError:
+        pass
+    return values
+
+  def __repr__(self):
+    # Same as nailgun, so the listings print the same thing
+    values = ", ".join(f"{key}={value!r}" for key, value in self.values().items()
+                       if not key.startswith("_"))
+    return f"nailgun.entities.{self._entity_class.__name__}({values})"
+
+
+class Ref(Record):
+  """Relation of a record, only its id is known"""
+  __slots__ = ("id", "_entity_class")
+
+  def __init__(self, server_config, entity_class, id):
+    super().__init__(server_config)
+    object.__setattr__(self, "_entity_class", entity_class)
+    object.__setattr__(self, "id", id)
+
+  def _hydrate(self):
+    return self._entity_class(self._server_config, id=self.id)
+
+
+class Row(Record):
+  """Base class of the record types generated by record_type()"""
+  __slots__ = ()
+  _entity_class = None
+  # Related entity class and whether it's a list, by field name
+  _relations = {}
+
+  def __init__(self, server_config, **attrs):
+    """Class initialization
+
+    :param server_config: Nailgun server configuration
+    :type server_config: nailgun.config.ServerConfig
+    :param attrs: Attributes normalized by nailgun's search_normalize()
+    """
+    super().__init__(server_config)
+    for name, value in attrs.items():
+      if name in self._relations and value is not None:
+        entity_class, many = self._relations[name]
+        if many:
+          value = [Ref(server_config, entity_class, i) for i in value]
+        else:
+          value = Ref(server_config, entity_class, value)
+      object.__setattr__(self, name, value)
+
+  def _hydrate(self):
+    values = self.values()
+    relations = {name: values.pop(name) for name in self._relations
+                 if name in values}
+    entity = self._entity_class(self._server_config, **values)
+    # Some relations can't be built from an id alone (ex: the components of a
+    # ContentView), the refs are kept as is, nailgun only uses their id.
+    for name, value in relations.items():
+      setattr(entity, name, value)
+    return entity
+
+
+# Generated record types, by nailgun entity class
+record_types = {}
+
+
+def record_type(item):
+  """Returns the record type of a nailgun entity, generated on first use
+  with a slot per field of the entity
+
+  :param item: Nailgun entity
+  :type item: nailgun.entities.item
+  :return: Record type
+  :rtype: type
+  """
+  entity_class = type(item)
+  if entity_class not in record_types:
+    fields = item.get_fields()
+    relations = {}
+    for name, field in fields.items():
+      if isinstance(field, (OneToOneField, OneToManyField)):
+        relations[name] = (field.gen_value(), isinstance(field, OneToManyField))
+    record_types[entity_class] = type(entity_class.__name__, (Row,), {
+      "__slots__": tuple(fields), "_entity_class": entity_class,
+      "_relations": relations})
+  return record_types[entity_class]
@@ -0,0 +1,243 @@
+import json
+import os
+import re
+from hashlib import sha1
+from tempfile import NamedTemporaryFile
+
+from logzero import logger as log
+
+# Bump when the compiled format changes, older caches are then ignored
+compiled_version = 1
+# Environment variables expanded by forge.config.EnvInterpolation
+env_var = re.compile(r"\$\{?(\w+)")
+# Keys of a release that aren't read from its cvs section
+release_keys = ("container", "containers", "zdates", "zstream")
+# Settings every release needs, and the ones of the container releases
+required = ("tag", "labels", "org")
+required_container = ("container_repo", "container_ceph_prefix")
+
+
+class FrozenDict(dict):
+  """Read-only dict. It's still a dict, so it can be dumped as json."""
+  __slots__ = ()
+
+  def _readonly(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} is read-only")
+
+  __setitem__ = __delitem__ = _readonly
+  clear = pop = popitem = setdefault = update = _readonly
+
+  # Read-only, so copies can share it
+  def __copy__(self):
+    return self
+
+  def __deepcopy__(self, memo):
+    return self
+
+
+class Release(FrozenDict):
+  """One release of the configuration, read-only.
+
+  It's the dict read_releases() always returned: the settings of the cvs-
+  section, `container` as a boolean, the `zdates` and, by z-stream, the tags
+  of the `containertags` sections. `containers` lists every container of the
+  release, container_set has the same names for O(1) lookups.
+  """
+  __slots__ = ("name", "container_set")
+
+  def __init__(self, name, settings, zdates={}, zstream={}, containers=()):
+    """Class initialization
+
+    :param name: Release name (OSP10, OSP13, OSP16.1, etc)
+    :type name: str
+    :param settings: Settings of the cvs section, `container` included
+    :type settings: dict
+    :param zdates: Erratum date by zrelease, defaults to {}
+    :type zdates: dict, optional
+    :param zstream: Tag by container, by zrelease, defaults to {}
+    :type zstream: dict, optional
+    :param containers: Containers of the release, defaults to ()
+    :type containers: tuple, optional
+    """
+    super().__init__(settings, zdates=FrozenDict(zdates),
+                     zstream=FrozenDict((z, FrozenDict(tags))
+                                        for z, tags in zstream.items()),
+                     containers=tuple(containers))
+    self.name = name
+    self.container_set = frozenset(containers)
+
+  def tag(self, zrelease, container):
+    """Returns the tag of a container in a zrelease
+
+    :param zrelease: Zrelease name (z1, z2, etc)
+    :type zrelease: str
+    :param container: Container name
+    :type container: str
+    :return: The tag, None if the container isn't tagged in that zrelease
+    :rtype: str
+    """
+    return self["zstream"].get(zrelease, {}).get(container)
+
+  def select(self, zreleases=[]):
+    """Returns this release with only some zreleases
+
+    :param zreleases: Zreleases kept, all of them if empty, defaults to []
+    :type zreleases: list, optional
+    :rtype: forge.releases.Release
+    """
+    if not len(zreleases):
+      return self
+    zdates = {z: d for z, d in self["zdates"].items()
+              if z == "latest" or z in zreleases}
+    zstream = {z: t for z, t in self["zstream"].items() if z in zreleases}
+    settings = {k: v for k, v in self.items() if k not in release_keys}
+    return Release(self.name, {**settings, "container": self["container"]},
+                   zdates, zstream, self["containers"])
+
+
+class ReleaseModel(object):
+  """All the releases of the configuration, parsed once"""
+  def __init__(self, releases):
+    """Class initialization
+
+    :param releases: Releases, in the order of the configuration
+    :type releases: list
+    """
+    self.releases = FrozenDict((r.name, r) for r in releases)
+
+  def select(self, stack_releases=[], zreleases=[]):
+    """Returns the releases dict of Base.read_releases()
+
+    :param stack_releases: Releases kept, all of them if empty, defaults to []
+    :type stack_releases: list, optional
+    :param zreleases: Zreleases kept, all of them if empty, defaults to []
+    :type zreleases: list, optional
+    :return: Release by name
+    :rtype: dict
+    """
+    return {name: r.select(zreleases) for name, r in self.releases.items()
+            if not len(stack_releases) or name in stack_releases}
+
+  @classmethod
+  def from_config(cls, config):
+    """Parses and validates the cvs, zdates and containertags sections
+
+    :param config: Configuration
+    :type config: configparser.ConfigParser
+    :raises ValueError: When a section is invalid
+    :rtype: forge.releases.ReleaseModel
+    """
+    settings, zdates, zstream, containers = {}, {}, {}, {}
+    for section in config.sections():
+      kind, _, name = section.partition("-")
+      if kind not in ("cvs", "zdates", "containertags") or not name:
+        continue
+      if kind == "cvs":
+        settings[name] = dict(config.items(section))
+        settings[name]["container"] = config[section].getboolean("container")
+        zdates[name], zstream[name], containers[name] = {}, {}, {}
+        continue
+      if kind == "containertags":
+        name, _, zrelease = name.partition("-")
+        if not zrelease:
+          raise ValueError(f"Section {section} has no zrelease, it should be "
+                           f"[containertags-<release>-<zrelease>]")
+      if name not in settings:
+        raise ValueError(f"Section {section} is for an unknown release, "
+                         f"[cvs-{name}] is missing or comes after it")
+      if kind == "zdates":
+        zdates[name].setdefault("latest", "latest")
+        zdates[name].update(config.items(section))
+        continue
+      tags = zstream[name].setdefault(zrelease, {})
+      for container, tag in config.items(section):
+        if container in tags:
+          log.warning(f"Duplicate container in section {section} for "
+                      f"container {container}: {tag} and {tags[container]}. "
+                      "We're using the latter.")
+          continue
+        tags[container] = tag
+        # A dict keeps the order containers are found in
+        containers[name][container] = True
+    for name, s in settings.items():
+      missing = [k for k in required + (required_container if s["container"]
+                                        else ()) if not s.get(k)]
+      if len(missing):
+        raise ValueError(f"Section cvs-{name} is missing {', '.join(missing)}")
+    return cls([Release(name, s, zdates[name], zstream[name], containers[name])
+                for name, s in settings.items()])
+
+  def to_json(self):
+    return {name: {"settings": {k: v for k, v in r.items()
+                                if k not in release_keys or k == "container"},
+                   "zdates": r["zdates"], "zstream": r["zstream"],
+                   "containers": r["containers"]}
+            for name, r in self.releases.items()}
+
+  @classmethod
+  def from_json(cls, data):
+    return cls([Release(name, r["settings"], r["zdates"], r["zstream"],
+                        r["containers"]) for name, r in data.items()])
+
+
+def load_releases(cfg):
+  """Returns the release model of the configuration.
+
+  With `compile_releases` set in the [cache] section, the model is also
+  stored as json next to the metadata cache, and loaded from there while the
+  configuration file and the environment variables it uses are unchanged.
+
+  :param cfg: Configuration object
+  :type cfg: forge.config
+  :raises ValueError: When a section is invalid
+  :rtype: forge.releases.ReleaseModel
+  """
+  if (not cfg.config.has_section("cache")
+      or not cfg.config["cache"].getboolean("compile_releases", False)):
+    return ReleaseModel.from_config(cfg.config)
+  config_file = os.path.realpath(cfg.config_file)
+  cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+  compiled_file = os.path.join(
+    cache_home, "forge", "releases",
+    f"{sha1(config_file.encode()).hexdigest()}.json")
+  stat = os.stat(config_file)
+  try:
+    with open(compiled_file) as f:
+      compiled = json.load(f)
+  except (OSError, ValueError):
+    compiled = {}
+  key = compiled.get("key", {})
+  if (compiled.get("version") == compiled_version
+      and all(os.environ.get(var) == value
+              for var, value in key.get("env", {}).items())):
+    if key["mtime"] == stat.st_mtime_ns and key["size"] == stat.st_size:
+      log.debug(f"Releases loaded from {compiled_file}")
+      return ReleaseModel.from_json(compiled["releases"])
+    # The hash is only computed when the mtime changed (ex: touch, checkout)
+    with open(config_file, "rb") as f:
+      if key["sha1"] == sha1(f.read()).hexdigest():
+        key.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+        store_compiled(compiled_file, compiled)
+        log.debug(f"Releases loaded from {compiled_file}")
+        return ReleaseModel.from_json(compiled["releases"])
+  model = ReleaseModel.from_config(cfg.config)
+  with open(config_file, "rb") as f:
+    content = f.read()
+  env = {var: os.environ.get(var)
+         for var in set(env_var.findall(content.decode(errors="replace")))}
+  store_compiled(compiled_file, {
+    "version": compiled_version,
+    "key": {"mtime": stat.st_mtime_ns, "size": stat.st_size,
+            "sha1": sha1(content).hexdigest(), "env": env},
+    "releases": model.to_json()})
+  log.debug(f"Releases compiled to {compiled_file}")
+  return model
+
+
+def store_compiled(compiled_file, compiled):
+  folder = os.path.dirname(compiled_file)
+  os.makedirs(folder, exist_ok=True)
+  # Write and rename so a concurrent reader never sees a partial file
+  with NamedTemporaryFile("w", dir=folder, delete=False) as f:
+    json.dump(compiled, f)
+  os.replace(f.name, compiled_file)
@@ -0,0 +1,134 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from logzero import logger as log
+
+
+class Node(object):
+  """A unit of work in the Scheduler graph.
+
+  The function can return a foreman task (the json returned by nailgun when
+  running an action with synchronous=False). In that case, the node is
+  considered completed only when that task is stopped.
+  """
+  def __init__(self, name, func, deps=[], timeout=3600):
+    self.name = name
+    self.func = func
+    self.deps = list(deps)
+    self.timeout = timeout
+    self.result = None
+
+
+class Scheduler(object):
+  """Runs a dependency graph of Nodes concurrently.
+
+  Nodes are started as soon as all their dependencies are completed, with at
+  most `jobs` nodes running at the same time. If a node fails, all the nodes
+  depending on it are skipped.
+  """
+  def __init__(self, cfg, jobs=None):
+    """Class initialization
+
+    :param cfg: Configuration object
+    :type cfg: forge.config
+    :param jobs: Maximum number of nodes running concurrently, defaults to the
+                 `publish_jobs` setting of the satellite
+    :type jobs: int, optional
+    """
+    self._cfg = cfg
+    if not jobs:
+      jobs = self._cfg.satellite.getint("publish_jobs", 1)
+    self.jobs = max(1, jobs)
+    self.nodes = {}
+    self.done = []
+    self.failed = []
+
+  def __len__(self):
+    return len(self.nodes)
+
+  def add(self, name, func, deps=[], timeout=3600):
+    """Adds a node to the graph
+
+    :param name: Unique name of the node
+    :type name: str
+    :param func: Callable executed when the dependencies are completed
+    :type func: callable
+    :param deps: Names of the nodes this one depends on, defaults to []
+    :type deps: list, optional
+    :param timeout: Maximum time to wait on the task returned by func,
+                    defaults to 3600
+    :type timeout: int, optional
+    :return: Name of the node
+    :rtype: str
+    """
+    if name in self.nodes:
+      log.warning(f"Node {name} is already scheduled, replacing it")
+    self.nodes[name] = Node(name, func, deps, timeout)
+    return name
+
+  def run(self, bar=None):
+    """Executes the graph and blocks until all the nodes are done
+
+    :param bar: Alive progress bar context, called each time a node is done
+    :type bar: context, optional
+    :return: List of the failed or skipped node names
+    :rtype: list
+    """
+    pending = dict(self.nodes)
+    running = {}
+    with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+      while len(pending) or len(running):
+        for name, node in list(pending.items()):
+          if len(running) >= self.jobs:
+            break
+          if any(dep in self.failed for dep in node.deps):
+            log.error(f"Skipping {name}, a dependency failed")
+            self._finish(pending.pop(name), bar, failed=True)
+          elif all(dep in self.done for dep in node.deps):
+            log.debug(f"Starting {name}")
+            running[executor.submit(self._execute, node)] = pending.pop(name)
+        if not len(running):
+          if len(pending):
+            log.error(f"Unable to satisfy dependencies of {list(pending)}")
+            for node in list(pending.values()):
+              self._finish(pending.pop(node.name), bar, failed=True)
+          break
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+          node = running.pop(future)
+          try:
+            node.result = future.result()
+            self._finish(node, bar)
+          except Exception as err:
+            log.error(f"{node.name} failed: {err}")
+            log.debug(err, exc_info=True)
+            self._finish(node, bar, failed=True)
+    if len(self.failed):
+      log.error(f"These jobs failed or were skipped: {', '.join(self.failed)}")
+    return self.failed
+
+  def _finish(self, node, bar, failed=False):
+    if failed:
+      self.failed.append(node.name)
+    else:
+      self.done.append(node.name)
+    if bar:
+      log.debug(f"{'Failed' if failed else 'Completed'} {node.name}")
+      bar(node.name)
+
+  def _execute(self, node):
+    result = node.func()
+    if isinstance(result, dict) and "id" in result and "state" in result:
+      return self.wait_task(result["id"], node.timeout)
+    return result
+
+  def wait_task(self, task_id, timeout):
+    """Waits for a foreman task to be stopped
+
+    :param task_id: Foreman task ID
+    :type task_id: str
+    :param timeout: Maximum time to wait, in seconds
+    :type timeout: int
+    :return: Task information
+    :rtype: dict
+    """
+    return self._cfg.task_watcher.wait(task_id, timeout)
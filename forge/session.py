@@ -0,0 +1,117 @@
+from time import time
+
+from logzero import logger as log
+from nailgun import client
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SatelliteSession(Session):
+  """Process-wide pooled HTTP session used to talk to the satellite.
+
+  Keeps the TCP/TLS connections alive between requests, so we only pay for
+  the handshake once per pooled connection instead of once per API call.
+  """
+  def __init__(self, auth=None, verify=True, pool_size=10, max_retries=3,
+               backoff_factor=0.5):
+    """Class initialization
+
+    :param auth: (username, password) tuple, defaults to None
+    :type auth: tuple, optional
+    :param verify: Validate the TLS certificate, defaults to True
+    :type verify: bool, optional
+    :param pool_size: Number of connections kept alive, defaults to 10
+    :type pool_size: int, optional
+    :param max_retries: Retries on connection errors and 502/503/504,
+                        defaults to 3
+    :type max_retries: int, optional
+    :param backoff_factor: Backoff factor between retries, defaults to 0.5
+    :type backoff_factor: float, optional
+    """
+    super().__init__()
+    self.auth = auth
+    self.verify = verify
+    # Only idempotent verbs are retried on server errors, we don't want to
+    # publish a content-view twice because a proxy timed out.
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=[502, 503, 504],
+                  allowed_methods=frozenset(["HEAD", "GET", "PUT", "DELETE",
+                                             "OPTIONS"]),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    self.mount("https://", adapter)
+    self.mount("http://", adapter)
+    # forge.profiler.Profiler recording every request, if profiling
+    self.profiler = None
+    log.debug(f"HTTP session created with a pool of {pool_size} connections "
+              f"and {max_retries} retries")
+
+  def request(self, method, url, *args, **kwargs):
+    if not self.profiler:
+      return super().request(method, url, *args, **kwargs)
+    start = time()
+    response = None
+    try:
+      response = super().request(method, url, *args, **kwargs)
+      return response
+    finally:
+      status = size = None
+      retries = 0
+      if response is not None:
+        status = response.status_code
+        size = len(response.content)
+        history = getattr(getattr(response.raw, "retries", None), "history", [])
+        retries = len(history)
+      self.profiler.record(method, url, status, size, time() - start, retries)
+
+
+class NailgunTransport(object):
+  """Mimics the module-level `requests` API used by nailgun.client so that
+  every nailgun entity call goes through our pooled session.
+  """
+  def __init__(self, session):
+    self.session = session
+
+  def request(self, method, url, **kwargs):
+    return self.session.request(method, url, **kwargs)
+
+  def head(self, url, **kwargs):
+    return self.session.head(url, **kwargs)
+
+  def get(self, url, params=None, **kwargs):
+    return self.session.get(url, params=params, **kwargs)
+
+  def post(self, url, data=None, json=None, **kwargs):
+    return self.session.post(url, data=data, json=json, **kwargs)
+
+  def put(self, url, data=None, **kwargs):
+    return self.session.put(url, data=data, **kwargs)
+
+  def patch(self, url, data=None, **kwargs):
+    return self.session.patch(url, data=data, **kwargs)
+
+  def delete(self, url, **kwargs):
+    return self.session.delete(url, **kwargs)
+
+
+def install_session(server_config, pool_size=10, max_retries=3):
+  """Creates the pooled session and routes nailgun's HTTP calls through it.
+  The session is not stored on the ServerConfig: nailgun passes all its
+  attributes to requests through get_client_kwargs().
+
+  :param server_config: Nailgun server configuration
+  :type server_config: nailgun.config.ServerConfig
+  :param pool_size: Number of connections kept alive, defaults to 10
+  :type pool_size: int, optional
+  :param max_retries: Number of retries, defaults to 3
+  :type max_retries: int, optional
+  :return: The pooled session
+  :rtype: forge.session.SatelliteSession
+  """
+  session = SatelliteSession(auth=server_config.auth,
+                             verify=server_config.verify,
+                             pool_size=pool_size, max_retries=max_retries)
+  client.requests = NailgunTransport(session)
+  return session
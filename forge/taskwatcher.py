@@ -0,0 +1,193 @@
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Event, Lock, Thread
+from time import time
+
+from logzero import logger as log
+from nailgun.entity_mixins import TaskFailedError, TaskTimedOutError
+
+from forge.entities.task import Tasks
+
+
+class TaskWatcher(object):
+  """Tracks a set of foreman tasks from a single background thread.
+
+  All the watched tasks are refreshed with one bulk search per tick, and the
+  delay between ticks adapts to the progress reported by the tasks: short
+  when a task is about to complete, longer for tasks that will run for a
+  while. Each waiter gets its own Future, resolved with the task information
+  as soon as the task is stopped or paused. The Futures fail when the task
+  can't be found or when the tasks can't be refreshed anymore.
+  """
+  min_interval = 1
+  max_interval = 30
+  # Consecutive failed refreshes before the waiters are failed
+  max_failures = 5
+
+  def __init__(self, cfg):
+    """Class initialization
+
+    :param cfg: Configuration object
+    :type cfg: forge.config
+    """
+    self._cfg = cfg
+    # Default time to wait for a task, in seconds
+    self.timeout = cfg.satellite.getint("task_timeout", 3600)
+    # Futures of the waiters, by task id
+    self._futures = {}
+    self._failures = 0
+    # (progress, timestamp) of the previous tick, by task id
+    self._progress = {}
+    self._lock = Lock()
+    self._wakeup = Event()
+    self._thread = None
+    # Builds the searches, created once the server configuration is loaded
+    self._tasks = None
+
+  def watch(self, task_id, callback=None):
+    """Starts watching a task
+
+    :param task_id: Foreman task ID
+    :type task_id: str
+    :param callback: Called with the Future when the task is done,
+                     defaults to None
+    :type callback: callable, optional
+    :return: Future resolved with the task information
+    :rtype: concurrent.futures.Future
+    """
+    future = Future()
+    with self._lock:
+      self._futures.setdefault(task_id, []).append(future)
+      if not self._thread:
+        self._thread = Thread(target=self._run, name="TaskWatcher", daemon=True)
+        self._thread.start()
+    if callback:
+      future.add_done_callback(callback)
+    # Check the new task right away instead of waiting for the next tick
+    self._wakeup.set()
+    return future
+
+  def wait(self, task_id, timeout=None, must_succeed=True):
+    """Blocks until a task is stopped or paused
+
+    :param task_id: Foreman task ID
+    :type task_id: str
+    :param timeout: Maximum time to wait, in seconds, defaults to None
+    :type timeout: int, optional
+    :param must_succeed: Raise if the task didn't succeed, defaults to True
+    :type must_succeed: bool, optional
+    :raises TaskTimedOutError: If the task is still running after the timeout
+    :raises TaskFailedError: If the task didn't succeed
+    :raises LookupError: If the task can't be found
+    :return: Task information
+    :rtype: dict
+    """
+    future = self.watch(task_id)
+    try:
+      info = future.result(timeout)
+    except FutureTimeoutError:
+      self.forget(task_id, future)
+      raise TaskTimedOutError(f"Timed out waiting for task {task_id}")
+    if must_succeed and info["result"] != "success":
+      raise TaskFailedError(f"Task {task_id} {info['label']} did not succeed: "
+                            f"{info['humanized']['errors']}")
+    return info
+
+  def forget(self, task_id, future=None):
+    """Stops watching a task for a waiter, the other waiters of the same task
+    keep their Future
+
+    :param task_id: Foreman task ID
+    :type task_id: str
+    :param future: Future returned by watch(), defaults to None, all of them
+    :type future: concurrent.futures.Future, optional
+    """
+    with self._lock:
+      futures = self._futures.get(task_id, [])
+      if future in futures:
+        futures.remove(future)
+      if future is None or not len(futures):
+        self._futures.pop(task_id, None)
+        self._progress.pop(task_id, None)
+
+  def _resolve(self, task_id, result=None, error=None):
+    with self._lock:
+      futures = self._futures.pop(task_id, [])
+      self._progress.pop(task_id, None)
+    for future in futures:
+      if error:
+        future.set_exception(error)
+      else:
+        future.set_result(result)
+
+  def _search(self, task_ids):
+    if not self._tasks:
+      self._tasks = Tasks(self._cfg)
+    item = self._tasks.new_item()
+    results = []
+    for query in self._tasks.ids_queries(task_ids):
+      results.extend(item.search_json(query=query)["results"])
+    return results
+
+  def _run(self):
+    interval = self.min_interval
+    while True:
+      with self._lock:
+        task_ids = list(self._futures)
+        if not len(task_ids):
+          self._thread = None
+          return
+      self._wakeup.clear()
+      try:
+        tasks = self._search(task_ids)
+        self._failures = 0
+      except Exception as err:
+        # Keep the thread alive, the waiters are failed if it keeps failing
+        self._failures += 1
+        log.warning(f"Unable to refresh tasks ({self._failures}/"
+                    f"{self.max_failures}): {err}")
+        if self._failures >= self.max_failures:
+          self._failures = 0
+          for task_id in task_ids:
+            self._resolve(task_id, error=err)
+        self._wakeup.wait(interval)
+        continue
+      running = []
+      found = set()
+      for info in tasks:
+        found.add(info["id"])
+        if info["state"] in ("paused", "stopped"):
+          log.debug(f"Task {info['id']} {info['label']} is {info['state']}")
+          self._resolve(info["id"], info)
+        else:
+          running.append(info)
+      for task_id in set(task_ids) - found:
+        log.error(f"Task {task_id} not found")
+        self._resolve(task_id, error=LookupError(f"Task {task_id} not found"))
+      interval = self._next_interval(running, interval)
+      if len(running):
+        log.debug(f"Watching {len(running)} tasks, next check in {interval:.1f}s")
+      self._wakeup.wait(interval)
+
+  def _next_interval(self, tasks, interval):
+    """Estimates when the next task will complete, based on the progress
+    made since the previous tick. Without progress, we back off.
+    """
+    now = time()
+    estimates = []
+    for info in tasks:
+      progress = float(info.get("progress") or 0)
+      previous = self._progress.get(info["id"])
+      self._progress[info["id"]] = (progress, now)
+      if not previous:
+        # New task, we don't know its rate yet and the back off of the
+        # previous tasks doesn't apply to it
+        estimates.append(self.min_interval)
+      elif progress > previous[0]:
+        rate = (progress - previous[0]) / (now - previous[1])
+        estimates.append((1 - progress) / rate / 2)
+    if len(estimates):
+      interval = min(estimates)
+    else:
+      interval = interval * 1.5
+    return min(max(interval, self.min_interval), self.max_interval)
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3.8
+import atexit
+import sys
 from logging import DEBUG, INFO
 
 import click
@@ -48,14 +50,47 @@ def zreleases_filters(function):
   return function
 
 
+def jobs_option(help):
+  def decorator(function):
+    return click.option("-j", "--jobs", type=int, default=None,
+                        help=f"{help} [default: publish_jobs from config]"
+                        )(function)
+  return decorator
+
+
+def timing_imports(ctx, param, value):
+  if not value or ctx.resilient_parsing:
+    return
+  from forge.importtime import timing_imports
+  ctx.exit(timing_imports([a for a in sys.argv if a != "--timing-imports"]))
+
+
 @click.group()
+@click.option("--timing-imports", is_flag=True, is_eager=True,
+              expose_value=False, callback=timing_imports,
+              help="Runs the command and prints the time spent importing "
+                   "modules. Must be the first option.")
 @click.option("-v", "--verbose", is_flag=True,
               help="Will print debug messages.")
 @click.option("-c", "--config-file", default="sat.cfg", show_default=True,
               help="Configuration file")
 @click.option("-s", "--satellite-server", default=None,
               help="Satellite server name to work on")
-def cli(verbose, config_file, satellite_server=None):
+@click.option("--no-cache", is_flag=True,
+              help="Don't use the on-disk metadata cache.")
+@click.option("--profile", is_flag=True,
+              help="Prints a summary of the API calls at exit.")
+@click.option("--profile-dump", type=click.Path(dir_okay=False, writable=True),
+              help="Also dumps every API call as json lines in this file.")
+@click.option("--plan", is_flag=True,
+              help="Prints the changes that would be applied, without "
+                   "applying them.")
+@click.option("--engine", type=click.Choice(["sync", "async"]), default="sync",
+              show_default=True,
+              help="Engine used by the read-heavy commands (check sync, "
+                   "check repos). async requires aiohttp.")
+def cli(verbose, config_file, satellite_server=None, no_cache=False,
+        profile=False, profile_dump=None, plan=False, engine="sync"):
   global log
   global cfg
   log_level = DEBUG if verbose else INFO
@@ -64,6 +99,13 @@ def cli(verbose, config_file, satellite_server=None):
                                logfile="sat.log")
   cfg = Config(config_file)
   cfg.read_config(satellite_server)
+  if no_cache:
+    cfg.cache.enabled = False
+  if profile or profile_dump:
+    atexit.register(cfg.enable_profiler(profile_dump).report)
+  if plan:
+    atexit.register(cfg.enable_plan().report)
+  cfg.set_engine(engine)
   logzero.setup_default_logger(level=log_level, formatter=formatter)
   # We want to log debug to file, but info to screen, unless -v
   logzero.logfile(f"{cfg.satellite['name']}.log", loglevel=DEBUG)
@@ -78,9 +120,12 @@ def cli(verbose, config_file, satellite_server=None):
 @click.option("-o", "--only", "only_tasks", multiple=True,
               type=click.Choice(install_tasks, case_sensitive=False),
               help="Only execute these tasks")
-def install(skip_tasks=[], only_tasks=[]):
+@click.option("-t", "--tee-output", type=click.Path(dir_okay=False),
+              help="Also appends the raw output of the tasks to this gzipped "
+                   "file")
+def install(skip_tasks=[], only_tasks=[], tee_output=None):
   log.info("Running satellite-installer")
-  load_module("install", "install")(cfg, skip_tasks, only_tasks)
+  load_module("install", "install")(cfg, skip_tasks, only_tasks, tee_output)
 
 
 @cli.group(help="Generates and creates various components")
@@ -99,9 +144,10 @@ def init():
 @make.command(help="Enables the required repository-sets")
 @click.option("-s", "--sync", is_flag=True,
               help="Also sync the products after enabling")
-def repo_sets(sync):
+@jobs_option("Number of reposets/products processed concurrently")
+def repo_sets(sync, jobs):
   log.info("Enabling reposets")
-  load_module("make", "reposets")(cfg, sync)
+  load_module("make", "reposets")(cfg, sync, jobs)
 
 
 @make.command(help="Generates the products and repositories based on the "
@@ -116,22 +162,29 @@ def container_repos(sync, releases):
 
 @make.command(help="Creates the Activation Keys")
 @releases_filters
-def activation_keys(releases):
+@jobs_option("Number of activation keys created concurrently")
+def activation_keys(releases, jobs):
   log.info("Creating Activation Keys")
-  load_module("make", "activationkeys")(cfg, releases)
+  load_module("make", "activationkeys")(cfg, releases, jobs=jobs)
 
 
 @make.command(help="Generates the container-prepare template")
 @releases_filters
 @zreleases_filters
 @click.option("-o", "--output-dir",
-              help="Output directory where to store the files")
+              help="Output directory where to store the files. Only the "
+                   "outdated templates are generated when it has the "
+                   "templates of a previous run [default: new temporary "
+                   "directory]")
 @click.option("-u", "--user", help="Username")
 @click.option("-p", "--password", help="Password")
-def container_prepare(releases, zreleases, output_dir, user, password):
+@click.option("-f", "--force", is_flag=True, default=False,
+              help="Generate all the templates, even the ones up to date. "
+                   "Required when only the user or password changed")
+def container_prepare(releases, zreleases, output_dir, user, password, force):
   log.info("Generating container prepare templates")
   load_module("make", "containerprepare")(cfg, releases, zreleases, output_dir,
-                                          user, password)
+                                          user, password, force)
 
 
 @make.command(name="content-views",
@@ -142,12 +195,16 @@ def container_prepare(releases, zreleases, output_dir, user, password):
               help="Don't create CVs, just create CCVs and promote them")
 @click.option("-f", "--force", is_flag=True, default=False,
               help="Force creation even if there's running tasks")
+@jobs_option("Number of publish/promote running concurrently")
+@click.option("-R", "--republish", is_flag=True, default=False,
+              help="Publish even if the inputs of the CVs didn't change")
 @releases_filters
 @zreleases_filters
-def make_cvs(promote_only, composite_only, releases, zreleases, force):
+def make_cvs(promote_only, composite_only, releases, zreleases, force, jobs,
+             republish):
   log.info("Generating content-views")
   load_module("make", "contentviews")(cfg, promote_only, composite_only, releases,
-                                      zreleases, force)
+                                      zreleases, force, jobs, republish)
 
 
 @cli.group(help="Performs various validations and verification")
@@ -156,9 +213,11 @@ def check():
 
 
 @check.command(help="Returns the sync status for all repos")
-def sync():
+@click.option("-w", "--watch", type=int, metavar="SECONDS",
+              help="Refreshes the report every SECONDS")
+def sync(watch):
   log.info("Checking sync status")
-  load_module("check", "sync")(cfg)
+  load_module("check", "sync")(cfg, watch)
 
 
 @check.command(help="Searches the repository-sets")
@@ -177,8 +236,12 @@ def repos(repo_type, enabled, label):
 @click.option("-d", "--delete", is_flag=True,
               help="Delete content-views")
 @click.option("-m", "--match", help="Match pattern to filter")
-def check_cvs(delete, match):
-  load_module("check", "contentview")(cfg, delete, match)
+@click.option("--format", "output_format", default="table", show_default=True,
+              type=click.Choice(["table", "json", "csv"], case_sensitive=False),
+              help="Output format, json and csv are written as the rows come")
+@jobs_option("Number of CVs whose versions are fetched concurrently")
+def check_cvs(delete, match, output_format, jobs):
+  load_module("check", "contentview")(cfg, delete, match, output_format, jobs)
 
 
 @check.command(help="Task manipulation")
@@ -199,6 +262,39 @@ def task(id, incomplete, bad, reset_pulp):
     load_module("check", "task")(cfg).reset_pulp_task(reset_pulp)
 
 
+@cli.group(help="Deletes components that are no longer needed")
+def prune():
+  pass
+
+
+@prune.command(name="content-views",
+               help="Deletes content-views with their versions and "
+                    "activation-keys")
+@releases_filters
+@zreleases_filters
+@click.option("-m", "--match", help="Match pattern to filter")
+@jobs_option("Number of content-views torn down concurrently")
+@click.option("-f", "--force", is_flag=True, default=False,
+              help="Force deletion even if there's running tasks")
+@click.option("-y", "--yes", is_flag=True, default=False,
+              help="Don't ask for confirmation")
+def prune_cvs(releases, zreleases, match, jobs, force, yes):
+  if not (releases or zreleases or match):
+    raise click.UsageError("Select the content-views with -r, -z or -m")
+  load_module("prune", "contentviews")(cfg, releases, zreleases, match, jobs,
+                                       force, yes)
+
+
+@cli.group(help="Manages the on-disk metadata cache")
+def cache():
+  pass
+
+
+@cache.command(name="clear", help="Removes the cached metadata of the satellite")
+def cache_clear():
+  load_module("cache", "clear")(cfg)
+
+
 if __name__ == "__main__":
   cli()
 # vim: et sts=2 sw=2 ts=2
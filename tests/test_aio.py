@@ -0,0 +1,9 @@
+from forge.aio import http_error
+
+
+def test_errors_carry_their_response():
+  err = http_error(404, b'{"error": "not found"}', "https://sat/api/v2/hosts")
+  assert err.response.status_code == 404
+  assert err.response._content == b'{"error": "not found"}'
+  assert err.response.json() == {"error": "not found"}
+  assert "404 Error" in str(err)
@@ -0,0 +1,91 @@
+import configparser
+import os
+
+import pytest
+
+from forge import cache as cache_module
+from forge.cache import MetadataCache
+
+
+class FakeConfig(object):
+  def __init__(self, **cache):
+    self.config = configparser.ConfigParser()
+    self.config["servers-test"] = {"name": "test"}
+    if cache:
+      self.config["cache"] = cache
+    self.satellite = self.config["servers-test"]
+
+
+class FakeItem(object):
+  def __init__(self, id, attrs):
+    self.id = id
+    self.attrs = attrs
+    self.reads = 0
+
+  def read_json(self):
+    self.reads += 1
+    return self.attrs
+
+  def read(self, attrs=None):
+    if attrs is None:
+      attrs = self.read_json()
+    return attrs
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+  monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+  return MetadataCache(FakeConfig(enabled="true", ttl="60", repository="10"))
+
+
+def test_disabled_by_default(tmp_path, monkeypatch):
+  monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+  cache = MetadataCache(FakeConfig())
+  item = FakeItem(1, {"name": "repo"})
+  cache.read(item)
+  cache.read(item)
+  assert item.reads == 2
+  assert not os.path.exists(cache.path)
+
+
+def test_read_is_served_from_the_cache(cache):
+  item = FakeItem(1, {"name": "repo", "updated_at": "t1"})
+  assert cache.read(item) == {"name": "repo", "updated_at": "t1"}
+  assert cache.read(item) == {"name": "repo", "updated_at": "t1"}
+  assert item.reads == 1
+
+
+def test_ttl_by_entity(cache, monkeypatch):
+  assert cache.get_ttl("Repository") == 10
+  assert cache.get_ttl("Product") == 60
+  cache.store("Repository", 1, {"name": "repo"})
+  stored = cache_module.time()
+  monkeypatch.setattr(cache_module, "time", lambda: stored + 11)
+  assert cache.load("Repository", 1) is None
+  assert cache.load("Product", 1) is None
+
+
+def test_updated_at_invalidates(cache):
+  cache.store("Repository", 1, {"name": "repo", "updated_at": "t1"})
+  assert cache.load("Repository", 1, "t1") == {"name": "repo",
+                                               "updated_at": "t1"}
+  assert cache.load("Repository", 1, "t2") is None
+
+
+def test_store_failures_are_ignored(cache):
+  # A file where the cache folder should be, like a read-only cache
+  os.makedirs(cache.path)
+  open(os.path.join(cache.path, "Repository"), "w").close()
+  cache.store("Repository", 1, {"name": "repo"})
+  assert cache.load("Repository", 1) is None
+
+
+def test_store_failure_removes_the_temp_file(cache):
+  cache.store("Repository", 1, {"name": object()})
+  assert os.listdir(os.path.join(cache.path, "Repository")) == []
+
+
+def test_clear(cache):
+  cache.store("Repository", 1, {"name": "repo"})
+  cache.clear()
+  assert cache.load("Repository", 1) is None
@@ -0,0 +1,38 @@
+import logging
+
+from logzero import logger as log
+
+from forge.logstream import ConsoleRateLimit
+
+
+def output(msg, level=logging.INFO):
+  return log.makeRecord(log.name, level, __file__, 0, msg, None, None,
+                        extra={"command_output": True})
+
+
+def test_lines_over_the_rate_are_filtered():
+  rate_limit = ConsoleRateLimit(rate=3)
+  passed = [rate_limit.filter(output(i)) for i in range(5)]
+  assert passed == [True, True, True, False, False]
+  assert rate_limit.filter(output("error", logging.ERROR))
+  assert rate_limit.filter(log.makeRecord(log.name, logging.INFO, __file__, 0,
+                                          "forge", None, None))
+  assert rate_limit.skipped == 2
+
+
+def test_concurrent_tasks_share_the_filter():
+  rate_limit = ConsoleRateLimit()
+  rate_limit.attach()
+  rate_limit.attach()
+  # logzero's console handler
+  console = list(rate_limit.handlers)
+  assert len(console)
+  for handler in console:
+    assert handler.filters.count(rate_limit) == 1
+  rate_limit.detach()
+  for handler in console:
+    assert rate_limit in handler.filters
+  rate_limit.detach()
+  assert rate_limit.handlers == []
+  for handler in console:
+    assert rate_limit not in handler.filters
@@ -0,0 +1,70 @@
+import pytest
+
+from forge.query import Query
+
+
+def test_values_are_quoted():
+  assert str(Query(interval="daily")) == 'interval = "daily"'
+  assert str(Query(id=3)) == "id = 3"
+  assert str(Query(composite=False)) == "composite = false"
+  assert str(Query(enabled=True)) == "enabled = true"
+
+
+def test_quotes_and_backslashes_are_escaped():
+  assert str(Query(name='RHEL "ESS"')) == r'name = "RHEL \"ESS\""'
+  assert str(Query(name="a\\b")) == r'name = "a\\b"'
+  assert str(Query(name='a\\"')) == r'name = "a\\\""'
+
+
+def test_operators():
+  assert str(Query(name="OSP13", operator="like")) == 'name ~ "OSP13"'
+  assert str(Query(name="OSP13", operator="not")) == 'name != "OSP13"'
+  assert str(Query(id=[1, 2], operator="not")) == "id !^ (1, 2)"
+  with pytest.raises(ValueError):
+    Query(name="OSP13", operator="is")
+
+
+def test_like_lists_match_any_value():
+  assert (str(Query(name=["OSP13", "OSP16"], operator="like"))
+          == '(name ~ "OSP13" or name ~ "OSP16")')
+  assert str(Query(name=["OSP13"], operator="like")) == 'name ~ "OSP13"'
+  with pytest.raises(ValueError):
+    Query(name=[], operator="like")
+
+
+def test_lists():
+  assert str(Query(id=[1, 2, 3])) == "id ^ (1, 2, 3)"
+  assert (str(Query(name=["OSP13", "OSP 16", 'a"b', "a\\b", ""]))
+          == r'name ^ (OSP13, "OSP 16", "a\"b", "a\\b", "")')
+
+
+def test_ranges():
+  assert str(Query(version=(2, 5))) == "(version >= 2 and version <= 5)"
+  assert str(Query(version=(2, None))) == "version >= 2"
+  assert str(Query(version=(None, 5))) == "version <= 5"
+
+
+def test_none():
+  assert str(Query(last_sync=None)) == "null? last_sync"
+  assert str(Query(last_sync=None, operator="not")) == "set? last_sync"
+
+
+def test_keywords_all_match():
+  assert (str(Query(name="OSP13", composite=True))
+          == 'name = "OSP13" and composite = true')
+
+
+def test_combinators():
+  daily = Query(interval="daily")
+  named = Query(name="a", id=1)
+  assert str(daily & named) == 'interval = "daily" and (name = "a" and id = 1)'
+  assert str(daily | named) == 'interval = "daily" or (name = "a" and id = 1)'
+  assert str(~daily) == 'not (interval = "daily")'
+  assert str((daily | Query(id=2)) & ~Query(id=3)) == (
+    '(interval = "daily" or id = 2) and not (id = 3)')
+
+
+def test_empty_query_is_false():
+  assert not Query()
+  assert str(Query()) == ""
+  assert Query(id=1)
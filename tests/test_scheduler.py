@@ -0,0 +1,88 @@
+import configparser
+from threading import Lock
+from time import sleep
+
+from forge.scheduler import Scheduler
+
+
+class FakeWatcher(object):
+  def __init__(self):
+    self.waited = []
+
+  def wait(self, task_id, timeout):
+    self.waited.append((task_id, timeout))
+    return {"id": task_id, "state": "stopped", "result": "success"}
+
+
+class FakeConfig(object):
+  def __init__(self, publish_jobs=2):
+    parser = configparser.ConfigParser()
+    parser["servers-test"] = {"publish_jobs": str(publish_jobs)}
+    self.satellite = parser["servers-test"]
+    self.task_watcher = FakeWatcher()
+
+
+def fail():
+  raise RuntimeError("rejected")
+
+
+def test_dependencies_run_first():
+  order = []
+  scheduler = Scheduler(FakeConfig())
+  scheduler.add("c", lambda: order.append("c"), deps=["a", "b"])
+  scheduler.add("a", lambda: order.append("a"))
+  scheduler.add("b", lambda: order.append("b"), deps=["a"])
+  assert scheduler.run() == []
+  assert order == ["a", "b", "c"]
+
+
+def test_failure_skips_the_dependents():
+  ran = []
+  scheduler = Scheduler(FakeConfig())
+  scheduler.add("a", fail)
+  scheduler.add("b", lambda: ran.append("b"), deps=["a"])
+  scheduler.add("c", lambda: ran.append("c"), deps=["b"])
+  scheduler.add("d", lambda: ran.append("d"))
+  assert sorted(scheduler.run()) == ["a", "b", "c"]
+  assert ran == ["d"]
+
+
+def test_unknown_dependency_is_reported():
+  scheduler = Scheduler(FakeConfig())
+  scheduler.add("a", lambda: None, deps=["missing"])
+  assert scheduler.run() == ["a"]
+
+
+def test_jobs_are_bounded():
+  lock = Lock()
+  running = []
+  peak = []
+
+  def job():
+    with lock:
+      running.append(1)
+      peak.append(len(running))
+    sleep(0.02)
+    with lock:
+      running.pop()
+
+  scheduler = Scheduler(FakeConfig(), jobs=3)
+  for i in range(10):
+    scheduler.add(f"job {i}", job)
+  assert scheduler.run() == []
+  assert max(peak) <= 3
+
+
+def test_jobs_default_to_the_setting():
+  assert Scheduler(FakeConfig(publish_jobs=5)).jobs == 5
+  assert Scheduler(FakeConfig(publish_jobs=0)).jobs == 1
+
+
+def test_returned_tasks_are_waited_for():
+  cfg = FakeConfig()
+  scheduler = Scheduler(cfg)
+  scheduler.add("publish", lambda: {"id": "t1", "state": "planned"},
+                timeout=60)
+  assert scheduler.run() == []
+  assert cfg.task_watcher.waited == [("t1", 60)]
+  assert scheduler.nodes["publish"].result["result"] == "success"
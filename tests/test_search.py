@@ -0,0 +1,99 @@
+import configparser
+from threading import Event
+
+import pytest
+from nailgun.config import ServerConfig
+from requests import Response
+from requests.exceptions import HTTPError
+
+from forge.entities.product import Products
+
+
+class FakeConfig(object):
+  def __init__(self):
+    parser = configparser.ConfigParser()
+    parser["servers-test"] = {"name": "test"}
+    self.satellite = parser["servers-test"]
+    self.server_config = ServerConfig("https://satellite.example.com")
+    self.profiler = None
+    self.plan = None
+
+
+class FakeItem(object):
+  """Stands in for a nailgun entity, serving `total` items per_page at a time
+  """
+  def __init__(self, total, fail_on=None):
+    self.total = total
+    self.fail_on = fail_on
+    self.queries = []
+    self.prefetched = Event()
+
+  def search(self, query):
+    self.queries.append(query)
+    if query["page"] == 2:
+      self.prefetched.set()
+    if query["page"] == self.fail_on:
+      response = Response()
+      response.status_code = 500
+      response._content = b"boom"
+      raise HTTPError(response=response)
+    start = (query["page"] - 1) * query["per_page"]
+    return list(range(start, min(start + query["per_page"], self.total)))
+
+  def pages(self):
+    return [q["page"] for q in self.queries]
+
+
+@pytest.fixture
+def products():
+  return Products(FakeConfig(), None)
+
+
+def test_all_the_pages_are_fetched(products):
+  item = FakeItem(25)
+  assert products.search(item, per_page=10) == list(range(25))
+  assert item.pages() == [1, 2, 3]
+
+
+def test_full_last_page_fetches_an_empty_one(products):
+  item = FakeItem(20)
+  assert products.search(item, per_page=10) == list(range(20))
+  assert item.pages() == [1, 2, 3]
+
+
+def test_pages_are_fetched_on_demand(products):
+  item = FakeItem(100)
+  results = products.search_iter(item, per_page=10)
+  assert [next(results) for i in range(5)] == list(range(5))
+  # The next page is prefetched, but not the one after
+  assert item.prefetched.wait(2)
+  assert item.pages() == [1, 2]
+  results.close()
+
+
+def test_limit(products):
+  item = FakeItem(100)
+  assert products.search(item, per_page=10, limit=25) == list(range(25))
+  assert item.pages() == [1, 2, 3]
+  item = FakeItem(100)
+  assert products.search(item, limit=5) == list(range(5))
+  assert [q["per_page"] for q in item.queries] == [5]
+
+
+def test_query_is_built_from_the_keywords(products):
+  item = FakeItem(0)
+  products.search(item, name="rhel", params={"enabled": True})
+  assert item.queries == [{"enabled": True, "per_page": 1000, "page": 1,
+                           "search": 'name = "rhel"'}]
+
+
+def test_http_error_on_the_first_page_finds_nothing(products):
+  item = FakeItem(100, fail_on=1)
+  assert products.search(item, per_page=10) == []
+
+
+def test_http_error_on_a_later_page_raises(products):
+  item = FakeItem(100, fail_on=2)
+  with pytest.raises(HTTPError):
+    products.search(item, per_page=10)
+  assert item.pages() == [1, 2]
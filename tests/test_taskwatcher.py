@@ -0,0 +1,89 @@
+import configparser
+from threading import Event
+
+import pytest
+from nailgun.entity_mixins import TaskTimedOutError
+
+from forge.taskwatcher import TaskWatcher
+
+
+class FakeConfig(object):
+  def __init__(self):
+    parser = configparser.ConfigParser()
+    parser["servers-test"] = {"task_timeout": "5"}
+    self.satellite = parser["servers-test"]
+    self.server_config = None
+
+
+def task(task_id, state="stopped", result="success"):
+  return {"id": task_id, "state": state, "result": result, "label": "Test",
+          "progress": 1.0 if state == "stopped" else 0.5,
+          "humanized": {"errors": []}}
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+  monkeypatch.setattr(TaskWatcher, "min_interval", 0.01)
+  monkeypatch.setattr(TaskWatcher, "max_interval", 0.05)
+  return TaskWatcher(FakeConfig())
+
+
+def test_wait_returns_the_stopped_task(watcher):
+  watcher._search = lambda ids: [task(i) for i in ids]
+  assert watcher.wait("a", timeout=2)["id"] == "a"
+  assert watcher.timeout == 5
+
+
+def test_timeout_only_forgets_its_own_waiter(watcher):
+  release = Event()
+  watcher._search = lambda ids: [task(i, "stopped" if release.is_set()
+                                      else "running") for i in ids]
+  other = watcher.watch("a")
+  with pytest.raises(TaskTimedOutError):
+    watcher.wait("a", timeout=0.1)
+  release.set()
+  assert other.result(2)["id"] == "a"
+
+
+def test_forget_keeps_the_task_while_a_waiter_is_left(watcher):
+  watcher._search = lambda ids: [task(i, "running") for i in ids]
+  first = watcher.watch("a")
+  watcher.watch("a")
+  watcher.forget("a", first)
+  assert "a" in watcher._futures
+  watcher.forget("a")
+  assert "a" not in watcher._futures
+
+
+def test_missing_task_fails_the_waiters(watcher):
+  watcher._search = lambda ids: []
+  with pytest.raises(LookupError):
+    watcher.wait("a", timeout=2)
+
+
+def test_failed_refreshes_fail_the_waiters(watcher):
+  calls = []
+
+  def search(ids):
+    calls.append(ids)
+    raise ConnectionError("satellite unreachable")
+
+  watcher._search = search
+  future = watcher.watch("a")
+  with pytest.raises(ConnectionError):
+    future.result(5)
+  assert len(calls) == watcher.max_failures
+
+
+def test_unsuccessful_task_raises(watcher):
+  watcher._search = lambda ids: [task(i, result="error") for i in ids]
+  with pytest.raises(Exception, match="did not succeed"):
+    watcher.wait("a", timeout=2)
+  assert watcher.wait("b", timeout=2, must_succeed=False)["result"] == "error"
+
+
+def test_new_task_resets_the_back_off(watcher):
+  watcher._progress["a"] = (0.5, 0)
+  assert watcher._next_interval([task("a", "running")], 1) == 0.05
+  assert watcher._next_interval([task("a", "running"),
+                                 task("b", "running")], 0.05) == 0.01